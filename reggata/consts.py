@@ -15,6 +15,30 @@ USER_CONFIG_FILE = os.path.join(USER_CONFIG_DIR, "reggata.conf")
 LOGGING_CONFIG_FILE = os.path.join(USER_CONFIG_DIR, "logging.conf")
 
 THUMBNAIL_DEFAULT_SIZE = 100
+THUMBNAILS_DIR = "thumbs" # Directory of thumbnail store, relative to METADATA_DIR
+
+# Default storage profile of repository database (see data/storage_profile.py)
+SQLITE_JOURNAL_MODE = "WAL"
+SQLITE_SYNCHRONOUS = "NORMAL"
+SQLITE_MMAP_SIZE = 256*1024*1024
+SQLITE_CACHE_SIZE = -64*1024 # Negative value is a size in KiB, positive is a number of pages
+SQLITE_TEMP_STORE = "MEMORY"
+SQLITE_BUSY_TIMEOUT_SEC = 30
+SQLITE_READ_POOL_SIZE = 4
+SQLITE_CACHED_STATEMENTS = 256 # Prepared statements cached by each connection
+SQLITE_PROGRESS_STEPS = 10000 # Cancellation is checked every N virtual machine instructions
+
+# Read-only commands that run longer than this are interrupted (0 means no limit)
+QUERY_TIMEOUT_SEC = 60
+
+QUERY_CACHE_SIZE = 64 # Number of parsed query texts kept in memory
+QUERY_RESULT_CACHE_BYTES = 32*1024*1024 # Memory budget of cached results of item queries
+
+# Number of items fetched at once by Items Table, when the result is not split into pages
+ITEMS_TABLE_FETCH_SIZE = 200
+
+# Number of items saved in one transaction by SaveNewItemsCommand
+SAVE_NEW_ITEMS_CHUNK_SIZE = 1000
 
 DEFAULT_TMP_DIR = USER_CONFIG_DIR + os.sep + "tmp"
 
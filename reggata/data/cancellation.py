@@ -0,0 +1,76 @@
+'''
+Created on 18.10.2026
+
+Cancellation of running SQL statements. A progress handler is installed on every
+SQLite connection of a repository and SQLite calls it periodically while a statement
+is executed. When the CancelToken of the command, that is executed in the current
+thread, is cancelled or its deadline has passed, the handler aborts the statement
+(see UnitOfWork.executeCommand).
+'''
+import time
+import threading
+import contextlib
+import reggata.consts as consts
+
+
+class CancelToken(object):
+    '''
+        A flag that is set in one thread (e.g. in GUI thread) to stop commands that
+    are executed with this token in another thread. A token with timeoutSec > 0 is
+    cancelled by itself when timeoutSec seconds have passed since its creation. A token
+    with a parent token is cancelled also when the parent is cancelled.
+    '''
+    def __init__(self, timeoutSec=None, parent=None):
+        self._cancelled = False
+        self._deadline = time.monotonic() + timeoutSec \
+            if timeoutSec is not None and timeoutSec > 0 else None
+        self._timeoutSec = timeoutSec
+        self._parent = parent
+
+    def cancel(self):
+        self._cancelled = True
+
+    @property
+    def isCancelled(self):
+        return self._cancelled or self.isTimedOut \
+            or (self._parent is not None and self._parent.isCancelled)
+
+    @property
+    def isTimedOut(self):
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            return True
+        return self._parent is not None and self._parent.isTimedOut
+
+    @property
+    def timeoutSec(self):
+        return self._timeoutSec
+
+
+# Token of the command that is executed in the current thread
+_current = threading.local()
+
+
+def _progressHandler():
+    token = getattr(_current, "token", None)
+    # Nonzero return value interrupts the statement
+    return 1 if token is not None and token.isCancelled else 0
+
+
+def installProgressHandler(dbapiConnection):
+    '''
+        Installs the progress handler on a just opened DBAPI (sqlite3 module) connection.
+    '''
+    dbapiConnection.set_progress_handler(_progressHandler, consts.SQLITE_PROGRESS_STEPS)
+
+
+@contextlib.contextmanager
+def activated(token):
+    '''
+        Makes token the current token of this thread within the with block.
+    '''
+    previous = getattr(_current, "token", None)
+    _current.token = token
+    try:
+        yield token
+    finally:
+        _current.token = previous
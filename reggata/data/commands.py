@@ -2,30 +2,59 @@
 Created on 23.07.2012
 @author: vlkv
 '''
-from sqlalchemy.orm import contains_eager, joinedload_all
-from sqlalchemy.orm.exc import NoResultFound
+import sqlalchemy as sqa
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.exc import ResourceClosedError
 import shutil
 import datetime
 import logging
 import os.path
+import time
 import reggata.errors as err
 import reggata.helpers as hlp
 import reggata.consts as consts
 import reggata.data.db_schema as db
 from reggata.user_config import UserConfig
 from reggata.data import operations
-from reggata.helpers import to_db_format
+from reggata.data import db_migrations
+from reggata.data.thumbnail_store import ThumbnailStore
+from reggata.data.result_cache import QueryResultCache
+from reggata.data.item_rows import ItemRow, DataRefRow, ThumbnailRow
+from reggata.parsers import query_parser, query_tree_nodes
 
 
 logger = logging.getLogger(__name__)
 
+# Item queries bind all the values as parameters, so queries of the same shape have
+# the same SQL. Statements are cached by SQL, and their compiled forms are cached by
+# statement, so such queries are not compiled again by SQLAlchemy (and SQLite reuses
+# its prepared statements, see consts.SQLITE_CACHED_STATEMENTS)
+_statements = sqa.util.LRUCache(consts.SQLITE_CACHED_STATEMENTS)
+_compiledStatements = sqa.util.LRUCache(consts.SQLITE_CACHED_STATEMENTS)
+
 
 class AbstractCommand:
+    # Commands that only read from the database set it to True. Such commands are
+    # interrupted, when they run longer than the query timeout (see
+    # UnitOfWork.executeCommand)
+    readOnly = False
+
     def _execute(self, unitOfWork):
         raise NotImplementedError("Override this function in a subclass")
 
 
+def _queryItemsWithTagsAndFields(session):
+    '''
+        Returns a query of db.Item objects with their data_refs, tags and fields loaded.
+    Tags and fields are loaded with separate "item_id IN (...)" queries, so an item with
+    N tags and M fields is not fetched as N*M joined rows.
+    '''
+    return session.query(db.Item)\
+        .options(joinedload('data_ref'))\
+        .options(selectinload('item_tags').joinedload('tag'))\
+        .options(selectinload('item_fields').joinedload('field'))
+
+
 class GetExpungedItemCommand(AbstractCommand):
     '''
         Returns expunged (detached) object of Item class from database with given id.
@@ -34,12 +63,8 @@ class GetExpungedItemCommand(AbstractCommand):
         self.__itemId = itemId
 
     def _execute(self, uow):
-        self._session = uow.session
-        item = self._session.query(db.Item)\
-            .options(joinedload_all('data_ref'))\
-            .options(joinedload_all('item_tags.tag'))\
-            .options(joinedload_all('item_fields.field'))\
-            .get(self.__itemId)
+        self._session = uow.readSession
+        item = _queryItemsWithTagsAndFields(self._session).get(self.__itemId)
 
         if item is None:
             raise err.NotFoundError()
@@ -48,6 +73,35 @@ class GetExpungedItemCommand(AbstractCommand):
         return item
 
 
+class GetExpungedItemsCommand(AbstractCommand):
+    '''
+        Returns a list of expunged (detached) objects of Item class with given ids,
+    in the order of the given ids. Raises NotFoundError if some of the items do
+    not exist.
+    '''
+    def __init__(self, itemIds):
+        self.__itemIds = [int(itemId) for itemId in itemIds]
+
+    def _execute(self, uow):
+        self._session = uow.readSession
+        itemsById = dict()
+        for i in range(0, len(self.__itemIds), AbstractItemRowsCommand.ID_BATCH_SIZE):
+            batch = self.__itemIds[i:i + AbstractItemRowsCommand.ID_BATCH_SIZE]
+            for item in _queryItemsWithTagsAndFields(self._session)\
+                    .filter(db.Item.id.in_(batch)):
+                itemsById[item.id] = item
+
+        items = []
+        for itemId in self.__itemIds:
+            item = itemsById.get(itemId)
+            if item is None:
+                raise err.NotFoundError()
+            items.append(item)
+        for item in itemsById.values():
+            self._session.expunge(item)
+        return items
+
+
 # TODO: Write a test for this command
 class DeleteHangingTagsCommand(AbstractCommand):
     '''
@@ -63,10 +117,13 @@ class DeleteHangingTagsCommand(AbstractCommand):
         '''
         hangingTags = self._session.query(db.Tag).from_statement(sql).all()
         count = len(hangingTags)
+        hangingTagIds = [tag.id for tag in hangingTags]
+        operations.TagStatsOperations.removeTags(self._session, hangingTagIds)
         for tag in hangingTags:
             self._session.delete(tag)
         if count > 0:
             self._session.commit()
+            uow.tagNames.remove(hangingTagIds)
         return count
 
 
@@ -85,15 +142,31 @@ class DeleteHangingFieldsCommand(AbstractCommand):
         '''
         hangingFields = self._session.query(db.Field).from_statement(sql).all()
         count = len(hangingFields)
+        hangingFieldIds = [field.id for field in hangingFields]
         for field in hangingFields:
             self._session.delete(field)
         if count > 0:
             self._session.commit()
+            uow.fieldNames.remove(hangingFieldIds)
         return count
 
 
-class SaveThumbnailCommand(AbstractCommand):
+class RebuildFullTextIndexCommand(AbstractCommand):
+    '''
+        Refills full-text indexes of item titles and field values from items and
+    items_fields tables. Use it if the indexes are out of sync with the tables.
+    '''
+    def _execute(self, uow):
+        self._session = uow.session
+        db_migrations.rebuildFullTextIndex(self._session.connection())
+        self._session.commit()
+
 
+class SaveThumbnailCommand(AbstractCommand):
+    '''
+        Writes thumbnail.data to the thumbnail store and saves thumbnail metadata
+    to database.
+    '''
     def __init__(self, data_ref_id, thumbnail):
         self.__dataRefId = data_ref_id
         self.__thumbnail = thumbnail
@@ -104,49 +177,230 @@ class SaveThumbnailCommand(AbstractCommand):
         data_ref = self._session.query(db.DataRef).get(self.__dataRefId)
         self._session.refresh(data_ref) #TODO: Research if we can remove this refresh
 
+        ThumbnailStore(uow._repo_base_path).write(data_ref.hash, self.__thumbnail.size,
+                                                  self.__thumbnail.data)
+
+        data = self.__thumbnail.data
         self.__thumbnail.data_ref_id = data_ref.id
         data_ref.thumbnails.append(self.__thumbnail)
 
         self._session.add(self.__thumbnail)
+        # Results of item queries do not contain thumbnails
+        QueryResultCache.keepResults(self._session)
         self._session.commit()
 
         self._session.refresh(self.__thumbnail)
         self._session.expunge(self.__thumbnail)
         self._session.expunge(data_ref)
+        self.__thumbnail.data = data
 
 
-# TODO: Write a test for this command
-class GetUntaggedItems(AbstractCommand):
+class AbstractItemRowsCommand(AbstractCommand):
     '''
-        Gets from database all alive elements without tags.
+        Base class for read-only commands that return lists of item_rows.ItemRow
+    objects. Rows are fetched with plain SQL, ORM objects are not created.
     '''
-    def __init__(self, limit=0, page=1, order_by=""):
-        self.__limit = limit
-        self.__page = page
-        self.__orderBy = order_by
+    readOnly = True
 
-    def _execute(self, uow):
-        self._session = uow.session
-        return self.__getUntaggedItems(self.__limit, self.__page, self.__orderBy)
+    # Max number of item ids in one "IN (...)" list (SQLite has a limit of
+    # expression tree depth)
+    ID_BATCH_SIZE = 500
+
+    ITEM_COLUMNS = '''sub.id, sub.title, sub.user_login, sub.date_created, sub.alive,
+        sub.data_ref_id, sub.data_refs_id, sub.data_refs_url, sub.data_refs_type,
+        sub.data_refs_hash, sub.data_refs_date_hashed, sub.data_refs_size,
+        sub.data_refs_date_created, sub.data_refs_user_login'''
+    ITEM_COLUMNS_COUNT = 14
 
-    def __getUntaggedItems(self, limit, page, order_by):
+    # Prefix of order_by column names, that order items by a numeric value of a field,
+    # e.g. "field:Rating"
+    FIELD_ORDER_PREFIX = "field:"
+
+    # Items without a numeric value of the field are ordered as if the value was
+    # the lowest possible number (NULLs cannot be compared in keyset predicates)
+    NO_FIELD_VALUE = -1.0e308
+
+    # Sort key of the last row of the last fetched page, pass it as the "after"
+    # argument of the next command to get the next page. It is None when the
+    # page is empty or the query is not ordered
+    nextPageAfter = None
+
+    @staticmethod
+    def _fieldOrderExpr(paramName, itemsAlias):
+        '''
+            Returns an SQL expression for ordering items by numeric value of a field.
+        Name of the field is bound as :paramName parameter (see _orderParams()).
+        '''
+        return '''ifnull((select max(itf.field_value_num) from items_fields itf
+            join fields f on f.id = itf.field_id
+            where itf.item_id = {0}.id and f.name = :{1}), {2})'''.format(
+            itemsAlias, paramName, AbstractItemRowsCommand.NO_FIELD_VALUE)
+
+    @staticmethod
+    def _orderParams(orderBy):
+        '''
+            Returns parameters of the sort key expressions of _sortKeys(orderBy).
+        '''
+        params = dict()
+        for k, (col, _direction) in enumerate(orderBy):
+            if col == "id":
+                break
+            if col.startswith(AbstractItemRowsCommand.FIELD_ORDER_PREFIX):
+                params["order_field_{}".format(k)] = \
+                    col[len(AbstractItemRowsCommand.FIELD_ORDER_PREFIX):]
+        return params
+
+    @staticmethod
+    def _sortKeys(orderBy):
+        '''
+            Returns a list of (sqlExpression, direction) pairs of the sort keys of items
+        ordered by orderBy. Expressions refer to the items as "s0". Item id is always
+        the last key, so the order is total and can be used for keyset pagination.
+        '''
+        keys = []
+        for col, direction in orderBy:
+            direction = direction.upper()
+            if direction not in ("ASC", "DESC"):
+                raise ValueError("Unknown order direction {}.".format(direction))
+            if col == "id":
+                break
+            if col.startswith(AbstractItemRowsCommand.FIELD_ORDER_PREFIX):
+                keys.append((AbstractItemRowsCommand._fieldOrderExpr(
+                    "order_field_{}".format(len(keys)), "s0"), direction))
+            else:
+                keys.append(("s0." + col, direction))
+        idDirection = orderBy[len(keys)][1].upper() if len(keys) < len(orderBy) else \
+            (keys[0][1] if len(keys) > 0 else "ASC")
+        keys.append(("s0.id", idDirection))
+        return keys
+
+    @staticmethod
+    def sortRows(itemRows, orderBy):
+        '''
+            Returns a list of itemRows sorted in memory in the same order, as the item
+        commands with order_by=orderBy return them (see _sortKeys()). It is used to
+        re-sort already fetched items without querying the database again.
+        '''
+        def fieldValue(fieldName):
+            noValue = AbstractItemRowsCommand.NO_FIELD_VALUE
+            def value(itemRow):
+                numbers = [hlp.parseNumber(value) for name, value, _userLogin in itemRow.fields
+                           if name == fieldName]
+                return max([number for number in numbers if number is not None] or [noValue])
+            return value
+
+        def columnValue(col):
+            def value(itemRow):
+                columnValue = getattr(itemRow, col)
+                # NULLs go before any other value, as in SQLite
+                return (columnValue is not None, columnValue)
+            return value
+
+        keys = []
+        for col, direction in orderBy:
+            direction = direction.upper()
+            if direction not in ("ASC", "DESC"):
+                raise ValueError("Unknown order direction {}.".format(direction))
+            if col == "id":
+                break
+            if col.startswith(AbstractItemRowsCommand.FIELD_ORDER_PREFIX):
+                keys.append((fieldValue(col[len(AbstractItemRowsCommand.FIELD_ORDER_PREFIX):]),
+                             direction))
+            elif col in ItemRow.__slots__:
+                keys.append((columnValue(col), direction))
+            else:
+                raise ValueError("Items cannot be sorted by {} in memory.".format(col))
+        idDirection = orderBy[len(keys)][1].upper() if len(keys) < len(orderBy) else \
+            (keys[0][1] if len(keys) > 0 else "ASC")
+        keys.append((lambda itemRow: itemRow.id, idDirection))
+
+        # Values of each key are computed once, then the row indices are sorted by the
+        # least significant key first (sort is stable)
+        rowIndices = list(range(len(itemRows)))
+        for value, direction in reversed(keys):
+            values = [value(itemRow) for itemRow in itemRows]
+            rowIndices.sort(key=values.__getitem__, reverse=(direction == "DESC"))
+        return [itemRows[i] for i in rowIndices]
+
+    @staticmethod
+    def _keysetPredicate(keys):
+        '''
+            Returns an SQL predicate that selects rows following the row with sort key
+        values :after_0, :after_1, ... in the order given by keys.
+        '''
+        ops = [">" if direction == "ASC" else "<" for _expr, direction in keys]
+        if len(set(ops)) == 1:
+            return "({}) {} ({})".format(
+                ", ".join(expr for expr, _direction in keys), ops[0],
+                ", ".join(":after_{}".format(k) for k in range(len(keys))))
+        terms = []
+        for k in range(len(keys)):
+            equalities = ["{} = :after_{}".format(keys[j][0], j) for j in range(k)]
+            terms.append("(" + " AND ".join(equalities + [
+                "{} {} :after_{}".format(keys[k][0], ops[k], k)]) + ")")
+        return "(" + " OR ".join(terms) + ")"
+
+    @staticmethod
+    def _itemsSql(subSql, orderBy, limitOffset, whereAlive=True, after=None):
+        '''
+            Wraps subSql (it must select i.* and DataRef._sql_from() columns) into a query
+        that returns AbstractItemRowsCommand.ITEM_COLUMNS followed by the sort key values.
+        Items are ordered and filtered before LIMIT is applied. If after is given, only
+        items that follow it are returned (values of after are bound as :after_N
+        parameters, see _afterParams()).
+        '''
+        keys = AbstractItemRowsCommand._sortKeys(orderBy) \
+            if (orderBy or limitOffset or after is not None) else []
+
+        conditions = []
+        if whereAlive:
+            conditions.append("s0.alive")
+        if after is not None:
+            if len(after) != len(keys):
+                raise ValueError("Value of after does not match the order of items.")
+            conditions.append(AbstractItemRowsCommand._keysetPredicate(keys))
+
+        keyColumns = "".join(", {} as sort_key_{}".format(expr, k)
+                             for k, (expr, _direction) in enumerate(keys))
         order_by_1 = ""
         order_by_2 = ""
-        for col, direction in order_by:
-            if order_by_1:
-                order_by_1 += ", "
-            if order_by_2:
-                order_by_2 += ", "
-            order_by_2 += col + " " + direction + " "
-            if col == "title":
-                order_by_1 += col + " " + direction + " "
-        if order_by_1:
-            order_by_1 = " ORDER BY " + order_by_1
-        if order_by_2:
-            order_by_2 = " ORDER BY " + order_by_2
-
-        thumbnail_default_size = UserConfig().get("thumbnail_size", consts.THUMBNAIL_DEFAULT_SIZE)
+        if keys:
+            order_by_1 = " ORDER BY " + ", ".join(
+                "sort_key_{} {}".format(k, direction) for k, (_expr, direction) in enumerate(keys))
+            order_by_2 = " ORDER BY " + ", ".join(
+                "sub.sort_key_{} {}".format(k, direction) for k, (_expr, direction) in enumerate(keys))
+
+        sql = '''
+        select ''' + AbstractItemRowsCommand.ITEM_COLUMNS + "".join(
+            ", sub.sort_key_{}".format(k) for k in range(len(keys))) + '''
+        from (select s0.*''' + keyColumns + '''
+              from (''' + subSql + ''') as s0
+              ''' + ("where " + " AND ".join(conditions) if conditions else "") + '''
+              ''' + order_by_1 + " " + limitOffset + ''') as sub
+        ''' + order_by_2
+        return sql
 
+    @staticmethod
+    def _countSql(subSql, whereAlive=True):
+        '''
+            Wraps subSql (the same as in _itemsSql()) into a query that returns
+        number of items.
+        '''
+        return "select count(distinct s0.id) from (" + subSql + ") as s0" + \
+            (" where s0.alive" if whereAlive else "")
+
+    @staticmethod
+    def _afterParams(after):
+        if after is None:
+            return {}
+        return dict(("after_{}".format(k), value) for k, value in enumerate(after))
+
+    @staticmethod
+    def _limitOffset(limit, page):
+        '''
+            Returns LIMIT clause with :page_limit and :page_offset parameters (or
+        an empty string, if limit is 0). See _limitOffsetParams().
+        '''
         if page < 1:
             raise ValueError("Page number cannot be negative or zero.")
 
@@ -155,137 +409,388 @@ class GetUntaggedItems(AbstractCommand):
 
         limit_offset = ""
         if limit > 0:
-            offset = (page-1)*limit
-            limit_offset += "LIMIT {0} OFFSET {1}".format(limit, offset)
+            limit_offset += "LIMIT :page_limit OFFSET :page_offset"
+        return limit_offset
 
-        sql = '''
-        select sub.*, ''' + \
-        db.Item_Tag._sql_from() + ", " + \
-        db.Tag._sql_from() + ", " + \
-        db.Item_Field._sql_from() + ", " + \
-        db.Field._sql_from() + \
+    @staticmethod
+    def _limitOffsetParams(limit, page):
+        if limit > 0:
+            return {"page_limit": limit, "page_offset": (page - 1)*limit}
+        return {}
+
+    def _cachedItemRows(self, uow, key, fetchItemRows):
         '''
-        from (select i.*, ''' + \
-            db.DataRef._sql_from() + ", " + \
-            db.Thumbnail._sql_from() + \
-            '''
+            Returns a list of ItemRow objects from the query result cache of uow, or
+        calls fetchItemRows() and puts its result to the cache. Callers get copies of
+        cached rows, so they are free to modify them.
+            Thumbnails are not cached, because saving of a thumbnail doesn't drop cached
+        results (see QueryResultCache.keepResults()). They are fetched every time.
+        '''
+        cache = uow.queryResults
+        if cache is None:
+            return fetchItemRows()
+        generation = cache.generation
+        cached = cache.get(key)
+        if cached is not None:
+            itemRows, self.nextPageAfter = cached
+            itemRows = [itemRow.copy() for itemRow in itemRows]
+            self._fetchThumbnails(self._session, itemRows)
+            return itemRows
+
+        itemRows = fetchItemRows()
+        cache.put(key, (tuple(self.__copyWithoutThumbnails(itemRow) for itemRow in itemRows),
+                        self.nextPageAfter),
+                  sum(itemRow.approxSize() for itemRow in itemRows), generation)
+        return itemRows
+
+    @staticmethod
+    def __copyWithoutThumbnails(itemRow):
+        itemRow = itemRow.copy()
+        if itemRow.data_ref is not None:
+            itemRow.data_ref.thumbnails = []
+        return itemRow
+
+    @staticmethod
+    def _cachedCount(uow, key, count):
+        cache = uow.queryResults
+        if cache is None:
+            return count()
+        generation = cache.generation
+        result = cache.get(key)
+        if result is None:
+            result = count()
+            cache.put(key, result, 64, generation)
+        return result
+
+    @staticmethod
+    def _tagResolver(uow, session):
+        '''
+            Returns a function that resolves tag names of a query to their ids and item
+        counts (see query_tree_nodes.QueryExpression.interpret()).
+        '''
+        return lambda tagNames: operations.TagStatsOperations.tagIdsAndCounts(
+            session, uow.tagNames, tagNames)
+
+    @staticmethod
+    def _executeSql(session, sql, params=None):
+        '''
+            Executes sql with given parameters through the statement cache.
+        '''
+        statement = _statements.get(sql)
+        if statement is None:
+            statement = sqa.text(sql)
+            _statements[sql] = statement
+        conn = session.connection().execution_options(compiled_cache=_compiledStatements)
+        return conn.execute(statement, params or {})
+
+    def _fetchItemRows(self, session, sql, params=None):
+        '''
+            Executes sql, which returns ITEM_COLUMNS (and optionally the sort key values),
+        and returns a list of ItemRow objects in the order of the sql result. Tags and
+        fields of the items are fetched with separate queries. Sort key of the last row
+        is saved to self.nextPageAfter.
+        '''
+        return self._itemRowsFrom(session, self._executeSql(session, sql, params))
+
+    def _itemRowsFrom(self, session, rows, withThumbnails=True):
+        '''
+            Returns a list of ItemRow objects, made of rows of an _itemsSql() query.
+        If withThumbnails is False, thumbnails of the items are not fetched.
+        '''
+        itemRows = []
+        itemRowsById = dict()
+        self.nextPageAfter = None
+        for row in rows:
+            itemId = row[0]
+            if itemId in itemRowsById:
+                continue
+            itemRow = ItemRow(itemId, row[1], row[2], row[3], row[4], row[5])
+            if row[6] is not None:
+                itemRow.data_ref = DataRefRow(row[6], row[7], row[8], row[9], row[10],
+                                              row[11], row[12], row[13])
+            itemRows.append(itemRow)
+            itemRowsById[itemId] = itemRow
+            if len(row) > AbstractItemRowsCommand.ITEM_COLUMNS_COUNT:
+                self.nextPageAfter = tuple(row[AbstractItemRowsCommand.ITEM_COLUMNS_COUNT:])
+
+        self._fetchTagsAndFields(session, itemRowsById)
+        if withThumbnails:
+            self._fetchThumbnails(session, itemRows)
+        return itemRows
+
+    def _fetchTagsAndFields(self, session, itemRowsById):
+        tags = dict()
+        fields = dict()
+        itemIds = list(itemRowsById.keys())
+        for i in range(0, len(itemIds), AbstractItemRowsCommand.ID_BATCH_SIZE):
+            idsStr = hlp.to_commalist(itemIds[i:i + AbstractItemRowsCommand.ID_BATCH_SIZE], str)
+
+            sql = '''
+            select it.item_id, t.name, it.user_login
+            from items_tags it join tags t on t.id = it.tag_id
+            where it.item_id in (''' + idsStr + ''')
+            order by it.item_id, it.tag_id'''
+            for itemId, name, userLogin in session.execute(sql):
+                tags.setdefault(itemId, []).append((name, userLogin))
+
+            sql = '''
+            select itf.item_id, f.name, itf.field_value, itf.user_login
+            from items_fields itf join fields f on f.id = itf.field_id
+            where itf.item_id in (''' + idsStr + ''')
+            order by itf.item_id, itf.field_id'''
+            for itemId, name, value, userLogin in session.execute(sql):
+                fields.setdefault(itemId, []).append((name, value, userLogin))
+
+        for itemId, itemRow in itemRowsById.items():
+            itemRow.tags = tuple(tags.get(itemId, ()))
+            itemRow.fields = tuple(fields.get(itemId, ()))
+
+    def _fetchThumbnails(self, session, itemRows):
+        '''
+            Adds ThumbnailRow of the configured thumbnail size to data refs that have
+        one. Only metadata is fetched, data of thumbnails is read from the thumbnail
+        store when a row is displayed.
+        '''
+        thumbnailSize = int(UserConfig().get("thumbnail_size", consts.THUMBNAIL_DEFAULT_SIZE))
+        dataRefsById = dict((itemRow.data_ref.id, itemRow.data_ref) for itemRow in itemRows
+                            if itemRow.data_ref is not None)
+        dataRefIds = list(dataRefsById.keys())
+        for i in range(0, len(dataRefIds), AbstractItemRowsCommand.ID_BATCH_SIZE):
+            sql = '''
+            select data_ref_id, size from thumbnails
+            where size = :thumbnail_size and data_ref_id in (''' + \
+                hlp.to_commalist(dataRefIds[i:i + AbstractItemRowsCommand.ID_BATCH_SIZE], str) + ")"
+            for dataRefId, size in session.execute(sql, {"thumbnail_size": thumbnailSize}):
+                dataRefsById[dataRefId].thumbnails.append(ThumbnailRow(dataRefId, size))
+
+
+# TODO: Write a test for this command
+class GetUntaggedItems(AbstractItemRowsCommand):
+    '''
+        Gets from database all alive elements without tags. Returns a list of
+    item_rows.ItemRow objects. Pages can be requested by number (page) or by the sort
+    key of the last item of the previous page (after, see nextPageAfter), the latter
+    costs the same for any page.
+    '''
+    def __init__(self, limit=0, page=1, order_by=[], after=None):
+        self.__limit = limit
+        self.__page = page
+        self.__orderBy = order_by
+        self.__after = after
+
+    def _execute(self, uow):
+        self._session = uow.readSession
+        key = ("GetUntaggedItems", tuple(tuple(o) for o in self.__orderBy),
+               self.__limit, self.__page, self.__after)
+        return self._cachedItemRows(uow, key, lambda: self.__getUntaggedItems(
+            self.__limit, self.__page, self.__orderBy, self.__after))
+
+    def __getUntaggedItems(self, limit, page, order_by, after):
+        sub_sql = GetUntaggedItems._untaggedItemsSql()
+        if after is not None:
+            page = 1
+        sql = self._itemsSql(sub_sql, order_by, self._limitOffset(limit, page),
+                             whereAlive=False, after=after)
+        params = self._afterParams(after)
+        params.update(self._limitOffsetParams(limit, page))
+        params.update(self._orderParams(order_by))
+        return self._fetchItemRows(self._session, sql, params)
+
+    @staticmethod
+    def _untaggedItemsSql():
+        return '''
+            select i.*, ''' + db.DataRef._sql_from() + '''
             from items i
             left join items_tags it on i.id = it.item_id
             left join data_refs on i.data_ref_id = data_refs.id
-            left join thumbnails on data_refs.id = thumbnails.data_ref_id and thumbnails.size = ''' + \
-                str(thumbnail_default_size) + '''
             where
                 it.item_id is null
                 AND i.alive
-            ''' + order_by_1 + " " + limit_offset + '''
-        ) as sub
-        left join items_tags on sub.id = items_tags.item_id
-        left join tags on tags.id = items_tags.tag_id
-        left join items_fields on sub.id = items_fields.item_id
-        left join fields on fields.id = items_fields.field_id
-        ''' + order_by_2
-
-        items = []
-        try:
-            items = self._session.query(db.Item)\
-            .options(contains_eager("data_ref"), \
-                     contains_eager("data_ref.thumbnails"), \
-                     contains_eager("item_tags"), \
-                     contains_eager("item_tags.tag"), \
-                     contains_eager("item_fields"),\
-                     contains_eager("item_fields.field"))\
-            .from_statement(sql).all()
-            for item in items:
-                self._session.expunge(item)
-
-        except ResourceClosedError:
-            pass
-
-        return items
+            '''
 
 
 
-class QueryItemsByParseTree(AbstractCommand):
+class QueryItemsByParseTree(AbstractItemRowsCommand):
     '''
         Searches for items, according to given syntax parse tree (of query language).
+    Returns a list of item_rows.ItemRow objects. Pages can be requested by number (page)
+    or by the sort key of the last item of the previous page (after, see nextPageAfter).
     '''
-    def __init__(self, query_tree, limit=0, page=1, order_by=[]):
+    def __init__(self, query_tree, limit=0, page=1, order_by=[], after=None):
         self.__queryTree = query_tree
         self.__limit = limit
         self.__page = page
         self.__orderBy = order_by
+        self.__after = after
 
     def _execute(self, uow):
-        self._session = uow.session
-        return self.__queryItemsByParseTree(self.__queryTree, self.__limit, self.__page,
-                                            self.__orderBy)
+        self._session = uow.readSession
+        self._useFullTextIndex = uow.hasFullTextIndex
+        self._resolveTags = self._tagResolver(uow, self._session)
+        key = ("QueryItemsByParseTree", self.__queryTree, self._useFullTextIndex,
+               tuple(tuple(o) for o in self.__orderBy), self.__limit, self.__page, self.__after)
+        return self._cachedItemRows(uow, key, lambda: self.__queryItemsByParseTree(
+            self.__queryTree, self.__limit, self.__page, self.__orderBy, self.__after))
+
+    def __queryItemsByParseTree(self, query_tree, limit, page, order_by, after):
+        sub_sql, params = query_tree.interpret(self._useFullTextIndex, self._resolveTags)
+        if after is not None:
+            page = 1
+        sql = self._itemsSql(sub_sql, order_by, self._limitOffset(limit, page), after=after)
+        params.update(self._afterParams(after))
+        params.update(self._limitOffsetParams(limit, page))
+        params.update(self._orderParams(order_by))
+        return self._fetchItemRows(self._session, sql, params)
+
+
+
+class CountUntaggedItems(AbstractItemRowsCommand):
+    '''
+        Returns number of alive items without tags. Items are not fetched.
+    '''
+    def _execute(self, uow):
+        self._session = uow.readSession
+        sql = self._countSql(GetUntaggedItems._untaggedItemsSql(), whereAlive=False)
+        return self._cachedCount(uow, ("CountUntaggedItems",),
+                                 lambda: self._executeSql(self._session, sql).scalar())
 
-    def __queryItemsByParseTree(self, query_tree, limit, page, order_by):
-        order_by_1 = ""
-        order_by_2 = ""
-        for col, direction in order_by:
-            if order_by_1:
-                order_by_1 += ", "
-            if order_by_2:
-                order_by_2 += ", "
-            order_by_2 += col + " " + direction + " "
-            if col == "title":
-                order_by_1 += col + " " + direction + " "
-        if order_by_1:
-            order_by_1 = " ORDER BY " + order_by_1
-        if order_by_2:
-            order_by_2 = " ORDER BY " + order_by_2
-
-
-        sub_sql = query_tree.interpret()
 
-        if page < 1:
-            raise ValueError("Page number cannot be negative or zero.")
+class CountItemsByParseTree(AbstractItemRowsCommand):
+    '''
+        Returns number of alive items that match given syntax parse tree (of query
+    language). Items are not fetched.
+    '''
+    def __init__(self, query_tree):
+        self.__queryTree = query_tree
 
-        if limit < 0:
-            raise ValueError("Limit cannot be negative number.")
+    def _execute(self, uow):
+        self._session = uow.readSession
+        return self._cachedCount(uow, ("CountItemsByParseTree", self.__queryTree,
+                                       uow.hasFullTextIndex), lambda: self.__count(uow))
 
-        limit_offset = ""
-        if limit > 0:
-            offset = (page-1)*limit
-            limit_offset += "LIMIT {0} OFFSET {1}".format(limit, offset)
+    def __count(self, uow):
+        sub_sql, params = self.__queryTree.interpret(uow.hasFullTextIndex,
+                                                     self._tagResolver(uow, self._session))
+        return self._executeSql(self._session, self._countSql(sub_sql), params).scalar()
 
-        sql = '''
-        select sub.*,
-        ''' + db.Item_Tag._sql_from() + ''',
-        ''' + db.Tag._sql_from() + ''',
-        ''' + db.Thumbnail._sql_from() + ''',
-        ''' + db.Item_Field._sql_from() + ''',
-        ''' + db.Field._sql_from() + '''
-        from (''' + sub_sql + " " + order_by_1 + " " + limit_offset +  ''') as sub
-        left join items_tags on sub.id = items_tags.item_id
-        left join tags on tags.id = items_tags.tag_id
-        left join items_fields on sub.id = items_fields.item_id
-        left join fields on fields.id = items_fields.field_id
-        left join thumbnails on thumbnails.data_ref_id = sub.data_refs_id and
-                  thumbnails.size = ''' + str(UserConfig().get("thumbnail_size",
-                                                               consts.THUMBNAIL_DEFAULT_SIZE)) + '''
-        where sub.alive
-        ''' + order_by_2
 
-        items = []
-        try:
-            items = self._session.query(db.Item)\
-            .options(contains_eager("data_ref"), \
-                     contains_eager("data_ref.thumbnails"), \
-                     contains_eager("item_tags"), \
-                     contains_eager("item_tags.tag"), \
-                     contains_eager("item_fields"),\
-                     contains_eager("item_fields.field"))\
-            .from_statement(sql).all()
+class QueryProfile(object):
+    '''
+        Result of ProfileQueryCommand: what a query text is turned into and where the
+    time is spent. Times are in seconds.
+    '''
+    def __init__(self, queryText):
+        self.queryText = queryText
+        self.parseTree = ""
+        self.sql = ""
+        self.params = dict()
+        self.queryPlan = [] # Lines of EXPLAIN QUERY PLAN output
+        self.itemCount = 0
+        self.parseTime = 0.0
+        self.interpretTime = 0.0
+        self.executeTime = 0.0
+        self.hydrateTime = 0.0
+        self.thumbnailTime = 0.0
+
+    def summary(self):
+        return ("{} items. Parse: {:.1f} ms, SQL generation: {:.1f} ms, SQL execution: "
+                "{:.1f} ms, item rows (tags, fields): {:.1f} ms, thumbnails: {:.1f} ms").format(
+                self.itemCount, 1000*self.parseTime, 1000*self.interpretTime,
+                1000*self.executeTime, 1000*self.hydrateTime, 1000*self.thumbnailTime)
+
+    def format(self):
+        return os.linesep.join(["Query: " + self.queryText, self.summary(), "",
+                                "Parse tree:", self.parseTree, "",
+                                "SQL:", self.sql.strip(), "",
+                                "Parameters: " + str(self.params), "",
+                                "Query plan:"] + self.queryPlan)
+
+
+class ProfileQueryCommand(AbstractItemRowsCommand):
+    '''
+        Executes a query of the query language the same way as QueryItemsByParseTree
+    (or GetUntaggedItems, if queryText is empty) and returns a QueryProfile object.
+    Caches of parsed queries and of query results are not used.
+    '''
+    def __init__(self, queryText, limit=0, page=1, order_by=[]):
+        self.__queryText = queryText
+        self.__limit = limit
+        self.__page = page
+        self.__orderBy = order_by
 
-            for item in items:
-                self._session.expunge(item)
+    def _execute(self, uow):
+        self._session = uow.readSession
+        profile = QueryProfile(self.__queryText)
 
-        except ResourceClosedError:
-            pass
+        start = time.perf_counter()
+        queryTree = query_parser.parse(self.__queryText, useCache=False)
+        profile.parseTime = time.perf_counter() - start
 
-        return items
+        start = time.perf_counter()
+        if queryTree is None:
+            profile.parseTree = "(untagged items)"
+            subSql, params = GetUntaggedItems._untaggedItemsSql(), dict()
+        else:
+            profile.parseTree = query_tree_nodes.formatTree(queryTree)
+            subSql, params = queryTree.interpret(uow.hasFullTextIndex,
+                                                 self._tagResolver(uow, self._session),
+                                                 useCache=False)
+        limitOffset = self._limitOffset(self.__limit, self.__page)
+        params.update(self._limitOffsetParams(self.__limit, self.__page))
+        params.update(self._orderParams(self.__orderBy))
+        whereAlive = queryTree is not None
+        profile.sql = self._itemsSql(subSql, self.__orderBy, limitOffset, whereAlive)
+        profile.params = params
+        profile.interpretTime = time.perf_counter() - start
+
+        profile.queryPlan = self.__queryPlan(profile.sql, params)
+
+        start = time.perf_counter()
+        rows = self._executeSql(self._session, profile.sql, params).fetchall()
+        profile.executeTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        itemRows = self._itemRowsFrom(self._session, rows, withThumbnails=False)
+        profile.itemCount = len(itemRows)
+        profile.hydrateTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self._fetchThumbnails(self._session, itemRows)
+        profile.thumbnailTime = time.perf_counter() - start
+        return profile
+
+    def __queryPlan(self, sql, params):
+        lines = []
+        depths = dict()
+        for nodeId, parentId, _notUsed, detail in self._executeSql(
+                self._session, "EXPLAIN QUERY PLAN " + sql, params):
+            depths[nodeId] = depths.get(parentId, -1) + 1
+            lines.append("    " * depths[nodeId] + detail)
+        return lines
+
+
+class GetItemRowsCommand(AbstractItemRowsCommand):
+    '''
+        Returns a list of item_rows.ItemRow objects of alive items with given ids,
+    in the order of the given ids. Nonexistent ids are skipped.
+    '''
+    def __init__(self, itemIds):
+        self.__itemIds = [int(itemId) for itemId in itemIds]
+
+    def _execute(self, uow):
+        self._session = uow.readSession
+        itemRowsById = dict()
+        for i in range(0, len(self.__itemIds), AbstractItemRowsCommand.ID_BATCH_SIZE):
+            sub_sql = '''
+                select i.*, ''' + db.DataRef._sql_from() + '''
+                from items i
+                left join data_refs on i.data_ref_id = data_refs.id
+                where i.id in (''' + hlp.to_commalist(
+                    self.__itemIds[i:i + AbstractItemRowsCommand.ID_BATCH_SIZE], str) + ''')
+                '''
+            for itemRow in self._fetchItemRows(self._session, self._itemsSql(sub_sql, [], "")):
+                itemRowsById[itemRow.id] = itemRow
+        return [itemRowsById[itemId] for itemId in self.__itemIds if itemId in itemRowsById]
 
 
 class FileInfo(object):
@@ -311,6 +816,8 @@ class FileInfo(object):
         self.tags = []
         self.fields = []
         self.itemIds = []
+        # For directories: number of alive items with files inside
+        self.itemCount = None
 
     @property
     def fileBaseName(self):
@@ -324,36 +831,37 @@ class FileInfo(object):
 
 
 # TODO: Write a test for this command
-class GetFileInfoCommand(AbstractCommand):
+class GetFileInfoCommand(AbstractItemRowsCommand):
     def __init__(self, relPath):
         self.__relPath = relPath
 
     def _execute(self, uow):
-        self._session = uow.session
+        self._session = uow.readSession
         return self.__getFileInfo(self.__relPath)
 
     def __getFileInfo(self, path):
-        try:
-            data_ref = self._session.query(db.DataRef)\
-                .filter(db.DataRef.url_raw==hlp.to_db_format(path))\
-                .options(joinedload_all("items"))\
-                .options(joinedload_all("items.item_tags.tag"))\
-                .options(joinedload_all("items.item_fields.field"))\
-                .one()
-            self._session.expunge(data_ref)
-            finfo = FileInfo(data_ref.url, objType=FileInfo.FILE, status=FileInfo.STORED)
-
-            for item in data_ref.items:
-                finfo.itemIds.append(item.id)
-                for item_tag in item.item_tags:
-                    finfo.tags.append(item_tag.tag.name)
-                for item_field in item.item_fields:
-                    finfo.fields.append((item_field.field.name, item_field.field_value))
-            return finfo
-
-        except NoResultFound:
+        row = self._session.execute(
+            sqa.text("select id, url, type from data_refs where url = :url"),
+            {"url": hlp.to_db_format(path)}).first()
+        if row is None:
             return FileInfo(self.__relPath, status=FileInfo.UNTRACKED)
 
+        dataRef = DataRefRow(row[0], row[1], row[2], None, None, None, None, None)
+        finfo = FileInfo(dataRef.url, objType=FileInfo.FILE, status=FileInfo.STORED)
+
+        sub_sql = '''
+            select i.*, ''' + db.DataRef._sql_from() + '''
+            from items i
+            join data_refs on i.data_ref_id = data_refs.id
+            where i.data_ref_id = ''' + str(int(dataRef.id))
+        for itemRow in self._fetchItemRows(self._session,
+                                           self._itemsSql(sub_sql, [], "", whereAlive=False)):
+            finfo.itemIds.append(itemRow.id)
+            for name, _userLogin in itemRow.tags:
+                finfo.tags.append(name)
+            for name, value, _userLogin in itemRow.fields:
+                finfo.fields.append((name, value))
+        return finfo
 
 
 
@@ -369,7 +877,7 @@ class LoginUserCommand(AbstractCommand):
         self.__password = password
 
     def _execute(self, uow):
-        self._session = uow.session
+        self._session = uow.readSession
         return self.__loginUser(self.__login, self.__password)
 
     def __loginUser(self, login, password):
@@ -419,21 +927,14 @@ class SaveNewUserCommand(AbstractCommand):
 
 # TODO: Write a test for this command
 class GetNamesOfAllTagsAndFields(AbstractCommand):
+    '''
+        Returns a sorted list of distinct names of all tags and fields. Names are
+    taken from the name caches of the repository (see NameCache).
+    '''
     def _execute(self, uow):
-        self._session = uow.session
-        return self.__getNamesOfAllTagsAndFields()
-
-    def __getNamesOfAllTagsAndFields(self):
-        sql = '''
-        select distinct name from tags
-        UNION
-        select distinct name from fields
-        ORDER BY name
-        '''
-        try:
-            return self._session.query("name").from_statement(sql).all()
-        except ResourceClosedError:
-            return []
+        names = set(uow.tagNames.names())
+        names.update(uow.fieldNames.names())
+        return sorted(names)
 
 
 # TODO: Write a test for this command
@@ -442,15 +943,51 @@ class GetItemIdsWithFilesFrom(AbstractCommand):
         self._dirRelPath = dirRelPath
 
     def _execute(self, uow):
-        items = []
+        itemIds = []
         try:
-            items = uow._session.query(db.Item) \
-                .join(db.Item.data_ref) \
-                .filter(db.DataRef.url_raw.like(hlp.to_db_format(self._dirRelPath) + "/%")) \
-                .all()
+            dirRelPath = operations.DirectoryOperations.normDirRelPath(self._dirRelPath)
+            rows = uow.readSession.execute(sqa.text('''
+                select i.id from items i join data_refs d on d.id = i.data_ref_id
+                where d.dir_id in (select id from directories where ''' +
+                operations.DirectoryOperations.subtreeSql(dirRelPath) + ''')'''),
+                operations.DirectoryOperations.subtreeParams(dirRelPath))
+            itemIds = [row[0] for row in rows]
         finally:
             uow.close()
-        return [item.id for item in items]
+        return itemIds
+
+
+class GetDirectoryItemCountsCommand(AbstractCommand):
+    '''
+        Returns a dict {subdirName: itemCount} with numbers of alive items, which files
+    are inside subdirectories (at any depth) of the directory dirRelPath. Subdirectories
+    without such items are not in the dict.
+    '''
+    readOnly = True
+
+    def __init__(self, dirRelPath):
+        self._dirRelPath = dirRelPath
+
+    def _execute(self, uow):
+        dirRelPath = operations.DirectoryOperations.normDirRelPath(self._dirRelPath)
+        rows = uow.readSession.execute(sqa.text('''
+            select dirs.rel_path, count(*)
+            from directories dirs
+            join data_refs d on d.dir_id = dirs.id
+            join items i on i.data_ref_id = d.id
+            where i.alive and ''' + operations.DirectoryOperations.subtreeSql(
+                dirRelPath, "dirs.rel_path") + '''
+            group by dirs.id'''),
+            operations.DirectoryOperations.subtreeParams(dirRelPath))
+
+        prefixLen = len(dirRelPath) + 1 if dirRelPath != "" else 0
+        result = dict()
+        for (subdirRelPath, itemCount) in rows:
+            if subdirRelPath == dirRelPath:
+                continue
+            subdirName = subdirRelPath[prefixLen:].split("/")[0]
+            result[subdirName] = result.get(subdirName, 0) + itemCount
+        return result
 
 
 # TODO: Write a test for this command
@@ -462,6 +999,8 @@ class GetRelatedTagsCommand(AbstractCommand):
         Limit affects only if tag_names is empty. In other cases limit is ignored.
     If limit == 0 it means there is no limit.
     '''
+    readOnly = True
+
     #TODO This command should return list of tags, related to arbitrary list of selected items.
     def __init__(self, tag_names=[], user_logins=[], limit=0):
         self.__tag_names = tag_names
@@ -469,37 +1008,35 @@ class GetRelatedTagsCommand(AbstractCommand):
         self.__limit = limit
 
     def _execute(self, uow):
-        self._session = uow.session
+        self._session = uow.readSession
+        self._tagNames = uow.tagNames
         return self.__getRelatedTags(self.__tag_names, self.__user_logins, self.__limit)
 
     def __getRelatedTags(self, tag_names, user_logins, limit):
         #TODO user_logins is not used yet..
         if len(tag_names) == 0:
-            #TODO The more items in the repository, the slower this query is performed.
-            #I think, I should store in database some statistics information, such as number of items
-            #tagged with each tag. With this information, the query can be rewritten and became much faster.
+            # Numbers of items are taken from tag_stats table (see db.TagStat), so we
+            # do not have to aggregate the whole items_tags table here
             if limit > 0:
                 sql = '''
                 select name, c
                 from
-                (select t.name as name, count(*) as c
-                   from items i, tags t
-                   join items_tags it on it.tag_id = t.id and it.item_id = i.id and i.alive
+                (select t.name as name, ts.item_count as c
+                   from tag_stats ts
+                   join tags t on t.id = ts.tag_id
                 where
-                    1
-                group by t.name
-                ORDER BY c DESC LIMIT ''' + str(limit) + ''') as sub
+                    ts.item_count > 0
+                ORDER BY ts.item_count DESC LIMIT ''' + str(limit) + ''') as sub
                 ORDER BY name
                 '''
             else:
                 sql = '''
                 --get_related_tags() query
-                select t.name as name, count(*) as c
-                   from items i, tags t
-                   join items_tags it on it.tag_id = t.id and it.item_id = i.id and i.alive
+                select t.name as name, ts.item_count as c
+                   from tag_stats ts
+                   join tags t on t.id = ts.tag_id
                 where
-                    1
-                group by t.name
+                    ts.item_count > 0
                 ORDER BY t.name
                 '''
             # ResourceClosedError could be raised when there are no related tags
@@ -510,18 +1047,8 @@ class GetRelatedTagsCommand(AbstractCommand):
                 return []
 
         else:
-            # First we get a list of item ids
-            sql = '''--get_related_tags(): getting list of id for all selected tags
-            select * from tags t
-            where t.name in (''' + hlp.to_commalist(tag_names, lambda x: "'" + x + "'") + ''')
-            order by t.id'''
-            try:
-                tags = self._session.query(db.Tag).from_statement(sql).all()
-            except ResourceClosedError:
-                tags = []
-            tag_ids = []
-            for tag in tags:
-                tag_ids.append(tag.id)
+            # First we get a sorted list of ids of all selected tags
+            tag_ids = sorted(self._tagNames.idsOf(self._session, tag_names).values())
 
             if len(tag_ids) == 0:
                 #TODO Maybe raise an exception?
@@ -608,6 +1135,8 @@ class DeleteItemCommand(AbstractCommand):
 
         data_ref = item.data_ref
 
+        if item.alive:
+            operations.TagStatsOperations.removeItem(self._session, item)
         item.data_ref = None
         item.data_ref_id = None
         item.alive = False
@@ -679,6 +1208,8 @@ class SaveNewItemCommand(AbstractCommand):
     def _execute(self, uow):
         self._session = uow.session
         self._repoBasePath = uow._repo_base_path
+        self._tagNames = uow.tagNames
+        self._fieldNames = uow.fieldNames
         return self.__saveNewItem(self.__item, self.__srcAbsPath, self.__dstRelPath)
 
     def __saveNewItem(self, item, srcAbsPath=None, dstRelPath=None):
@@ -706,12 +1237,13 @@ class SaveNewItemCommand(AbstractCommand):
         self._session.flush()
 
         tagNamesToAdd = map(lambda itag: itag.tag.name, item_tags_copy)
-        operations.ItemOperations.addTags(self._session, item, tagNamesToAdd, user_login)
+        operations.ItemOperations.addTags(self._session, item, tagNamesToAdd, user_login,
+                                          self._tagNames)
 
         nameValuePairsToAdd = map(lambda ifield: (ifield.field.name, ifield.field_value),
                                   item_fields_copy)
         operations.ItemOperations.addOrUpdateFields(self._session, item, nameValuePairsToAdd,
-                                                    user_login)
+                                                    user_login, self._fieldNames)
 
         isDataRefRequired = not hlp.is_none_or_empty(srcAbsPath)
         if isDataRefRequired:
@@ -728,6 +1260,235 @@ class SaveNewItemCommand(AbstractCommand):
 
 
 
+class SaveNewItemsCommand(AbstractCommand):
+    '''
+        Saves in database a group of new items. Meaning of item.user_login,
+    item.data_ref.srcAbsPath and item.data_ref.dstRelPath is the same as in
+    SaveNewItemCommand.
+        Names of tags and fields of all the items are resolved at once, rows are
+    inserted and committed in chunks of chunkSize items. Files are copied into the
+    repository after rows of their items are inserted, and are removed again if the
+    chunk is rolled back. If a chunk fails, its items are saved one by one, so an item
+    that cannot be saved is reported and the rest of the items are saved anyway.
+        Returns a tuple (savedItemIds, failures), where failures is a list of
+    (item, exception) pairs.
+        progressCallback(processedCount, totalCount) is called after every item.
+    '''
+    NAMES_BATCH_SIZE = 500
+
+    def __init__(self, items, chunkSize=None, progressCallback=None):
+        self.__items = items
+        self.__chunkSize = chunkSize
+        self.__progressCallback = progressCallback
+
+    def _execute(self, uow):
+        self._session = uow.session
+        self._repoBasePath = uow._repo_base_path
+
+        chunkSize = self.__chunkSize
+        if chunkSize is None:
+            chunkSize = int(UserConfig().get("save_new_items.chunk_size",
+                                             consts.SAVE_NEW_ITEMS_CHUNK_SIZE))
+        if chunkSize < 1:
+            raise ValueError("Chunk size should be a positive number.")
+
+        savedItemIds = []
+        failures = []
+        items = self.__checkUserLogins(self.__items, failures)
+
+        tagIds = uow.tagNames.getOrCreateIds(self._session,
+            set(itag.tag.name for item in items for itag in item.item_tags))
+        fieldIds = uow.fieldNames.getOrCreateIds(self._session,
+            set(ifield.field.name for item in items for ifield in item.item_fields))
+        self._session.commit()
+
+        self.__reportedCount = 0
+        processedCount = len(self.__items) - len(items)
+        self.__reportProgress(processedCount)
+        for i in range(0, len(items), chunkSize):
+            chunk = items[i:i + chunkSize]
+            chunkFailures = []
+            chunkItemIds, ex = self.__trySaveChunk(chunk, tagIds, fieldIds, chunkFailures,
+                                                   processedCount)
+            if ex is not None:
+                logger.error("Failed to save a chunk of {} items: {}".format(len(chunk), ex))
+                # Items are saved one by one, to find the ones that break the chunk
+                chunkItemIds = []
+                chunkFailures = []
+                for k, item in enumerate(chunk):
+                    itemIds, ex = self.__trySaveChunk([item], tagIds, fieldIds, chunkFailures,
+                                                      processedCount + k)
+                    if ex is not None:
+                        chunkFailures.append((item, ex))
+                    chunkItemIds.extend(itemIds)
+            savedItemIds.extend(chunkItemIds)
+            failures.extend(chunkFailures)
+            processedCount += len(chunk)
+            self.__reportProgress(processedCount)
+
+        return (savedItemIds, failures)
+
+    def __reportProgress(self, processedCount):
+        # Items of a failed chunk are processed twice, progress should not go back
+        if self.__progressCallback is not None and processedCount > self.__reportedCount:
+            self.__reportedCount = processedCount
+            self.__progressCallback(processedCount, len(self.__items))
+
+    def __trySaveChunk(self, chunk, tagIds, fieldIds, failures, processedCount):
+        '''
+            Saves and commits the chunk. Returns a tuple (itemIds, None) on success, or
+        ([], exception) if the chunk is rolled back. Files copied into the repository
+        for the chunk are removed on rollback.
+        '''
+        copiedFiles = []
+        try:
+            itemIds = self.__saveChunk(chunk, tagIds, fieldIds, failures, copiedFiles,
+                                       processedCount)
+            self._session.commit()
+            return (itemIds, None)
+        except Exception as ex:
+            self._session.rollback()
+            for path in copiedFiles:
+                try:
+                    os.remove(path)
+                except OSError:
+                    logger.error("Could not remove file {}: {}".format(path, ex))
+            return ([], ex)
+
+    def __checkUserLogins(self, items, failures):
+        logins = list(set(item.user_login for item in items
+                          if not hlp.is_none_or_empty(item.user_login)))
+        existingLogins = set()
+        for i in range(0, len(logins), SaveNewItemsCommand.NAMES_BATCH_SIZE):
+            batch = logins[i:i + SaveNewItemsCommand.NAMES_BATCH_SIZE]
+            existingLogins.update(user.login for user in
+                self._session.query(db.User).filter(db.User.login.in_(batch)))
+
+        result = []
+        for item in items:
+            if hlp.is_none_or_empty(item.user_login):
+                failures.append((item, err.AccessError(
+                    "Argument user_login shouldn't be null or empty.")))
+            elif item.user_login not in existingLogins:
+                failures.append((item, err.AccessError(
+                    "User with login {} doesn't exist.".format(item.user_login))))
+            else:
+                result.append(item)
+        return result
+
+    def __prepareFiles(self, chunk, failures):
+        '''
+            Checks files of the items and computes their hashes. Returns a list of
+        (item, dataRefRow, srcAbsPath, dstAbsPath) of items that can be saved, dataRefRow
+        is a dict of column values or None.
+        '''
+        prepared = []
+        for item in chunk:
+            srcAbsPath = item.data_ref.srcAbsPath if item.data_ref is not None else None
+            dstRelPath = item.data_ref.dstRelPath if item.data_ref is not None else None
+            if hlp.is_none_or_empty(srcAbsPath):
+                prepared.append((item, None, None, None))
+                continue
+            try:
+                srcAbsPath, dstRelPath, dstAbsPath = operations.ItemOperations.checkUntrackedFile(
+                    self._repoBasePath, srcAbsPath, dstRelPath)
+                prepared.append((item, srcAbsPath, dstRelPath, dstAbsPath))
+            except ValueError as ex:
+                failures.append((item, ex))
+
+        urls = [hlp.to_db_format(p[2]) for p in prepared if p[1] is not None]
+        existingUrls = set()
+        table = db.DataRef.__table__
+        for i in range(0, len(urls), SaveNewItemsCommand.NAMES_BATCH_SIZE):
+            batch = urls[i:i + SaveNewItemsCommand.NAMES_BATCH_SIZE]
+            existingUrls.update(row[0] for row in self._session.execute(
+                sqa.select([table.c.url]).where(table.c.url.in_(batch))))
+
+        result = []
+        dirIdsCache = dict()
+        for (item, srcAbsPath, dstRelPath, dstAbsPath) in prepared:
+            if srcAbsPath is None:
+                result.append((item, None, None, None))
+                continue
+            url = hlp.to_db_format(dstRelPath)
+            if url in existingUrls:
+                failures.append((item, err.DataRefAlreadyExistsError(
+                    "DataRef instance with url='{}' is already in database. ".format(dstRelPath))))
+                continue
+            try:
+                dataRefRow = {"url": url,
+                              "type": db.DataRef.FILE,
+                              "hash": hlp.computeFileHash(srcAbsPath),
+                              "date_hashed": datetime.datetime.today(),
+                              "size": os.path.getsize(srcAbsPath),
+                              "date_created": datetime.datetime.today(),
+                              "user_login": item.user_login,
+                              "dir_id": operations.DirectoryOperations.getOrCreateDirId(
+                                  self._session,
+                                  operations.DirectoryOperations.dirRelPathOf(url),
+                                  dirIdsCache)}
+            except (IOError, OSError) as ex:
+                failures.append((item, ex))
+                continue
+            existingUrls.add(url)
+            result.append((item, dataRefRow, srcAbsPath, dstAbsPath))
+        return result
+
+    def __saveChunk(self, chunk, tagIds, fieldIds, failures, copiedFiles, processedCount):
+        prepared = self.__prepareFiles(chunk, failures)
+
+        # Ids of data_refs and items rows are assigned by SQLite
+        conn = self._session.connection().execution_options(compiled_cache=_compiledStatements)
+        insertDataRef = db.DataRef.__table__.insert()
+        insertItem = db.Item.__table__.insert()
+
+        itemIds = []
+        itemTagRows = []
+        itemFieldRows = []
+        tagCountDeltas = dict()
+        for (item, dataRefRow, srcAbsPath, dstAbsPath) in prepared:
+            dataRefId = None
+            if dataRefRow is not None:
+                dataRefId = conn.execute(insertDataRef, dataRefRow).inserted_primary_key[0]
+            itemId = conn.execute(insertItem, {
+                "title": item.title,
+                "user_login": item.user_login,
+                "date_created": item.date_created or datetime.datetime.today(),
+                "data_ref_id": dataRefId,
+                "alive": True}).inserted_primary_key[0]
+            itemIds.append(itemId)
+
+            for tagName in set(itag.tag.name for itag in item.item_tags):
+                tagId = tagIds[tagName]
+                itemTagRows.append({"item_id": itemId, "tag_id": tagId,
+                                    "user_login": item.user_login})
+                tagCountDeltas[tagId] = tagCountDeltas.get(tagId, 0) + 1
+
+            # If a field is given several times, the last value wins (as in addOrUpdateFields)
+            fieldValues = dict((ifield.field.name, ifield.field_value) for ifield in item.item_fields)
+            for fieldName, fieldValue in fieldValues.items():
+                itemFieldRows.append({"item_id": itemId, "field_id": fieldIds[fieldName],
+                                      "user_login": item.user_login,
+                                      "field_value": fieldValue,
+                                      "field_value_num": hlp.parseNumber(fieldValue)})
+
+            if dataRefRow is not None and srcAbsPath != dstAbsPath:
+                operations.ItemOperations.copyFileToRepo(srcAbsPath, dstAbsPath)
+                copiedFiles.append(dstAbsPath)
+            self.__reportProgress(processedCount + len(itemIds))
+
+        if len(itemTagRows) > 0:
+            self._session.execute(db.Item_Tag.__table__.insert(), itemTagRows)
+        if len(itemFieldRows) > 0:
+            self._session.execute(db.Item_Field.__table__.insert(), itemFieldRows)
+        for tagId, delta in tagCountDeltas.items():
+            operations.TagStatsOperations.changeItemCount(self._session, tagId, delta)
+
+        return itemIds
+
+
+
+
 # TODO: We should deny any user to change tags/fields/files of items, owned by another user.
 class UpdateExistingItemCommand(AbstractCommand):
 
@@ -754,6 +1515,8 @@ class UpdateExistingItemCommand(AbstractCommand):
     def _execute(self, uow):
         self._session = uow.session
         self._repoBasePath = uow._repo_base_path
+        self._tagNames = uow.tagNames
+        self._fieldNames = uow.fieldNames
         self.__updateExistingItem(self.__item, self.__newSrcAbsPath, self.__newDstRelPath, self.__userLogin)
 
     def __updateExistingItem(self, item, newSrcAbsPath, newDstRelPath, userLogin):
@@ -853,24 +1616,27 @@ class UpdateExistingItemCommand(AbstractCommand):
     def __updateTags(self, item, persistentItem, userLogin):
         newTagNames = set(map(lambda itag: itag.tag.name,
                               [itag for itag in item.item_tags]))
-        oldTagNames = set(map(lambda itag: itag.tag.name,
-                              [itag for itag in persistentItem.item_tags]))
+        oldTagNames = set(self._tagNames.nameOf(self._session, itag.tag_id)
+                          for itag in persistentItem.item_tags)
 
         tagNamesToRemove = oldTagNames - newTagNames
-        operations.ItemOperations.removeTags(self._session, persistentItem, tagNamesToRemove)
+        operations.ItemOperations.removeTags(self._session, persistentItem, tagNamesToRemove,
+                                             self._tagNames)
 
         tagNamesToAdd = newTagNames - oldTagNames
-        operations.ItemOperations.addTags(self._session, persistentItem, tagNamesToAdd, userLogin)
+        operations.ItemOperations.addTags(self._session, persistentItem, tagNamesToAdd, userLogin,
+                                          self._tagNames)
 
 
     def __updateFields(self, item, persistentItem, user_login):
         newFieldNames = set(map(lambda ifield: ifield.field.name,
                                 [ifield for ifield in item.item_fields]))
-        oldFieldNames = set(map(lambda ifield: ifield.field.name,
-                                [ifield for ifield in persistentItem.item_fields]))
+        oldFieldNames = set(self._fieldNames.nameOf(self._session, ifield.field_id)
+                            for ifield in persistentItem.item_fields)
 
         fieldNamesToRemove = oldFieldNames - newFieldNames
-        operations.ItemOperations.removeFields(self._session, persistentItem, fieldNamesToRemove)
+        operations.ItemOperations.removeFields(self._session, persistentItem, fieldNamesToRemove,
+                                               self._fieldNames)
 
         fieldNamesToStay = newFieldNames - fieldNamesToRemove
         itemFieldsToStay = [ifield for ifield in item.item_fields
@@ -878,7 +1644,8 @@ class UpdateExistingItemCommand(AbstractCommand):
         nameValuePairsToAdd = map(lambda ifield: (ifield.field.name, ifield.field_value),
                                   itemFieldsToStay)
         operations.ItemOperations.addOrUpdateFields(self._session, persistentItem,
-                                                    nameValuePairsToAdd, user_login)
+                                                    nameValuePairsToAdd, user_login,
+                                                    self._fieldNames)
 
 
 
@@ -902,6 +1669,8 @@ class DeleteFileCommand(AbstractCommand):
             db.DataRef.url_raw==hlp.to_db_format(fileRelPath)).first()
         if dataRef is not None:
             for item in dataRef.items:
+                if item.alive:
+                    operations.TagStatsOperations.removeItem(session, item)
                 session.delete(item)
             session.delete(dataRef)
 
@@ -993,12 +1762,9 @@ class RenameDirectoryCommand(AbstractCommand):
                 "Directory '{}' already exists, please choose a different name."
                 .format(self._newDirName))
 
-        affectedDataRefs = session.query(db.DataRef).filter(
-            db.DataRef.url_raw.like(to_db_format(dirRelPath) + "/%"))
-        for dataRef in affectedDataRefs:
-            oldAbsFilePath = os.path.join(repoBasePath, dataRef.url)
-            suffix = os.path.relpath(oldAbsFilePath, self._dirAbsPath)
-            dataRef.url = os.path.join(newDirRelPath, suffix)
+        operations.DirectoryOperations.renameDirectory(
+            session, operations.DirectoryOperations.normDirRelPath(dirRelPath),
+            operations.DirectoryOperations.normDirRelPath(newDirRelPath))
 
         shutil.move(self._dirAbsPath, os.path.join(self._dirAbsPath, "..", self._newDirName))
 
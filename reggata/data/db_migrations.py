@@ -0,0 +1,478 @@
+'''
+Created on 18.10.2026
+
+Schema migrations of Reggata repository database. Every migration upgrades
+the database schema from version (N - 1) to version N. Applied migrations are
+recorded in the schema_version table, so existing .reggata/database.sqlite3 files
+are upgraded in place when a repository is opened.
+
+NOTE: Migrations must not depend on the current state of the db_schema module,
+because they are applied to databases created by any previous version of Reggata.
+That is why they are written in plain SQL. Every migration should be safe to run
+on a database that was just created with Base.metadata.create_all().
+'''
+import os
+import re
+import hashlib
+import tempfile
+import posixpath
+import logging
+import sqlalchemy as sqa
+import reggata.helpers as helpers
+from reggata.errors import CannotOpenRepoError
+
+
+logger = logging.getLogger(__name__)
+
+
+class AbstractMigration(object):
+    '''
+        Base class for all schema migrations.
+    '''
+    version = None
+    description = None
+
+    # If True, database file is compacted with VACUUM after the migration is committed
+    vacuum = False
+
+    def upgrade(self, conn):
+        raise NotImplementedError("Override this function in a subclass")
+
+
+def _tableColumns(conn, tableName):
+    '''
+        Returns a dict {column_name: declared_type} of the given table.
+    '''
+    rows = conn.execute("PRAGMA table_info({})".format(tableName)).fetchall()
+    return dict((row[1], row[2].upper()) for row in rows)
+
+
+class AddSecondaryIndexesMigration(AbstractMigration):
+    '''
+        Fixes affinity of items_fields.field_id column (it was VARCHAR, but it
+    references integer fields.id) and adds indexes for all joins and filters used
+    by query language and commands.
+    '''
+    version = 1
+    description = "Secondary indexes, INTEGER affinity of items_fields.field_id"
+
+    def upgrade(self, conn):
+        if _tableColumns(conn, "items_fields").get("field_id") != "INTEGER":
+            self.__rebuildItemsFields(conn)
+
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_items_tags_tag_id_item_id
+            ON items_tags (tag_id, item_id)''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_items_fields_field_id_value
+            ON items_fields (field_id, field_value, item_id)''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_items_data_ref_id
+            ON items (data_ref_id)''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_items_alive_title
+            ON items (alive, title)''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_items_user_login
+            ON items (user_login)''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_data_refs_hash
+            ON data_refs (hash)''')
+        conn.execute("ANALYZE")
+
+    def __rebuildItemsFields(self, conn):
+        # SQLite cannot change a column type, so the table is recreated
+        conn.execute("DROP TABLE IF EXISTS items_fields_new")
+        conn.execute('''CREATE TABLE items_fields_new (
+            item_id INTEGER NOT NULL,
+            field_id INTEGER NOT NULL,
+            user_login VARCHAR NOT NULL,
+            field_value VARCHAR NOT NULL,
+            PRIMARY KEY (item_id, field_id, user_login),
+            FOREIGN KEY(user_login) REFERENCES users (login),
+            FOREIGN KEY(field_id) REFERENCES fields (id),
+            FOREIGN KEY(item_id) REFERENCES items (id)
+        )''')
+        conn.execute('''INSERT INTO items_fields_new (item_id, field_id, user_login, field_value)
+            SELECT item_id, CAST(field_id AS INTEGER), user_login, field_value
+            FROM items_fields''')
+        conn.execute("DROP TABLE items_fields")
+        conn.execute("ALTER TABLE items_fields_new RENAME TO items_fields")
+
+
+class AddTagStatsMigration(AbstractMigration):
+    '''
+        Adds tag_stats table with number of alive items per tag and fills it
+    from items_tags.
+    '''
+    version = 2
+    description = "Tag usage statistics table tag_stats"
+
+    def upgrade(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS tag_stats (
+            tag_id INTEGER NOT NULL,
+            item_count INTEGER NOT NULL,
+            PRIMARY KEY (tag_id),
+            FOREIGN KEY(tag_id) REFERENCES tags (id)
+        )''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_tag_stats_item_count
+            ON tag_stats (item_count)''')
+        conn.execute("DELETE FROM tag_stats")
+        conn.execute('''INSERT INTO tag_stats (tag_id, item_count)
+            SELECT it.tag_id, count(*)
+            FROM items_tags it JOIN items i ON i.id = it.item_id AND i.alive
+            GROUP BY it.tag_id''')
+
+
+class MoveThumbnailsToStoreMigration(AbstractMigration):
+    '''
+        Moves thumbnail images from thumbnails.data BLOB column to the thumbnail
+    store (.reggata/thumbs directory), thumbnails table keeps only metadata.
+    Thumbnails of DataRefs without hash are dropped, they will be rebuilt.
+    '''
+    version = 3
+    description = "Thumbnail images are moved to the thumbnail store"
+    vacuum = True
+
+    # Layout of the thumbnail store at the time of this migration. It is copied from
+    # data/thumbnail_store.py on purpose, the migration must keep writing files
+    # where version 3 of the schema expects them
+    THUMBS_DIR = os.path.join(".reggata", "thumbs")
+    SHA1_HEX = re.compile("^[0-9a-f]{40}$")
+
+    @staticmethod
+    def _thumbnailPath(repoBasePath, dataRefHash, size):
+        if MoveThumbnailsToStoreMigration.SHA1_HEX.match(dataRefHash):
+            key = dataRefHash
+        else:
+            key = hashlib.sha1(dataRefHash.encode("utf-8")).hexdigest()
+        return os.path.join(repoBasePath, MoveThumbnailsToStoreMigration.THUMBS_DIR,
+                            key[0:2], "{}_{}.jpg".format(key, int(size)))
+
+    @staticmethod
+    def _writeThumbnail(path, data):
+        dirPath = os.path.dirname(path)
+        if not os.path.exists(dirPath):
+            os.makedirs(dirPath)
+        fd, tmpPath = tempfile.mkstemp(dir=dirPath, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmpPath, path)
+        except:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+
+    def upgrade(self, conn):
+        if "data" not in _tableColumns(conn, "thumbnails"):
+            return
+
+        dbFilePath = conn.engine.url.database
+        repoBasePath = os.path.dirname(os.path.dirname(os.path.abspath(dbFilePath)))
+
+        rows = conn.execute('''SELECT t.size, t.data, d.hash
+            FROM thumbnails t JOIN data_refs d ON d.id = t.data_ref_id
+            WHERE t.data IS NOT NULL AND d.hash IS NOT NULL''')
+        for (size, data, dataRefHash) in rows:
+            self._writeThumbnail(self._thumbnailPath(repoBasePath, dataRefHash, size), bytes(data))
+
+        conn.execute("DROP TABLE IF EXISTS thumbnails_new")
+        conn.execute('''CREATE TABLE thumbnails_new (
+            data_ref_id INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            date_created DATETIME,
+            PRIMARY KEY (data_ref_id, size),
+            FOREIGN KEY(data_ref_id) REFERENCES data_refs (id)
+        )''')
+        conn.execute('''INSERT INTO thumbnails_new (data_ref_id, size, date_created)
+            SELECT t.data_ref_id, t.size, t.date_created
+            FROM thumbnails t JOIN data_refs d ON d.id = t.data_ref_id
+            WHERE t.data IS NOT NULL AND d.hash IS NOT NULL''')
+        conn.execute("DROP TABLE thumbnails")
+        conn.execute("ALTER TABLE thumbnails_new RENAME TO thumbnails")
+
+
+class AddFullTextIndexMigration(AbstractMigration):
+    '''
+        Adds full-text indexes over items.title and items_fields.field_value. They are
+    FTS5 tables with trigram tokenizer, so they are used by SQLite for LIKE '%text%'
+    patterns. Indexes are external content tables, they are kept in sync with
+    items and items_fields tables by triggers.
+        If SQLite library doesn't support FTS5 or trigram tokenizer, the migration
+    does nothing and queries use plain LIKE (see hasFullTextIndex()).
+    '''
+    version = 4
+    description = "Full-text indexes of item titles and field values"
+
+    def upgrade(self, conn):
+        try:
+            conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS items_title_fts USING fts5(
+                title, content='items', content_rowid='id', tokenize='trigram')''')
+            conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS items_fields_fts USING fts5(
+                field_value, content='items_fields', content_rowid='rowid', tokenize='trigram')''')
+        except sqa.exc.OperationalError as ex:
+            logger.warning("Full-text index is not created, SQLite doesn't support it: {}"
+                           .format(ex))
+            return
+
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS items_title_fts_ai AFTER INSERT ON items BEGIN
+            INSERT INTO items_title_fts (rowid, title) VALUES (new.id, new.title);
+        END''')
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS items_title_fts_ad AFTER DELETE ON items BEGIN
+            INSERT INTO items_title_fts (items_title_fts, rowid, title)
+                VALUES ('delete', old.id, old.title);
+        END''')
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS items_title_fts_au
+            AFTER UPDATE OF id, title ON items BEGIN
+            INSERT INTO items_title_fts (items_title_fts, rowid, title)
+                VALUES ('delete', old.id, old.title);
+            INSERT INTO items_title_fts (rowid, title) VALUES (new.id, new.title);
+        END''')
+
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS items_fields_fts_ai AFTER INSERT ON items_fields BEGIN
+            INSERT INTO items_fields_fts (rowid, field_value) VALUES (new.rowid, new.field_value);
+        END''')
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS items_fields_fts_ad AFTER DELETE ON items_fields BEGIN
+            INSERT INTO items_fields_fts (items_fields_fts, rowid, field_value)
+                VALUES ('delete', old.rowid, old.field_value);
+        END''')
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS items_fields_fts_au
+            AFTER UPDATE OF field_value ON items_fields BEGIN
+            INSERT INTO items_fields_fts (items_fields_fts, rowid, field_value)
+                VALUES ('delete', old.rowid, old.field_value);
+            INSERT INTO items_fields_fts (rowid, field_value) VALUES (new.rowid, new.field_value);
+        END''')
+
+        rebuildFullTextIndex(conn)
+
+
+class AddDirectoriesMigration(AbstractMigration):
+    '''
+        Adds directories table (tree of directories with files of DataRefs) and
+    data_refs.dir_id column, fills them from data_refs.url values.
+    '''
+    version = 5
+    description = "Directories table and data_refs.dir_id column"
+
+    def upgrade(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS directories (
+            id INTEGER NOT NULL,
+            parent_id INTEGER,
+            rel_path VARCHAR NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(parent_id) REFERENCES directories (id),
+            UNIQUE (rel_path)
+        )''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_directories_parent_id
+            ON directories (parent_id)''')
+        if "dir_id" not in _tableColumns(conn, "data_refs"):
+            conn.execute("ALTER TABLE data_refs ADD COLUMN dir_id INTEGER REFERENCES directories (id)")
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_data_refs_dir_id
+            ON data_refs (dir_id)''')
+
+        dirIds = dict()
+        rows = conn.execute('''SELECT id, url FROM data_refs
+            WHERE type = 'FILE' AND dir_id IS NULL''').fetchall()
+        updates = [{"id": dataRefId, "dir_id": self.__dirId(conn, posixpath.dirname(url), dirIds)}
+                   for (dataRefId, url) in rows]
+        if len(updates) > 0:
+            conn.execute(sqa.text("UPDATE data_refs SET dir_id = :dir_id WHERE id = :id"), updates)
+
+    def __dirId(self, conn, dirRelPath, dirIds):
+        if dirRelPath in dirIds:
+            return dirIds[dirRelPath]
+        dirId = conn.execute(sqa.text("SELECT id FROM directories WHERE rel_path = :rel_path"),
+                             rel_path=dirRelPath).scalar()
+        if dirId is None:
+            parentId = None if dirRelPath == "" else \
+                self.__dirId(conn, posixpath.dirname(dirRelPath), dirIds)
+            dirId = conn.execute(sqa.text(
+                "INSERT INTO directories (parent_id, rel_path) VALUES (:parent_id, :rel_path)"),
+                parent_id=parentId, rel_path=dirRelPath).lastrowid
+        dirIds[dirRelPath] = dirId
+        return dirId
+
+
+class AddFieldValueNumMigration(AbstractMigration):
+    '''
+        Adds items_fields.field_value_num column with numeric values of fields (or NULL
+    for values that are not numbers) and an index for range queries over it.
+    '''
+    version = 6
+    description = "Numeric field values column items_fields.field_value_num"
+
+    def upgrade(self, conn):
+        if "field_value_num" not in _tableColumns(conn, "items_fields"):
+            conn.execute("ALTER TABLE items_fields ADD COLUMN field_value_num FLOAT")
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_items_fields_field_id_value_num
+            ON items_fields (field_id, field_value_num)''')
+
+        rows = conn.execute("SELECT rowid, field_value FROM items_fields").fetchall()
+        updates = [{"row_id": rowId, "value_num": helpers.parseNumber(value)}
+                   for (rowId, value) in rows]
+        if len(updates) > 0:
+            conn.execute(sqa.text(
+                "UPDATE items_fields SET field_value_num = :value_num WHERE rowid = :row_id"),
+                updates)
+        conn.execute("ANALYZE items_fields")
+
+
+class AddUrlNocaseIndexMigration(AbstractMigration):
+    '''
+        Adds a case-insensitive index on data_refs.url. With it SQLite finds urls that
+    start with a given prefix (path: extra clauses, data_refs.url LIKE 'prefix%') by a
+    range of the index, instead of a full scan of data_refs table.
+    '''
+    version = 7
+    description = "Case-insensitive index on data_refs.url"
+
+    def upgrade(self, conn):
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_data_refs_url_nocase
+            ON data_refs (url COLLATE NOCASE)''')
+
+
+class AddItemsFieldsIdMigration(AbstractMigration):
+    '''
+        Adds items_fields.id INTEGER PRIMARY KEY column, (item_id, field_id, user_login)
+    becomes a unique key. Full-text index items_fields_fts is keyed on this column
+    instead of the implicit rowid of items_fields, because VACUUM (run by Reggata or
+    by any other tool) may renumber implicit rowids, and the index would silently get
+    out of sync with its content table.
+    '''
+    version = 8
+    description = "Column items_fields.id, full-text index of field values is keyed on it"
+
+    def upgrade(self, conn):
+        if "id" not in _tableColumns(conn, "items_fields"):
+            self.__rebuildItemsFields(conn)
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_items_fields_field_id_value
+            ON items_fields (field_id, field_value, item_id)''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS ix_items_fields_field_id_value_num
+            ON items_fields (field_id, field_value_num)''')
+        conn.execute("ANALYZE items_fields")
+
+        if not hasFullTextIndex(conn):
+            return
+        for trigger in ["items_fields_fts_ai", "items_fields_fts_ad", "items_fields_fts_au"]:
+            conn.execute("DROP TRIGGER IF EXISTS " + trigger)
+        conn.execute("DROP TABLE items_fields_fts")
+        conn.execute('''CREATE VIRTUAL TABLE items_fields_fts USING fts5(
+            field_value, content='items_fields', content_rowid='id', tokenize='trigram')''')
+        conn.execute('''CREATE TRIGGER items_fields_fts_ai AFTER INSERT ON items_fields BEGIN
+            INSERT INTO items_fields_fts (rowid, field_value) VALUES (new.id, new.field_value);
+        END''')
+        conn.execute('''CREATE TRIGGER items_fields_fts_ad AFTER DELETE ON items_fields BEGIN
+            INSERT INTO items_fields_fts (items_fields_fts, rowid, field_value)
+                VALUES ('delete', old.id, old.field_value);
+        END''')
+        conn.execute('''CREATE TRIGGER items_fields_fts_au
+            AFTER UPDATE OF id, field_value ON items_fields BEGIN
+            INSERT INTO items_fields_fts (items_fields_fts, rowid, field_value)
+                VALUES ('delete', old.id, old.field_value);
+            INSERT INTO items_fields_fts (rowid, field_value) VALUES (new.id, new.field_value);
+        END''')
+        conn.execute("INSERT INTO items_fields_fts (items_fields_fts) VALUES ('rebuild')")
+
+    def __rebuildItemsFields(self, conn):
+        # SQLite cannot add a primary key column, so the table is recreated. Triggers
+        # and indexes of the table are dropped together with it
+        conn.execute("DROP TABLE IF EXISTS items_fields_new")
+        conn.execute('''CREATE TABLE items_fields_new (
+            id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            field_id INTEGER NOT NULL,
+            user_login VARCHAR NOT NULL,
+            field_value VARCHAR NOT NULL,
+            field_value_num FLOAT,
+            PRIMARY KEY (id),
+            UNIQUE (item_id, field_id, user_login),
+            FOREIGN KEY(user_login) REFERENCES users (login),
+            FOREIGN KEY(field_id) REFERENCES fields (id),
+            FOREIGN KEY(item_id) REFERENCES items (id)
+        )''')
+        conn.execute('''INSERT INTO items_fields_new
+            (id, item_id, field_id, user_login, field_value, field_value_num)
+            SELECT rowid, item_id, field_id, user_login, field_value, field_value_num
+            FROM items_fields''')
+        conn.execute("DROP TABLE items_fields")
+        conn.execute("ALTER TABLE items_fields_new RENAME TO items_fields")
+
+
+# All migrations in the order of increasing versions
+MIGRATIONS = [AddSecondaryIndexesMigration(),
+              AddTagStatsMigration(),
+              MoveThumbnailsToStoreMigration(),
+              AddFullTextIndexMigration(),
+              AddDirectoriesMigration(),
+              AddFieldValueNumMigration(),
+              AddUrlNocaseIndexMigration(),
+              AddItemsFieldsIdMigration(),
+              ]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def currentVersion(conn):
+    '''
+        Returns schema version of the database. Databases created before schema
+    versioning was introduced have version 0.
+    '''
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER NOT NULL,
+        description VARCHAR,
+        date_applied DATETIME,
+        PRIMARY KEY (version)
+    )''')
+    version = conn.execute("SELECT max(version) FROM schema_version").scalar()
+    return version if version is not None else 0
+
+
+def hasFullTextIndex(conn):
+    '''
+        Returns True if the database has full-text indexes (see AddFullTextIndexMigration).
+    '''
+    return conn.execute('''SELECT count(*) FROM sqlite_master
+        WHERE type = 'table' AND name IN ('items_title_fts', 'items_fields_fts')''').scalar() == 2
+
+
+def rebuildFullTextIndex(conn):
+    '''
+        Refills full-text indexes from items and items_fields tables. Indexes are keyed
+    on items.id and items_fields.id, so VACUUM doesn't break them.
+    '''
+    if not hasFullTextIndex(conn):
+        return
+    conn.execute("INSERT INTO items_title_fts (items_title_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO items_fields_fts (items_fields_fts) VALUES ('rebuild')")
+
+
+def upgrade(engine):
+    '''
+        Applies to the database all migrations it doesn't have yet. Every migration
+    is applied in a separate transaction. Returns the resulting schema version.
+    '''
+    conn = engine.connect()
+    try:
+        version = currentVersion(conn)
+        if version > LATEST_VERSION:
+            raise CannotOpenRepoError(
+                "Repository database has schema version {}, but this version of Reggata "
+                "supports only versions up to {}. Please upgrade Reggata."
+                .format(version, LATEST_VERSION))
+
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+            logger.info("Applying schema migration {}: {}"
+                        .format(migration.version, migration.description))
+            trans = conn.begin()
+            try:
+                migration.upgrade(conn)
+                conn.execute(sqa.text('''INSERT INTO schema_version (version, description, date_applied)
+                    VALUES (:version, :description, datetime('now'))'''),
+                    version=migration.version, description=migration.description)
+                trans.commit()
+            except:
+                trans.rollback()
+                raise
+            version = migration.version
+            if migration.vacuum:
+                conn.execute("VACUUM")
+        return version
+    finally:
+        conn.close()
@@ -26,6 +26,24 @@ class JsonUnsupportedVersionError(Exception):
 
 Base = declarative_base()
 
+
+class SchemaVersion(Base):
+    '''
+        One record per applied schema migration (see module db_migrations).
+    The current schema version of a repository database is the max version.
+    '''
+    __tablename__ = "schema_version"
+
+    version = sqa.Column(sqa.Integer, primary_key=True)
+    description = sqa.Column(sqa.String)
+    date_applied = sqa.Column(sqa.DateTime)
+
+    def __init__(self, version=None, description=None):
+        self.version = version
+        self.description = description
+        self.date_applied = datetime.datetime.today()
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -127,6 +145,9 @@ class Item(Base, memento.Serializable):
     not nescesary.
     '''
     __tablename__ = "items"
+    __table_args__ = (sqa.Index("ix_items_data_ref_id", "data_ref_id"),
+                      sqa.Index("ix_items_alive_title", "alive", "title"),
+                      sqa.Index("ix_items_user_login", "user_login"))
 
     ERROR_FILE_NOT_FOUND = 1
     ERROR_FILE_HASH_MISMATCH = 2
@@ -393,6 +414,24 @@ class Item(Base, memento.Serializable):
         return self.data_ref is not None
 
 
+class Directory(Base):
+    '''
+        A directory of the repository tree, that contains files of DataRef objects
+    (directly or in subdirectories). rel_path is a relative to repository root path
+    in UNIX format, root directory of the repository has empty rel_path. Directories
+    are created by DirectoryOperations (see module operations) when DataRefs are saved.
+    '''
+    __tablename__ = "directories"
+
+    id = sqa.Column(sqa.Integer, primary_key=True)
+    parent_id = sqa.Column(sqa.Integer, ForeignKey("directories.id"), index=True)
+    rel_path = sqa.Column(sqa.String, nullable=False, unique=True)
+
+    def __init__(self, rel_path=None, parent_id=None):
+        self.rel_path = rel_path
+        self.parent_id = parent_id
+
+
 class DataRef(Base, memento.Serializable):
     '''
         This is a reference of Item to a physical file on the filesystem.
@@ -402,6 +441,8 @@ class DataRef(Base, memento.Serializable):
     #TODO Maybe add ZIP, and DIR types...
 
     __tablename__ = "data_refs"
+    __table_args__ = (sqa.Index("ix_data_refs_hash", "hash"),
+                      sqa.Index("ix_data_refs_dir_id", "dir_id"))
 
     id = sqa.Column(sqa.Integer, primary_key=True)
 
@@ -424,6 +465,9 @@ class DataRef(Base, memento.Serializable):
     #deprecated because it's enough information in field Item.user_login
     user_login = sqa.Column(sqa.String, ForeignKey("users.login"))
 
+    # Directory of the file. It is maintained by DirectoryOperations on every flush
+    dir_id = sqa.Column(sqa.Integer, ForeignKey("directories.id"))
+
     user = relationship(User, cascade="save-update, merge, expunge, refresh-expire")
 
     thumbnails = relationship("Thumbnail", cascade="all, delete-orphan")
@@ -541,7 +585,11 @@ class DataRef(Base, memento.Serializable):
 
 
 class Thumbnail(Base):
-
+    '''
+        Metadata of an image thumbnail. Thumbnail images are stored in files
+    (see data/thumbnail_store.py), attribute data is not mapped to the database.
+    It is filled by ThumbnailBuilderThread or when a thumbnail is loaded from the store.
+    '''
     __tablename__ = "thumbnails"
 
     data_ref_id = sqa.Column(sqa.Integer, ForeignKey("data_refs.id"), primary_key=True)
@@ -549,8 +597,6 @@ class Thumbnail(Base):
     # Size of thumbnail in pixels
     size = sqa.Column(sqa.Integer, primary_key=True)
 
-    data = sqa.Column(sqa.LargeBinary)
-
     date_created = sqa.Column(sqa.DateTime)
 
     def __init__(self):
@@ -559,12 +605,15 @@ class Thumbnail(Base):
         self.data = None
         self.date_created = datetime.datetime.today()
 
+    @orm.reconstructor
+    def __init_on_load__(self):
+        self.data = None
+
     @staticmethod
     def _sql_from():
         return '''
         thumbnails.data_ref_id AS thumbnails_data_ref_id,
         thumbnails.size AS thumbnails_size,
-        thumbnails.data AS thumbnails_data,
         thumbnails.date_created AS thumbnails_date_created '''
 
 class Tag(Base):
@@ -590,8 +639,27 @@ class Tag(Base):
         tags.synonym_code as tags_synonym_code '''
 
 
+class TagStat(Base):
+    '''
+        Usage statistics of a Tag: item_count is the number of items_tags rows that
+    link the Tag with alive Items. It is maintained by ItemOperations (see module
+    operations) in the same transaction as items_tags, so tag cloud doesn't have to
+    aggregate the whole items_tags table.
+    '''
+    __tablename__ = "tag_stats"
+    __table_args__ = (sqa.Index("ix_tag_stats_item_count", "item_count"),)
+
+    tag_id = sqa.Column(sqa.Integer, ForeignKey("tags.id"), primary_key=True)
+    item_count = sqa.Column(sqa.Integer, nullable=False, default=0)
+
+    def __init__(self, tag_id=None, item_count=0):
+        self.tag_id = tag_id
+        self.item_count = item_count
+
+
 class Item_Tag(Base):
     __tablename__ = "items_tags"
+    __table_args__ = (sqa.Index("ix_items_tags_tag_id_item_id", "tag_id", "item_id"),)
 
     item_id = sqa.Column(sqa.Integer, ForeignKey("items.id"), primary_key=True)
     tag_id = sqa.Column(sqa.Integer, ForeignKey("tags.id"), primary_key=True)
@@ -601,10 +669,11 @@ class Item_Tag(Base):
 
 
     def __init__(self, tag=None, user_login=None):
-        self.tag = tag
-        self.user_login = user_login
+        # NOTE: Assigning None to self.tag would reset tag_id on flush
         if tag is not None:
+            self.tag = tag
             self.tag_id = tag.id
+        self.user_login = user_login
 
     @staticmethod
     def _sql_from():
@@ -639,22 +708,36 @@ class Field(Base):
 class Item_Field(Base):
 
     __tablename__ = "items_fields"
+    # The table also has id INTEGER PRIMARY KEY column, that is added by schema
+    # migration 8 (see db_migrations) and is not mapped here
+    __table_args__ = (sqa.Index("ix_items_fields_field_id_value", "field_id", "field_value", "item_id"),
+                      sqa.Index("ix_items_fields_field_id_value_num", "field_id", "field_value_num"))
 
     item_id = sqa.Column(sqa.Integer, ForeignKey("items.id"), primary_key=True)
-    field_id = sqa.Column(sqa.String, ForeignKey("fields.id"), primary_key=True)
+    field_id = sqa.Column(sqa.Integer, ForeignKey("fields.id"), primary_key=True)
     user_login = sqa.Column(sqa.String, ForeignKey("users.login"), primary_key=True)
     field_value = sqa.Column(sqa.String, nullable=False, default="")
 
+    # Numeric value of field_value or NULL if it is not a number. It is set together with
+    # field_value (see setFieldValueNum()), numeric comparisons of query language use it
+    field_value_num = sqa.Column(sqa.Float)
+
     field = relationship(Field, cascade="save-update, merge, expunge, refresh-expire")
 
 
     def __init__(self, field=None, value=None, user_login=None):
-        self.field = field
+        # NOTE: Assigning None to self.field would reset field_id on flush
         if field is not None:
+            self.field = field
             self.field_id = field.id
         self.field_value = value
         self.user_login = user_login
 
+    @orm.validates("field_value")
+    def setFieldValueNum(self, key, value):
+        self.field_value_num = helpers.parseNumber(value)
+        return value
+
     @staticmethod
     def _sql_from():
         return '''
@@ -0,0 +1,141 @@
+'''
+Created on 18.10.2026
+
+Lightweight read-only records of items. They are produced by the item query commands
+(see data/commands.py) with plain SQL, without SQLAlchemy ORM, and are displayed in
+Items Table. They provide the subset of db_schema.Item/DataRef interface that is used
+by the table and by the worker threads that process its rows.
+
+To modify an item, get ORM object of it by id (GetExpungedItemCommand).
+'''
+import os
+import reggata.helpers as helpers
+from reggata.data.db_schema import DataRef
+
+
+class ThumbnailRow(object):
+    __slots__ = ("data_ref_id", "size", "data")
+
+    def __init__(self, data_ref_id, size):
+        self.data_ref_id = data_ref_id
+        self.size = size
+        self.data = None # Is read from the thumbnail store on demand
+
+    def copy(self):
+        return ThumbnailRow(self.data_ref_id, self.size)
+
+
+class DataRefRow(object):
+    __slots__ = ("id", "url_raw", "type", "hash", "date_hashed", "size",
+                 "date_created", "user_login", "thumbnails")
+
+    def __init__(self, id, url_raw, type, hash, date_hashed, size, date_created, user_login):
+        self.id = id
+        self.url_raw = url_raw
+        self.type = type
+        self.hash = hash
+        self.date_hashed = date_hashed
+        self.size = size
+        self.date_created = date_created
+        self.user_login = user_login
+        self.thumbnails = []
+
+    def copy(self):
+        dataRef = DataRefRow(self.id, self.url_raw, self.type, self.hash, self.date_hashed,
+                             self.size, self.date_created, self.user_login)
+        dataRef.thumbnails = [thumbnail.copy() for thumbnail in self.thumbnails]
+        return dataRef
+
+    @property
+    def url(self):
+        if self.type == DataRef.FILE and self.url_raw is not None:
+            return helpers.from_db_format(self.url_raw)
+        return self.url_raw
+
+    def is_image(self):
+        supported = set([".bmp", ".gif", ".jpg", ".jpeg", ".png", ".pbm", ".pgm",
+                         ".ppm", ".xbm", ".xpm"])
+        if self.type == DataRef.FILE and not helpers.is_none_or_empty(self.url_raw):
+            _root, ext = os.path.splitext(self.url_raw.lower())
+            return ext in supported
+        return False
+
+
+class ItemRow(object):
+    '''
+        Item with its tags and fields. tags is a tuple of (tag_name, user_login) pairs,
+    fields is a tuple of (field_name, field_value, user_login) triples.
+    '''
+    __slots__ = ("id", "title", "user_login", "date_created", "alive", "data_ref_id",
+                 "data_ref", "tags", "fields", "error", "table_row")
+
+    def __init__(self, id, title, user_login, date_created, alive, data_ref_id, data_ref=None):
+        self.id = id
+        self.title = title
+        self.user_login = user_login
+        self.date_created = date_created
+        self.alive = alive
+        self.data_ref_id = data_ref_id
+        self.data_ref = data_ref
+        self.tags = ()
+        self.fields = ()
+        self.error = None #When error is None, it means that there was no integrity check yet
+        self.table_row = None
+
+    # Approximate number of bytes of an ItemRow object without its strings
+    BASE_SIZE = 1024
+
+    def copy(self):
+        '''
+            Returns a copy of this record, that can be modified independently
+        (tags and fields tuples are shared, because they are immutable).
+        '''
+        itemRow = ItemRow(self.id, self.title, self.user_login, self.date_created, self.alive,
+                          self.data_ref_id,
+                          self.data_ref.copy() if self.data_ref is not None else None)
+        itemRow.tags = self.tags
+        itemRow.fields = self.fields
+        return itemRow
+
+    def approxSize(self):
+        '''
+            Returns approximate number of bytes this record takes in memory.
+        '''
+        size = ItemRow.BASE_SIZE + len(self.title or "")
+        if self.data_ref is not None:
+            size += len(self.data_ref.url_raw or "") + len(self.data_ref.hash or "")
+        for name, userLogin in self.tags:
+            size += 64 + len(name) + len(userLogin or "")
+        for name, value, userLogin in self.fields:
+            size += 64 + len(name) + len(str(value)) + len(userLogin or "")
+        return size
+
+    def hasDataRef(self):
+        return self.data_ref is not None
+
+    def hasTag(self, tagName):
+        for name, _userLogin in self.tags:
+            if name == tagName:
+                return True
+        return False
+
+    def getFieldValue(self, fieldName, userLogin=None):
+        for name, value, fieldUserLogin in self.fields:
+            if name == fieldName:
+                if userLogin is None or fieldUserLogin == userLogin:
+                    return value
+        return None
+
+    def setFieldValue(self, fieldName, value, userLogin):
+        '''
+            Changes field value only in this record, database is not modified.
+        '''
+        fields = [f for f in self.fields if not (f[0] == fieldName and f[2] == userLogin)]
+        fields.append((fieldName, value, userLogin))
+        self.fields = tuple(fields)
+
+    def format_tags(self):
+        return " ".join(name for name, _userLogin in self.tags)
+
+    def format_field_vals(self):
+        return os.linesep.join(name + ": " + str(value) for name, value, _userLogin in self.fields)
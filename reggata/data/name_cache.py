@@ -0,0 +1,196 @@
+'''
+Created on 18.10.2026
+
+Name cache keeps in memory the mapping name <-> id of all tags (or fields) of
+a repository, so commands do not have to query tags/fields tables every time
+they need to resolve a name.
+'''
+import threading
+import sqlalchemy as sqa
+
+
+class NameCache(object):
+    '''
+        Bidirectional map name <-> id of db.Tag (or db.Field) objects of one repository.
+    One instance is owned by RepoMgr and is shared by all units of work (and threads).
+
+        The cache is loaded lazily with one SELECT through loadEngine, so it contains
+    only committed names. Names created within a session, and names found through a
+    session that has flushed changes, could be not committed yet. They are kept in
+    session.info until the session commits, then they are published to the cache (and
+    they are dropped if the session rolls back). This requires the cache to be attached
+    to the writer session factory (see attachTo()). Names found through other sessions
+    (e.g. read-only ones) are committed, they are put to the cache at once.
+
+        Names that are not in the cache are looked up in the database, because they
+    could be created by another process that works with the same repository.
+    '''
+    BATCH_SIZE = 500
+
+    def __init__(self, entityCls, loadEngine):
+        self._table = entityCls.__table__
+        self._loadEngine = loadEngine
+        self._lock = threading.RLock()
+        self._idsByName = None
+        self._namesById = None
+        self._pendingKey = "name_cache_pending_" + self._table.name
+        self._flushedKey = "name_cache_flushed_" + self._table.name
+
+    def attachTo(self, sessionFactory):
+        sqa.event.listen(sessionFactory, "after_flush", self.__onFlush)
+        sqa.event.listen(sessionFactory, "after_commit", self.__publishPending)
+        sqa.event.listen(sessionFactory, "after_rollback", self.__dropPending)
+
+    def invalidate(self):
+        '''
+            Forgets all the names, they will be loaded again on the next access.
+        '''
+        with self._lock:
+            self._idsByName = None
+            self._namesById = None
+
+    def names(self):
+        '''
+            Returns a list of all committed names.
+        '''
+        with self._lock:
+            self.__ensureLoaded()
+            return list(self._idsByName.keys())
+
+    def idOf(self, session, name):
+        '''
+            Returns id of the given name or None if there is no such name in the database.
+        '''
+        return self.idsOf(session, [name]).get(name)
+
+    def idsOf(self, session, names):
+        '''
+            Returns a dict {name: id} for those of given names that exist in the database.
+        '''
+        names = set(names)
+        pending = session.info.get(self._pendingKey, {})
+        result = dict()
+        missingNames = []
+        with self._lock:
+            self.__ensureLoaded()
+            for name in names:
+                entityId = self._idsByName.get(name)
+                if entityId is None:
+                    entityId = pending.get(name)
+                if entityId is None:
+                    missingNames.append(name)
+                else:
+                    result[name] = entityId
+
+        if len(missingNames) > 0:
+            found = self.__selectIds(session, missingNames)
+            self.__put(session, found)
+            result.update(found)
+        return result
+
+    def nameOf(self, session, entityId):
+        '''
+            Returns name with the given id or None if there is no such id in the database.
+        '''
+        with self._lock:
+            self.__ensureLoaded()
+            name = self._namesById.get(entityId)
+        if name is not None:
+            return name
+
+        for pendingName, pendingId in session.info.get(self._pendingKey, {}).items():
+            if pendingId == entityId:
+                return pendingName
+
+        row = session.execute(sqa.select([self._table.c.name])
+                              .where(self._table.c.id == entityId)).first()
+        if row is None:
+            return None
+        self.__put(session, {row[0]: entityId})
+        return row[0]
+
+    def getOrCreateIds(self, session, names):
+        '''
+            Returns a dict {name: id} for all given names. Names that are not in the
+        database yet are inserted within the current transaction of session.
+        '''
+        result = self.idsOf(session, names)
+        missingNames = [name for name in set(names) if name not in result]
+        if len(missingNames) > 0:
+            session.execute(self._table.insert(), [{"name": name} for name in missingNames])
+            created = self.__selectIds(session, missingNames)
+            self.__put(session, created, inserted=True)
+            result.update(created)
+        return result
+
+    def getOrCreateId(self, session, name):
+        return self.getOrCreateIds(session, [name])[name]
+
+    def remove(self, entityIds):
+        '''
+            Removes names with the given ids from the cache. Call it after the rows
+        are deleted and committed.
+        '''
+        with self._lock:
+            if self._idsByName is None:
+                return
+            for entityId in entityIds:
+                name = self._namesById.pop(entityId, None)
+                if name is not None:
+                    self._idsByName.pop(name, None)
+
+    def __ensureLoaded(self):
+        if self._idsByName is not None:
+            return
+        idsByName = dict()
+        conn = self._loadEngine.connect()
+        try:
+            for (entityId, name) in conn.execute(sqa.select([self._table.c.id,
+                                                             self._table.c.name])):
+                idsByName[name] = entityId
+        finally:
+            conn.close()
+        self._idsByName = idsByName
+        self._namesById = dict((entityId, name) for name, entityId in idsByName.items())
+
+    def __selectIds(self, session, names):
+        result = dict()
+        for i in range(0, len(names), NameCache.BATCH_SIZE):
+            batch = names[i:i + NameCache.BATCH_SIZE]
+            for (entityId, name) in session.execute(
+                    sqa.select([self._table.c.id, self._table.c.name])
+                    .where(self._table.c.name.in_(batch))):
+                result[name] = entityId
+        return result
+
+    def __put(self, session, idsByName, inserted=False):
+        # Rows inserted by the session, or found through a session with flushed changes,
+        # could be not committed yet, so they are published only when the session commits
+        if inserted or session.info.get(self._flushedKey, False):
+            session.info.setdefault(self._pendingKey, {}).update(idsByName)
+            return
+        with self._lock:
+            if self._idsByName is None:
+                return
+            for name, entityId in idsByName.items():
+                self._idsByName[name] = entityId
+                self._namesById[entityId] = name
+
+    def __onFlush(self, session, flushContext):
+        session.info[self._flushedKey] = True
+
+    def __publishPending(self, session):
+        session.info.pop(self._flushedKey, None)
+        pending = session.info.pop(self._pendingKey, None)
+        if not pending:
+            return
+        with self._lock:
+            if self._idsByName is None:
+                return
+            for name, entityId in pending.items():
+                self._idsByName[name] = entityId
+                self._namesById[entityId] = name
+
+    def __dropPending(self, session):
+        session.info.pop(self._flushedKey, None)
+        session.info.pop(self._pendingKey, None)
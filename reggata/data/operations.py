@@ -6,57 +6,234 @@ import reggata.data.db_schema as db
 import reggata.helpers as hlp
 import reggata.errors as err
 import os
+import posixpath
 import datetime
 import shutil
+import sqlalchemy as sqa
+
+
+class TagStatsOperations:
+    '''
+        Maintains tag_stats table (see db.TagStat). All functions work within the
+    current transaction of given session.
+    '''
+    BATCH_SIZE = 500
+
+    @staticmethod
+    def changeItemCount(session, tagId, delta):
+        result = session.execute(sqa.text(
+            "UPDATE tag_stats SET item_count = item_count + :delta WHERE tag_id = :tag_id"),
+            {"delta": delta, "tag_id": tagId})
+        if result.rowcount == 0:
+            session.execute(sqa.text(
+                "INSERT INTO tag_stats (tag_id, item_count) VALUES (:tag_id, :item_count)"),
+                {"tag_id": tagId, "item_count": max(delta, 0)})
+
+    @staticmethod
+    def removeItem(session, item):
+        '''
+            Should be called when given alive item is deleted or is marked as not alive.
+        '''
+        for itemTag in item.item_tags:
+            TagStatsOperations.changeItemCount(session, itemTag.tag_id, -1)
+
+    @staticmethod
+    def removeTags(session, tagIds):
+        for tagId in tagIds:
+            session.execute(sqa.text("DELETE FROM tag_stats WHERE tag_id = :tag_id"),
+                            {"tag_id": tagId})
+
+    @staticmethod
+    def tagIdsAndCounts(session, tagNameCache, tagNames):
+        '''
+            Returns a dict {tagName: (tagId, itemCount)} for those of given tag names that
+        exist in the database.
+        '''
+        idsByName = tagNameCache.idsOf(session, tagNames)
+        countsById = dict()
+        tagIds = list(idsByName.values())
+        for i in range(0, len(tagIds), TagStatsOperations.BATCH_SIZE):
+            batch = tagIds[i:i + TagStatsOperations.BATCH_SIZE]
+            for tagId, itemCount in session.execute(
+                    "SELECT tag_id, item_count FROM tag_stats WHERE tag_id IN (" +
+                    hlp.to_commalist(batch, str) + ")"):
+                countsById[tagId] = itemCount
+        return dict((name, (tagId, countsById.get(tagId, 0)))
+                    for name, tagId in idsByName.items())
+
+
+class DirectoryOperations:
+    '''
+        Maintains directories table (see db.Directory) and data_refs.dir_id column.
+    Paths are relative to repository root and in UNIX format (as DataRef.url_raw),
+    root directory of the repository is an empty string.
+    '''
+
+    @staticmethod
+    def dirRelPathOf(url):
+        '''
+            Returns relative path of the directory of given DataRef url (in UNIX format).
+        '''
+        return posixpath.dirname(url)
+
+    @staticmethod
+    def normDirRelPath(dirRelPath):
+        dirRelPath = hlp.to_db_format(os.path.normpath(dirRelPath))
+        return "" if dirRelPath == "." else dirRelPath
+
+    @staticmethod
+    def subtreeRange(dirRelPath):
+        '''
+            Returns a tuple (lowerBound, upperBound) of rel_path values of all directories
+        inside directory dirRelPath (at any depth), lowerBound <= rel_path < upperBound.
+        With such bounds a subtree is a range scan of the unique index on rel_path.
+        '''
+        prefix = dirRelPath + "/"
+        return (prefix, dirRelPath + chr(ord("/") + 1))
+
+    @staticmethod
+    def subtreeSql(dirRelPath, column="rel_path"):
+        '''
+            Returns an SQL condition with bind parameters :subtree_root, :subtree_lower and
+        :subtree_upper (see subtreeParams()), that is true for directory dirRelPath and
+        all its subdirectories.
+        '''
+        if dirRelPath == "":
+            return " 1 "
+        return " ({0} = :subtree_root OR ({0} >= :subtree_lower AND {0} < :subtree_upper)) " \
+            .format(column)
+
+    @staticmethod
+    def subtreeParams(dirRelPath):
+        lower, upper = DirectoryOperations.subtreeRange(dirRelPath)
+        return {"subtree_root": dirRelPath, "subtree_lower": lower, "subtree_upper": upper}
+
+    @staticmethod
+    def getOrCreateDirId(session, dirRelPath, dirIdsCache=None):
+        '''
+            Returns id of directory dirRelPath, the directory and all its parents are
+        inserted into directories table if they are not there yet. Optional dict
+        dirIdsCache {dirRelPath: dirId} saves lookups of the same directories, it must
+        not outlive the current transaction.
+        '''
+        if dirIdsCache is not None and dirRelPath in dirIdsCache:
+            return dirIdsCache[dirRelPath]
+
+        dirId = session.execute(sqa.text(
+            "SELECT id FROM directories WHERE rel_path = :rel_path"),
+            {"rel_path": dirRelPath}).scalar()
+        if dirId is None:
+            parentId = None
+            if dirRelPath != "":
+                parentId = DirectoryOperations.getOrCreateDirId(
+                    session, DirectoryOperations.dirRelPathOf(dirRelPath), dirIdsCache)
+            dirId = session.execute(sqa.text(
+                "INSERT INTO directories (parent_id, rel_path) VALUES (:parent_id, :rel_path)"),
+                {"parent_id": parentId, "rel_path": dirRelPath}).lastrowid
+
+        if dirIdsCache is not None:
+            dirIdsCache[dirRelPath] = dirId
+        return dirId
+
+    @staticmethod
+    def renameDirectory(session, oldDirRelPath, newDirRelPath):
+        '''
+            Changes paths of directory oldDirRelPath, all its subdirectories and urls of
+        all DataRefs inside them. Every table is updated with a single statement over an
+        index range.
+        '''
+        # Directories left in the table after files were moved out of them are deleted
+        newParams = DirectoryOperations.subtreeParams(newDirRelPath)
+        newSubtreeSql = DirectoryOperations.subtreeSql(newDirRelPath)
+        if session.execute(sqa.text('''SELECT count(*) FROM data_refs
+            WHERE dir_id IN (SELECT id FROM directories WHERE ''' + newSubtreeSql + ''')'''),
+            newParams).scalar() > 0:
+            raise err.DataRefAlreadyExistsError(
+                "There are files of items in directory '{}' already.".format(newDirRelPath))
+        session.execute(sqa.text("DELETE FROM directories WHERE " + newSubtreeSql), newParams)
+
+        newParentId = DirectoryOperations.getOrCreateDirId(
+            session, DirectoryOperations.dirRelPathOf(newDirRelPath))
+        params = DirectoryOperations.subtreeParams(oldDirRelPath)
+        params.update({"old_len": len(oldDirRelPath), "new_path": newDirRelPath})
+
+        session.execute(sqa.text('''UPDATE data_refs
+            SET url = :new_path || substr(url, :old_len + 1)
+            WHERE dir_id IN (SELECT id FROM directories WHERE ''' +
+            DirectoryOperations.subtreeSql(oldDirRelPath) + ''')'''), params)
+        session.execute(sqa.text('''UPDATE directories
+            SET rel_path = :new_path || substr(rel_path, :old_len + 1)
+            WHERE ''' + DirectoryOperations.subtreeSql(oldDirRelPath)), params)
+        session.execute(sqa.text(
+            "UPDATE directories SET parent_id = :parent_id WHERE rel_path = :new_path"),
+            {"parent_id": newParentId, "new_path": newDirRelPath})
+
+    @staticmethod
+    def onBeforeFlush(session, flushContext, instances):
+        '''
+            Session event listener, sets dir_id of new DataRefs and of DataRefs whose
+        url was changed. It is registered by RepoMgr.
+        '''
+        for obj in list(session.new) + list(session.dirty):
+            if not isinstance(obj, db.DataRef):
+                continue
+            if obj.type != db.DataRef.FILE or obj.url_raw is None:
+                continue
+            if obj in session.dirty and obj.dir_id is not None and \
+                    not sqa.inspect(obj).attrs.url_raw.history.has_changes():
+                continue
+            obj.dir_id = DirectoryOperations.getOrCreateDirId(
+                session, DirectoryOperations.dirRelPathOf(obj.url_raw))
+
 
 class ItemOperations:
 
     @staticmethod
-    def addTags(session, item, tagNames, userLogin):
+    def addTags(session, item, tagNames, userLogin, tagNameCache):
+        tagNames = list(tagNames)
+        tagIds = tagNameCache.getOrCreateIds(session, tagNames)
         for tagName in tagNames:
-            tag = session.query(db.Tag).filter(db.Tag.name==tagName).first()
-            if tag is None:
-                # Such a tag is not in DB yet
-                tag = db.Tag(tagName)
-                session.add(tag)
-                session.flush()
-            # Link the tag with the item
-            itemTag = db.Item_Tag(tag, userLogin)
+            tagId = tagIds[tagName]
+            # Link the tag with the item. Tag object is not needed here, so it is not loaded
+            itemTag = db.Item_Tag(None, userLogin)
+            itemTag.tag_id = tagId
             session.add(itemTag)
             itemTag.item = item
             item.item_tags.append(itemTag)
+            if item.alive:
+                TagStatsOperations.changeItemCount(session, tagId, 1)
         session.flush()
 
     @staticmethod
-    def removeTags(session, item, tagNames):
+    def removeTags(session, item, tagNames, tagNameCache):
         for itag in item.item_tags:
-            if itag.tag.name in tagNames:
+            if tagNameCache.nameOf(session, itag.tag_id) in tagNames:
                 session.delete(itag)
+                if item.alive:
+                    TagStatsOperations.changeItemCount(session, itag.tag_id, -1)
         session.flush()
 
 
     @staticmethod
-    def removeFields(session, item, fieldNames):
+    def removeFields(session, item, fieldNames, fieldNameCache):
         for ifield in item.item_fields:
-            if ifield.field.name in fieldNames:
+            if fieldNameCache.nameOf(session, ifield.field_id) in fieldNames:
                 session.delete(ifield)
         session.flush()
 
     @staticmethod
-    def addOrUpdateFields(session, item, nameValuePairs, userLogin):
+    def addOrUpdateFields(session, item, nameValuePairs, userLogin, fieldNameCache):
+        nameValuePairs = list(nameValuePairs)
+        fieldIds = fieldNameCache.getOrCreateIds(session, [name for (name, _value) in nameValuePairs])
         for (name, value) in nameValuePairs:
-            ifield = next((ifield for ifield in item.item_fields if ifield.field.name == name), None)
+            fieldId = fieldIds[name]
+            ifield = next((ifield for ifield in item.item_fields if ifield.field_id == fieldId), None)
             if ifield:
                 ifield.field_value = value
                 continue
 
-            field = session.query(db.Field).filter(db.Field.name==name).first()
-            if field is None:
-                field = db.Field(name)
-                session.add(field)
-                session.flush()
-
-            itemField = db.Item_Field(field, value, userLogin)
+            itemField = db.Item_Field(None, value, userLogin)
+            itemField.field_id = fieldId
             session.add(itemField)
             itemField.item = item
             item.item_fields.append(itemField)
@@ -65,6 +242,33 @@ class ItemOperations:
 
     @staticmethod
     def addUntrackedFile(session, item, repoBasePath, srcAbsPath, dstRelPath, userLogin):
+        srcAbsPath, dstRelPath, dstAbsPath = ItemOperations.checkUntrackedFile(
+            repoBasePath, srcAbsPath, dstRelPath)
+
+        dataRef = session.query(db.DataRef).filter(
+            db.DataRef.url_raw==hlp.to_db_format(dstRelPath)).first()
+        if dataRef is not None:
+            raise err.DataRefAlreadyExistsError("DataRef instance with url='{}' "
+                                               "is already in database. ".format(dstRelPath))
+
+        item.data_ref = db.DataRef(objType=db.DataRef.FILE, url=dstRelPath)
+        item.data_ref.user_login = userLogin
+        item.data_ref.size = os.path.getsize(srcAbsPath)
+        item.data_ref.hash = hlp.computeFileHash(srcAbsPath)
+        item.data_ref.date_hashed = datetime.datetime.today()
+        session.add(item.data_ref)
+        item.data_ref_id = item.data_ref.id
+        session.flush()
+
+        ItemOperations.copyFileToRepo(srcAbsPath, dstAbsPath)
+
+    @staticmethod
+    def checkUntrackedFile(repoBasePath, srcAbsPath, dstRelPath):
+        '''
+            Checks arguments of an operation that adds file srcAbsPath to the repository
+        to dstRelPath location. Returns a tuple (srcAbsPath, dstRelPath, dstAbsPath) of
+        normalized paths, raises ValueError if the file cannot be added.
+        '''
         assert not hlp.is_none_or_empty(srcAbsPath)
         assert dstRelPath is not None
         #NOTE: If dstRelPath is an empty string it means the root of repository
@@ -87,21 +291,10 @@ class ItemOperations:
         if srcAbsPath != dstAbsPath and os.path.exists(dstAbsPath):
             raise ValueError("{} should not point to an existing file.".format(dstAbsPath))
 
-        dataRef = session.query(db.DataRef).filter(
-            db.DataRef.url_raw==hlp.to_db_format(dstRelPath)).first()
-        if dataRef is not None:
-            raise err.DataRefAlreadyExistsError("DataRef instance with url='{}' "
-                                               "is already in database. ".format(dstRelPath))
-
-        item.data_ref = db.DataRef(objType=db.DataRef.FILE, url=dstRelPath)
-        item.data_ref.user_login = userLogin
-        item.data_ref.size = os.path.getsize(srcAbsPath)
-        item.data_ref.hash = hlp.computeFileHash(srcAbsPath)
-        item.data_ref.date_hashed = datetime.datetime.today()
-        session.add(item.data_ref)
-        item.data_ref_id = item.data_ref.id
-        session.flush()
+        return (srcAbsPath, dstRelPath, dstAbsPath)
 
+    @staticmethod
+    def copyFileToRepo(srcAbsPath, dstAbsPath):
         #Now it's time to COPY physical file to the repository
         if srcAbsPath != dstAbsPath:
             try:
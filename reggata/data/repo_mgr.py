@@ -5,10 +5,16 @@ Created on 30.09.2010
 import sqlalchemy as sqa
 from sqlalchemy.orm import sessionmaker
 import os.path
-from reggata.errors import CannotOpenRepoError
+from reggata.errors import CannotOpenRepoError, QueryCancelledError
 import reggata.consts as consts
 from reggata.user_config import UserConfig
-from reggata.data.db_schema import Base, HistoryRec
+from reggata.data.db_schema import Base, HistoryRec, Tag, Field
+from reggata.data import db_migrations
+from reggata.data.storage_profile import StorageProfile
+from reggata.data.name_cache import NameCache
+from reggata.data.result_cache import QueryResultCache
+from reggata.data.operations import DirectoryOperations
+from reggata.data import cancellation
 from reggata.helpers import stringToBool
 
 class RepoMgr(object):
@@ -18,7 +24,8 @@ class RepoMgr(object):
 
     def __init__(self, path_to_repo):
         '''
-            Opens an existing repository at given path.
+            Opens an existing repository at given path. If the repository database
+        has an old schema version, it is upgraded in place (see module db_migrations).
         '''
         try:
             self._base_path = path_to_repo
@@ -27,18 +34,99 @@ class RepoMgr(object):
                                 .format(self.base_path))
 
             engine_echo = stringToBool(UserConfig().get("sqlalchemy.engine_echo"))
+            self._storageProfile = StorageProfile.fromUserConfig()
+            profile = self._storageProfile
 
-            self.__engine = sqa.create_engine(\
-                "sqlite:///" + self.base_path + os.sep + consts.METADATA_DIR + os.sep + \
-                consts.DB_FILE, echo=engine_echo)
+            dbUrl = "sqlite:///" + self.base_path + os.sep + consts.METADATA_DIR + os.sep + \
+                consts.DB_FILE
+
+            # All the writes go through this engine
+            self.__engine = sqa.create_engine(dbUrl, echo=engine_echo,
+                connect_args={"timeout": profile.busyTimeoutSec})
+            sqa.event.listen(self.__engine, "connect",
+                             lambda dbapiConn, connRecord: profile.applyTo(dbapiConn))
+            sqa.event.listen(self.__engine, "connect",
+                             lambda dbapiConn, connRecord: cancellation.installProgressHandler(dbapiConn))
+
+            db_migrations.upgrade(self.__engine)
+            conn = self.__engine.connect()
+            try:
+                self._hasFullTextIndex = db_migrations.hasFullTextIndex(conn)
+            finally:
+                conn.close()
+
+            # Pool of read-only connections. Pooled connections keep their SQLite page cache
+            # between units of work. In WAL journal mode readers never wait for writers.
+            self.__readEngine = sqa.create_engine(dbUrl, echo=engine_echo,
+                poolclass=sqa.pool.QueuePool,
+                pool_size=profile.readPoolSize,
+                connect_args={"timeout": profile.busyTimeoutSec, "check_same_thread": False,
+                              "cached_statements": consts.SQLITE_CACHED_STATEMENTS})
+            sqa.event.listen(self.__readEngine, "connect",
+                             lambda dbapiConn, connRecord: profile.applyTo(dbapiConn, readOnly=True))
+            sqa.event.listen(self.__readEngine, "connect",
+                             lambda dbapiConn, connRecord: cancellation.installProgressHandler(dbapiConn))
 
             self.Session = sessionmaker(bind=self.__engine)
+            sqa.event.listen(self.Session, "before_flush", DirectoryOperations.onBeforeFlush)
+            self.ReadSession = sessionmaker(bind=self.__readEngine, autoflush=False)
+
+            # Names of tags and fields are resolved to ids in memory (see NameCache)
+            self._tagNames = NameCache(Tag, self.__readEngine)
+            self._tagNames.attachTo(self.Session)
+            self._fieldNames = NameCache(Field, self.__readEngine)
+            self._fieldNames.attachTo(self.Session)
+
+            # Results of item queries are reused until the next commit (see QueryResultCache)
+            self._queryResults = QueryResultCache(int(UserConfig().get(
+                "query_result_cache_bytes", consts.QUERY_RESULT_CACHE_BYTES)))
+            self._queryResults.attachTo(self.Session)
         except Exception as ex:
             raise CannotOpenRepoError(ex)
 
     def __del__(self):
         pass
 
+    @property
+    def storageProfile(self):
+        return self._storageProfile
+
+    @property
+    def hasFullTextIndex(self):
+        '''
+            True if the repository database has full-text indexes of item titles and
+        field values (see db_migrations.AddFullTextIndexMigration).
+        '''
+        return self._hasFullTextIndex
+
+    @property
+    def tagNames(self):
+        '''
+            NameCache of all tags of the repository.
+        '''
+        return self._tagNames
+
+    @property
+    def fieldNames(self):
+        '''
+            NameCache of all fields of the repository.
+        '''
+        return self._fieldNames
+
+    @property
+    def queryResults(self):
+        '''
+            QueryResultCache of item queries of the repository.
+        '''
+        return self._queryResults
+
+    @property
+    def generation(self):
+        '''
+            Write generation of the repository, it is incremented after every commit.
+        '''
+        return self._queryResults.generation
+
     @property
     def base_path(self):
         '''
@@ -78,7 +166,9 @@ class RepoMgr(object):
 
 
     def createUnitOfWork(self):
-        return UnitOfWork(self.Session(), self.base_path)
+        return UnitOfWork(self.Session(), self.base_path, self.ReadSession,
+                          self._tagNames, self._fieldNames, self._hasFullTextIndex,
+                          self._queryResults)
 
 
 class UnitOfWork(object):
@@ -88,24 +178,116 @@ class UnitOfWork(object):
     '''
 
     #TODO Maybe argument repo_base_path should be moved to Command class ctor?..
-    def __init__(self, session, repo_base_path):
+    def __init__(self, session, repo_base_path, readSessionFactory=None,
+                 tagNames=None, fieldNames=None, hasFullTextIndex=False, queryResults=None):
         self._session = session
         self._repo_base_path = repo_base_path
+        self._readSessionFactory = readSessionFactory
+        self._readSession = None
+        self._tagNames = tagNames
+        self._fieldNames = fieldNames
+        self._hasFullTextIndex = hasFullTextIndex
+        self._queryResults = queryResults
 
     def __del__(self):
         if self._session is not None:
             self._session.close()
+        if self._readSession is not None and self._readSession is not self._session:
+            self._readSession.close()
 
     def close(self):
         self._session.expunge_all()
         self._session.close()
+        if self._readSession is not None and self._readSession is not self._session:
+            self._readSession.expunge_all()
+            self._readSession.close()
 
     @property
     def session(self):
+        '''
+            Session bound to the writer engine. Commands that modify the database
+        must use this session.
+        '''
         return self._session
 
-    def executeCommand(self, command):
-        return command._execute(self)
+    @property
+    def readSession(self):
+        '''
+            Session bound to the pool of read-only connections. Commands that only
+        read from the database should use this session. Note, that it doesn't see
+        changes made through session property until they are committed.
+        '''
+        if self._readSession is None:
+            self._readSession = self._readSessionFactory() \
+                if self._readSessionFactory is not None else self._session
+        return self._readSession
+
+    @property
+    def tagNames(self):
+        '''
+            NameCache of tags of the repository (see RepoMgr.tagNames).
+        '''
+        return self._tagNames
+
+    @property
+    def fieldNames(self):
+        '''
+            NameCache of fields of the repository (see RepoMgr.fieldNames).
+        '''
+        return self._fieldNames
+
+    @property
+    def hasFullTextIndex(self):
+        return self._hasFullTextIndex
+
+    @property
+    def queryResults(self):
+        '''
+            QueryResultCache of the repository (see RepoMgr.queryResults) or None.
+        '''
+        return self._queryResults
+
+    @staticmethod
+    def defaultTimeoutSec():
+        '''
+            Default time limit of read-only commands (see AbstractCommand.readOnly),
+        it is taken from reggata.conf. Zero means no limit.
+        '''
+        return float(UserConfig().get("query_timeout_sec", consts.QUERY_TIMEOUT_SEC))
+
+    def executeCommand(self, command, cancelToken=None, timeoutSec=None):
+        '''
+            Executes the command. If cancelToken (cancellation.CancelToken) is given,
+        the command can be cancelled from another thread. If the command runs longer
+        than timeoutSec seconds, it is cancelled too. When timeoutSec is None, read-only
+        commands get the default time limit (see defaultTimeoutSec()), other commands
+        get no limit. SQL statement being executed is interrupted on cancellation and
+        QueryCancelledError is raised.
+        '''
+        if timeoutSec is None and command.readOnly:
+            timeoutSec = UnitOfWork.defaultTimeoutSec()
+        if timeoutSec is not None and timeoutSec > 0:
+            cancelToken = cancellation.CancelToken(timeoutSec, parent=cancelToken)
+        if cancelToken is None:
+            return command._execute(self)
+
+        with cancellation.activated(cancelToken):
+            if cancelToken.isCancelled:
+                raise UnitOfWork.__cancelledError(cancelToken)
+            try:
+                return command._execute(self)
+            except sqa.exc.OperationalError as ex:
+                if cancelToken.isCancelled:
+                    raise UnitOfWork.__cancelledError(cancelToken, ex)
+                raise
+
+    @staticmethod
+    def __cancelledError(cancelToken, cause=None):
+        if cancelToken.isTimedOut:
+            return QueryCancelledError(
+                "Command was interrupted, because it ran longer than {} sec."
+                .format(cancelToken.timeoutSec), cause, timedOut=True)
+        return QueryCancelledError("Command was cancelled.", cause)
 
 
     # This fun is obsolete and deprecated
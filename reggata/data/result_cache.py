@@ -0,0 +1,91 @@
+'''
+Created on 18.10.2026
+
+Query result cache keeps results of recent item queries of a repository, so
+repeated queries of an unchanged repository are answered without SQL.
+'''
+import threading
+import sqlalchemy as sqa
+import reggata.helpers as helpers
+
+
+class QueryResultCache(object):
+    '''
+        LRU cache of query results with a memory budget. One instance is owned by
+    RepoMgr and is shared by all units of work (and threads).
+
+        The cache has a write generation: a number that is incremented after every
+    commit of a writer session (see attachTo()). All the cached results are dropped
+    when the generation changes. A result is stored together with the generation it
+    was computed in, and is not stored if a commit happened while it was computed.
+    Commits that change only thumbnails do not change the generation (see
+    keepResults()), that is why cached results must not contain thumbnails.
+
+        Changes made by other processes, that work with the same repository, are not
+    tracked.
+    '''
+    KEEP_RESULTS_KEY = "query_result_cache_keep_results"
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self._generation = 0
+        self._entries = helpers.LruCache(maxSize=maxBytes)
+        # Guards the generation, so a result of an old generation is never stored
+        self._lock = threading.Lock()
+
+    def attachTo(self, sessionFactory):
+        sqa.event.listen(sessionFactory, "after_commit", self.__onCommit)
+        sqa.event.listen(sessionFactory, "after_rollback", self.__onRollback)
+
+    @staticmethod
+    def keepResults(session):
+        '''
+            Marks the current transaction of session as one that doesn't change
+        results of item queries (e.g. it only saves thumbnails), its commit does not
+        drop cached results.
+        '''
+        session.info[QueryResultCache.KEEP_RESULTS_KEY] = True
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def hits(self):
+        return self._entries.hits
+
+    @property
+    def misses(self):
+        return self._entries.misses
+
+    def bumpGeneration(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def get(self, key):
+        '''
+            Returns a result stored with key in the current generation, or None.
+        '''
+        return self._entries.get(key)
+
+    def put(self, key, result, sizeInBytes, generation):
+        '''
+            Stores result, that was computed in the given generation. Results bigger
+        than the whole budget are not stored.
+        '''
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries.put(key, result, sizeInBytes)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __onCommit(self, session):
+        if session.info.pop(QueryResultCache.KEEP_RESULTS_KEY, False):
+            return
+        self.bumpGeneration()
+
+    def __onRollback(self, session):
+        session.info.pop(QueryResultCache.KEEP_RESULTS_KEY, None)
@@ -0,0 +1,77 @@
+'''
+Created on 18.10.2026
+
+Storage profile is a set of SQLite settings a repository database is opened with.
+'''
+from reggata.user_config import UserConfig
+import reggata.consts as consts
+
+
+class StorageProfile(object):
+    '''
+        SQLite settings of a repository database. Values are taken from reggata.conf
+    (keys "sqlite.*"), default values are in consts module.
+    '''
+    JOURNAL_MODES = ["DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"]
+    SYNCHRONOUS_MODES = ["OFF", "NORMAL", "FULL", "EXTRA"]
+    TEMP_STORES = ["DEFAULT", "FILE", "MEMORY"]
+
+    def __init__(self, journalMode=consts.SQLITE_JOURNAL_MODE,
+                 synchronous=consts.SQLITE_SYNCHRONOUS,
+                 mmapSize=consts.SQLITE_MMAP_SIZE,
+                 cacheSize=consts.SQLITE_CACHE_SIZE,
+                 tempStore=consts.SQLITE_TEMP_STORE,
+                 busyTimeoutSec=consts.SQLITE_BUSY_TIMEOUT_SEC,
+                 readPoolSize=consts.SQLITE_READ_POOL_SIZE):
+        self.journalMode = str(journalMode).upper()
+        if self.journalMode not in StorageProfile.JOURNAL_MODES:
+            raise ValueError("Unsupported sqlite.journal_mode value '{}'.".format(journalMode))
+
+        self.synchronous = str(synchronous).upper()
+        if self.synchronous not in StorageProfile.SYNCHRONOUS_MODES:
+            raise ValueError("Unsupported sqlite.synchronous value '{}'.".format(synchronous))
+
+        self.tempStore = str(tempStore).upper()
+        if self.tempStore not in StorageProfile.TEMP_STORES:
+            raise ValueError("Unsupported sqlite.temp_store value '{}'.".format(tempStore))
+
+        self.mmapSize = int(mmapSize)
+        self.cacheSize = int(cacheSize)
+        self.busyTimeoutSec = float(busyTimeoutSec)
+
+        self.readPoolSize = int(readPoolSize)
+        if self.readPoolSize < 1:
+            raise ValueError("sqlite.read_pool_size should be a positive number.")
+
+
+    @staticmethod
+    def fromUserConfig():
+        config = UserConfig()
+        return StorageProfile(
+            journalMode=config.get("sqlite.journal_mode", consts.SQLITE_JOURNAL_MODE),
+            synchronous=config.get("sqlite.synchronous", consts.SQLITE_SYNCHRONOUS),
+            mmapSize=config.get("sqlite.mmap_size", consts.SQLITE_MMAP_SIZE),
+            cacheSize=config.get("sqlite.cache_size", consts.SQLITE_CACHE_SIZE),
+            tempStore=config.get("sqlite.temp_store", consts.SQLITE_TEMP_STORE),
+            busyTimeoutSec=config.get("sqlite.busy_timeout_sec", consts.SQLITE_BUSY_TIMEOUT_SEC),
+            readPoolSize=config.get("sqlite.read_pool_size", consts.SQLITE_READ_POOL_SIZE))
+
+
+    def applyTo(self, dbapiConnection, readOnly=False):
+        '''
+            Executes PRAGMA statements of this profile on a just opened DBAPI
+        (sqlite3 module) connection. Journal mode is persistent and is changed
+        only through writer connections.
+        '''
+        cursor = dbapiConnection.cursor()
+        try:
+            if not readOnly:
+                cursor.execute("PRAGMA journal_mode = {}".format(self.journalMode))
+            cursor.execute("PRAGMA synchronous = {}".format(self.synchronous))
+            cursor.execute("PRAGMA mmap_size = {}".format(self.mmapSize))
+            cursor.execute("PRAGMA cache_size = {}".format(self.cacheSize))
+            cursor.execute("PRAGMA temp_store = {}".format(self.tempStore))
+            if readOnly:
+                cursor.execute("PRAGMA query_only = ON")
+        finally:
+            cursor.close()
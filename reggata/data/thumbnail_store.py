@@ -0,0 +1,91 @@
+'''
+Created on 18.10.2026
+
+Thumbnail store keeps image thumbnails as files in the .reggata/thumbs directory
+of a repository. Database table thumbnails contains only metadata of them.
+'''
+import os
+import re
+import mmap
+import hashlib
+import tempfile
+import reggata.consts as consts
+
+
+class ThumbnailStore(object):
+    '''
+        Content-addressed storage of thumbnails. A thumbnail file is identified by
+    hash of the DataRef file and by thumbnail size, so when a file is changed its
+    old thumbnail is not found anymore. Files are sharded into subdirectories by
+    the first two characters of the key:
+
+        .reggata/thumbs/<key[0:2]>/<key>_<size>.jpg
+    '''
+    SHA1_HEX = re.compile("^[0-9a-f]{40}$")
+
+    def __init__(self, repoBasePath):
+        self._rootPath = os.path.join(repoBasePath, consts.METADATA_DIR, consts.THUMBNAILS_DIR)
+
+    @property
+    def rootPath(self):
+        return self._rootPath
+
+    @staticmethod
+    def key(dataRefHash):
+        '''
+            Returns a file system safe key for given DataRef hash. Hashes of big files
+        are partial and have a prefix (see helpers.computeFileHash), such hashes are
+        hashed once more.
+        '''
+        if dataRefHash is None:
+            raise ValueError("DataRef without hash cannot have a thumbnail in the store.")
+        if ThumbnailStore.SHA1_HEX.match(dataRefHash):
+            return dataRefHash
+        return hashlib.sha1(dataRefHash.encode("utf-8")).hexdigest()
+
+    def path(self, dataRefHash, size):
+        key = ThumbnailStore.key(dataRefHash)
+        return os.path.join(self._rootPath, key[0:2], "{}_{}.jpg".format(key, int(size)))
+
+    def contains(self, dataRefHash, size):
+        return os.path.exists(self.path(dataRefHash, size))
+
+    def read(self, dataRefHash, size):
+        '''
+            Returns contents of the thumbnail file as bytes, or None if there is
+        no such thumbnail in the store.
+        '''
+        path = self.path(dataRefHash, size)
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    return m[:]
+        except (IOError, OSError):
+            return None
+
+    def write(self, dataRefHash, size, data):
+        '''
+            Saves thumbnail data to the store. File is replaced atomically, so concurrent
+        readers never see a partially written thumbnail.
+        '''
+        path = self.path(dataRefHash, size)
+        dirPath = os.path.dirname(path)
+        if not os.path.exists(dirPath):
+            os.makedirs(dirPath)
+        fd, tmpPath = tempfile.mkstemp(dir=dirPath, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmpPath, path)
+        except:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+        return path
+
+    def remove(self, dataRefHash, size):
+        path = self.path(dataRefHash, size)
+        if os.path.exists(path):
+            os.remove(path)
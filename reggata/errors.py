@@ -63,6 +63,15 @@ class YaccError(Exception):
         super(YaccError, self).__init__(msg)
         self.cause = cause
 
+class QueryCancelledError(Exception):
+    '''This exception is raised by UnitOfWork.executeCommand() when execution of
+    the command is cancelled with its CancelToken or when the command runs out of
+    time (timedOut is True then).'''
+    def __init__(self, msg=None, cause=None, timedOut=False):
+        super(QueryCancelledError, self).__init__(msg)
+        self.cause = cause
+        self.timedOut = timedOut
+
 class NotFoundError(Exception):
     def __init__(self, msg=None, cause=None):
         super(NotFoundError, self).__init__(msg)
@@ -318,7 +318,7 @@ class Completer(QtGui.QListWidget):
 
     def filter(self, prefix):
         self.clear()
-        for (word,) in self.words:
+        for word in self.words:
             if word.startswith(prefix):
                 self.addItem(word)
         self.setCurrentRow(0)
@@ -245,6 +245,8 @@ class FileBrowserTableModel(UnivTableModel):
 
         def formatItemIds(row, finfo, role):
             if role == Qt.DisplayRole:
+                if finfo.isDir():
+                    return self.tr("{} items").format(finfo.itemCount) if finfo.itemCount else None
                 return helpers.to_commalist(finfo.itemIds)
             return None
         self.registerColumn(UnivTableColumn(self.ITEM_IDS, self.tr("Items' Ids"), formatItemIds,
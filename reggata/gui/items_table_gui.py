@@ -15,7 +15,9 @@ import reggata.data.commands as cmds
 import reggata.statistics as stats
 import reggata.data.db_schema as db
 from reggata.gui.common_widgets import TextEdit
-from reggata.logic.worker_threads import ThumbnailBuilderThread
+from reggata.gui.my_message_box import MyMessageBox
+from reggata.logic.worker_threads import ThumbnailBuilderThread, QueryItemsThread
+from reggata.data.thumbnail_store import ThumbnailStore
 from reggata.gui.tool_gui import ToolGui
 from reggata.ui.ui_itemstablegui import Ui_ItemsTableGui
 from reggata.user_config import UserConfig
@@ -47,10 +49,11 @@ class ItemsTableGui(ToolGui):
         tmp.addWidget(self.ui.lineEdit_query)
         self.connect(self.ui.pushButton_query_exec, QtCore.SIGNAL("clicked()"), self.query_exec)
         self.connect(self.ui.lineEdit_query, QtCore.SIGNAL("returnPressed()"), self.ui.pushButton_query_exec.click)
+        self.connect(QtGui.QShortcut(QtGui.QKeySequence("Ctrl+Shift+Return"), self.ui.lineEdit_query),
+                     QtCore.SIGNAL("activated()"), self.query_profile)
         self.connect(self.ui.pushButton_query_reset, QtCore.SIGNAL("clicked()"), self.query_reset)
         self.connect(self._itemsTableView, QtCore.SIGNAL("doubleClicked(const QModelIndex&)"), self.__onTableDoubleClicked)
 
-        #TODO limit page function sometimes works not correct!!! It sometimes shows less items, than specified in limit spinbox!
         #Initialization of limit and page spinboxes
         self.ui.spinBox_limit.setValue(int(UserConfig().get("spinBox_limit.value", 0)))
         self.ui.spinBox_limit.setSingleStep(int(UserConfig().get("spinBox_limit.step", 5)))
@@ -77,11 +80,15 @@ class ItemsTableGui(ToolGui):
         if model is not None:
             self.connect(model, QtCore.SIGNAL("modelReset()"), self._itemsTableView.resizeRowsToContents)
             self.connect(model, QtCore.SIGNAL("dataChanged(const QModelIndex&, const QModelIndex&)"), self._resize_row_to_contents)
+            self.connect(model, QtCore.SIGNAL("queryFinished"), self.__onQueryFinished)
+            self.connect(model, QtCore.SIGNAL("queryFailed"), self.__onQueryFailed)
 
     itemsTableModel = property(fget=__getTableModel, fset=__setTableModel)
 
 
     def update(self):
+        if self.__table_model is not None:
+            self.__table_model.resetPages()
         self.query_exec()
 
 
@@ -96,8 +103,6 @@ class ItemsTableGui(ToolGui):
 
             self.__table_model.query(query_text, limit, page)
 
-            self.resize_rows_to_contents()
-
             stats.sendEvent("items_table.query_exec")
 
 
@@ -106,6 +111,50 @@ class ItemsTableGui(ToolGui):
             helpers.show_exc_info(self, ex)
 
 
+    def __onQueryFinished(self):
+        self.__updatePageCount()
+        self.resize_rows_to_contents()
+
+
+    def __onQueryFailed(self, tracebackText):
+        logger.warning(tracebackText)
+        helpers.show_exc_info(self, errors.MsgException(self.tr("Query failed.")),
+                              details=tracebackText)
+
+
+    def __updatePageCount(self):
+        itemCount = self.__table_model.itemCount
+        limit = self.query_limit()
+        if itemCount is None or limit <= 0:
+            self.ui.spinBox_page.setSuffix("")
+            return
+        pageCount = max(1, (itemCount + limit - 1) // limit)
+        self.ui.spinBox_page.setSuffix(self.tr(" of {}").format(pageCount))
+
+
+    def query_profile(self):
+        '''
+            Executes the query and shows where the time was spent (see cmds.ProfileQueryCommand).
+        '''
+        try:
+            if self.__table_model is None:
+                raise errors.MsgException(self.tr("Items Table Widget has no Model."))
+
+            profile = self.__table_model.profileQuery(self.query_text(), self.query_limit(),
+                                                      self.query_page())
+            logger.info(profile.format())
+
+            mb = MyMessageBox(self)
+            mb.setWindowTitle(self.tr("Query profile"))
+            mb.setText(profile.summary())
+            mb.setDetailedText(profile.format())
+            mb.exec_()
+
+        except Exception as ex:
+            logger.warning(str(ex))
+            helpers.show_exc_info(self, ex)
+
+
     def query_reset(self):
         if self.__table_model is not None:
             self.__table_model.query("")
@@ -358,6 +407,7 @@ class ItemsTableModel(UnivTableModel):
         self._repo = repo
         self._lock = lock
         self.userLogin = userLogin
+        self._thumbnailStore = ThumbnailStore(repo.base_path) if repo is not None else None
 
         #This is a thread for building image thumbnails in the background
         self._thread = None
@@ -367,6 +417,33 @@ class ItemsTableModel(UnivTableModel):
         self.page = 1
         self.orderByColumnId = None
         self.orderDir = None
+
+        # Sort keys of the last items of fetched pages: {pageNumber: after}, where
+        # after is a key that the page with pageNumber starts after. They are valid
+        # for the query, limit and order in self._pageAfterQuery
+        self._pageAfter = dict()
+        self._pageAfterQuery = None
+
+        # Number of items that match the last query, it is counted only when the
+        # result is split into pages
+        self.itemCount = None
+
+        # When the result is not split into pages (limit is 0), items are fetched in
+        # batches while the table is scrolled (see fetchMore()). This is a pair
+        # (createCommand, after) to fetch the next batch, or None if all items are fetched
+        self._nextBatch = None
+
+        # Queries are executed in background (see __startQuery()). Every query gets a
+        # new generation number, results of superseded queries are dropped
+        self._queryThread = None
+        self._queryGeneration = 0
+
+        # When the result is split into pages, pages adjacent to the shown one are
+        # fetched in background (see __prefetchPages()): {pageNumber: (items,
+        # nextPageAfter)}. They are valid for the query in self._pageAfterQuery
+        self._prefetched = dict()
+        self._prefetchThread = None
+        self._prefetchGeneration = 0
         self.createColumns()
 
 
@@ -415,7 +492,12 @@ class ItemsTableModel(UnivTableModel):
                 try:
                     self._lock.lockForRead()
                     if len(item.data_ref.thumbnails) > 0:
-                        pixmap.loadFromData(item.data_ref.thumbnails[0].data)
+                        thumbnail = item.data_ref.thumbnails[0]
+                        if thumbnail.data is None:
+                            thumbnail.data = self._thumbnailStore.read(item.data_ref.hash,
+                                                                       thumbnail.size)
+                        if thumbnail.data is not None:
+                            pixmap.loadFromData(thumbnail.data)
                 except Exception:
                     traceback.format_exc()
                 finally:
@@ -477,16 +559,21 @@ class ItemsTableModel(UnivTableModel):
             oldValue = item.getFieldValue(consts.RATING_FIELD, self.userLogin)
             if oldValue == value:
                 return False
-            item.setFieldValue(consts.RATING_FIELD, value, self.userLogin)
+            # item is a read-only ItemRow, so the Item object is fetched to be updated
             uow = self._repo.createUnitOfWork()
             try:
-                srcAbsPath = os.path.join(self._repo.base_path, item.data_ref.url) if item.data_ref is not None else None
-                dstRelPath = item.data_ref.url if item.data_ref is not None else None
-                cmd = cmds.UpdateExistingItemCommand(item, srcAbsPath, dstRelPath, self.userLogin)
+                persistentItem = uow.executeCommand(cmds.GetExpungedItemCommand(item.id))
+                persistentItem.setFieldValue(consts.RATING_FIELD, value, self.userLogin)
+                dataRef = persistentItem.data_ref
+                srcAbsPath = os.path.join(self._repo.base_path, dataRef.url) if dataRef is not None else None
+                dstRelPath = dataRef.url if dataRef is not None else None
+                cmd = cmds.UpdateExistingItemCommand(persistentItem, srcAbsPath, dstRelPath, self.userLogin)
                 uow.executeCommand(cmd)
+                # Prefetched pages may be ordered by the old rating
+                self.resetPrefetchedPages()
+                item.setFieldValue(consts.RATING_FIELD, value, self.userLogin)
                 return True
             except:
-                item.setFieldValue(consts.RATING_FIELD, oldValue, self.userLogin)
                 return False
             finally:
                 uow.close()
@@ -505,15 +592,23 @@ class ItemsTableModel(UnivTableModel):
         self.orderByColumnId = column.id
         self.orderDir = order
 
-        self.query(self.queryText, self.limit, self.page)
+        # When all the found items are already fetched, they are sorted in memory,
+        # otherwise the order of the next page (or batch) depends on the new order
+        allItemsFetched = self.limit <= 0 and self._nextBatch is None \
+            and self._queryThread is None
+        if allItemsFetched:
+            self.__sortFetchedItems()
+        else:
+            self.query(self.queryText, self.limit, self.page)
 
 
-    def query(self, queryText, limit=0, page=1):
+    def __sortFetchedItems(self):
+        items = cmds.AbstractItemRowsCommand.sortRows(self._objs, self._orderBy())
+        self.__setTableRows(items, 0)
+        self.setObjs(items)
 
-        self.queryText = queryText
-        self.limit = limit
-        self.page = page
 
+    def _orderBy(self):
         directory = "ASC" if self.orderDir == Qt.AscendingOrder else "DESC"
 
         orderBy = []
@@ -522,40 +617,272 @@ class ItemsTableModel(UnivTableModel):
                 orderBy.append(("id", directory))
             elif self.orderByColumnId == self.TITLE:
                 orderBy.append(("title", directory))
-            #This is not exactly sorting by pure rating, but by fields and their values...
             elif self.orderByColumnId == self.RATING:
-                orderBy.append(("items_fields_field_id", "DESC"))
-                orderBy.append(("items_fields_field_value", directory))
+                orderBy.append(("field:" + consts.RATING_FIELD, directory))
+        return orderBy
+
+
+    def profileQuery(self, queryText, limit=0, page=1):
+        uow = self._repo.createUnitOfWork()
+        try:
+            return uow.executeCommand(cmds.ProfileQueryCommand(queryText, limit, page,
+                                                               self._orderBy()))
+        except (errors.YaccError, errors.LexError) as ex:
+            raise errors.MsgException(self.tr("Error in the query. Detail info: {}").format(str(ex)))
+        finally:
+            uow.close()
 
 
+    @staticmethod
+    def _fetchSize():
+        return int(UserConfig().get("items_table.fetch_size", consts.ITEMS_TABLE_FETCH_SIZE))
+
+
+    def canFetchMore(self, index=QtCore.QModelIndex()):
+        return self._nextBatch is not None
+
+
+    def fetchMore(self, index=QtCore.QModelIndex()):
+        if self._nextBatch is None:
+            return
+        createCommand, after = self._nextBatch
+        self._nextBatch = None # Until this batch is fetched
+        fetchSize = self._fetchSize()
+
+        def fetch(uow, cancelToken):
+            cmd = createCommand(fetchSize, 1, after)
+            return (uow.executeCommand(cmd, cancelToken), cmd.nextPageAfter)
+
+        def appendItems(result):
+            items, nextPageAfter = result
+            if len(items) == fetchSize and nextPageAfter is not None:
+                self._nextBatch = (createCommand, nextPageAfter)
+            self.__setTableRows(items, self.rowCount())
+            self.appendObjs(items)
+            self.__startThumbnailBuilder(items)
+
+        self.__startQuery(fetch, appendItems)
+
+
+    def __setTableRows(self, items, firstRow):
+        for i, item in enumerate(items):
+            item.table_row = firstRow + i
+
+
+    def __stopThumbnailBuilder(self):
+        # The thread is not waited for, it stops after the item it is processing now
+        if self._thread is not None:
+            self._thread.interrupt = True
+            self._thread = None
+
+
+    def __startThumbnailBuilder(self, items):
+        if self._thread is not None and self._thread.addItems(items):
+            return
+
         def resetRow(row):
+            if row is None:
+                return # Item of a prefetched page, that is not shown yet
             self.resetSingleRow(row)
             QtCore.QCoreApplication.processEvents()
 
-        uow = self._repo.createUnitOfWork()
-        items = []
-        try:
-            if self._thread is not None and self._thread.isRunning():
-                self._thread.interrupt = True
-                self._thread.wait(5*1000)
+        self._thread = ThumbnailBuilderThread(self, self._repo, items, self._lock)
+        self.connect(self._thread, QtCore.SIGNAL("progress"), lambda percents, row: resetRow(row))
+        self.connect(self._thread, QtCore.SIGNAL("finished()"), self._thread.deleteLater)
+        self._thread.start()
+
+
+    def __cancelQuery(self):
+        if self._queryThread is not None:
+            self._queryThread.cancel()
+            self._queryThread = None
+        self._queryGeneration += 1
+
+
+    def __startQuery(self, fetch, onFinished):
+        '''
+            Cancels the running query (if any) and executes fetch(uow, cancelToken) in
+        a QueryItemsThread. onFinished(result) is called in GUI thread, only if no other
+        query was started in the meantime.
+        '''
+        self.__cancelQuery()
+        generation = self._queryGeneration
+
+        def queryFinished(threadGeneration, result):
+            if threadGeneration == self._queryGeneration:
+                self._queryThread = None
+                onFinished(result)
+
+        def queryFailed(tracebackText):
+            if generation == self._queryGeneration:
+                self._queryThread = None
+                self.emit(QtCore.SIGNAL("queryFailed"), tracebackText)
+
+        thread = QueryItemsThread(self, self._repo, generation, fetch)
+        self.connect(thread, QtCore.SIGNAL("queryFinished"), queryFinished)
+        self.connect(thread, QtCore.SIGNAL("exception"), queryFailed)
+        self.connect(thread, QtCore.SIGNAL("finished()"), thread.deleteLater)
+        self._queryThread = thread
+        thread.start()
+
+
+    def __cancelPrefetch(self):
+        if self._prefetchThread is not None:
+            self._prefetchThread.cancel()
+            self._prefetchThread = None
+        self._prefetchGeneration += 1
+
+
+    def resetPrefetchedPages(self):
+        '''
+            Drops prefetched pages, call it when items in the repository are changed.
+        '''
+        self.__cancelPrefetch()
+        self._prefetched = dict()
+
+
+    def resetPages(self):
+        '''
+            Forgets the number of found items, keys of pages and prefetched pages. Call
+        it when items in the repository are changed, the next query counts items again.
+        '''
+        self._pageAfter = dict()
+        self._pageAfterQuery = None
+        self.itemCount = None
+        self.resetPrefetchedPages()
+
+
+    def __prefetchPages(self, createCommand, limit, page):
+        '''
+            Fetches the pages next to the shown page in background, together with data
+        of their thumbnails. Thumbnails, that are missing, are built for them too. A page
+        that was prefetched is shown without querying the database (see query()).
+        '''
+        self.__cancelPrefetch()
+        self._prefetched = dict((p, prefetched) for p, prefetched in self._prefetched.items()
+                                if abs(p - page) <= 1)
+        pages = [p for p in [page + 1, page - 1]
+                 if p >= 1 and p not in self._prefetched
+                 and (self.itemCount is None or (p - 1)*limit < self.itemCount)]
+        if len(pages) == 0:
+            return
+        afters = dict((p, self._pageAfter.get(p)) for p in pages)
+        thumbnailStore = self._thumbnailStore
+
+        def fetch(uow, cancelToken):
+            result = []
+            for p in pages:
+                cmd = createCommand(limit, p, afters[p])
+                items = uow.executeCommand(cmd, cancelToken)
+                for item in items:
+                    if cancelToken.isCancelled:
+                        break
+                    if item.data_ref is not None and len(item.data_ref.thumbnails) > 0:
+                        thumbnail = item.data_ref.thumbnails[0]
+                        thumbnail.data = thumbnailStore.read(item.data_ref.hash, thumbnail.size)
+                result.append((p, items, cmd.nextPageAfter))
+            return result
+
+        def prefetchFinished(threadGeneration, result):
+            if threadGeneration != self._prefetchGeneration:
+                return
+            self._prefetchThread = None
+            for p, items, nextPageAfter in result:
+                self._prefetched[p] = (items, nextPageAfter)
+                if nextPageAfter is not None:
+                    self._pageAfter[p + 1] = nextPageAfter
+                self.__startThumbnailBuilder(items)
+
+        def prefetchFailed(tracebackText):
+            # Pages are fetched again, when they are shown
+            logger.warning("Prefetch of pages {} failed".format(pages))
+
+        thread = QueryItemsThread(self, self._repo, self._prefetchGeneration, fetch)
+        self.connect(thread, QtCore.SIGNAL("queryFinished"), prefetchFinished)
+        self.connect(thread, QtCore.SIGNAL("exception"), prefetchFailed)
+        self.connect(thread, QtCore.SIGNAL("finished()"), thread.deleteLater)
+        self._prefetchThread = thread
+        thread.start()
+
+
+    def query(self, queryText, limit=0, page=1):
+        '''
+            Starts the query in background and returns. Signal "queryFinished" is emitted
+        when the found items are set to the model, signal "queryFailed" (traceback text)
+        is emitted if the query fails. A query cancels the previous one, if it is still
+        running. Errors in the query text are raised immediately as MsgException.
+
+            A page that was prefetched (see __prefetchPages()) is shown at once, before
+        this function returns.
+        '''
+        self.queryText = queryText
+        self.limit = limit
+        self.page = page
 
+        orderBy = self._orderBy()
+
+        pageAfterQuery = (queryText, limit, tuple(orderBy))
+        if pageAfterQuery != self._pageAfterQuery:
+            self._pageAfter = dict()
+            self._pageAfterQuery = pageAfterQuery
+            self.itemCount = None
+            self.resetPrefetchedPages()
+        # A page that follows an already fetched page is fetched by the key of its last
+        # item (it costs the same for any page), other pages are fetched by offset
+        after = self._pageAfter.get(page) if limit > 0 else None
+
+        try:
             if queryText is None or queryText.strip()=="":
-                items = uow.executeCommand(cmds.GetUntaggedItems(limit, page, orderBy))
+                createCommand = lambda limit, page, after: \
+                    cmds.GetUntaggedItems(limit, page, orderBy, after)
+                countCmd = cmds.CountUntaggedItems()
             else:
                 queryTree = query_parser.parse(queryText)
-                cmd = cmds.QueryItemsByParseTree(queryTree, limit, page, orderBy)
-                items = uow.executeCommand(cmd)
-
-            self._thread = ThumbnailBuilderThread(self, self._repo, items, self._lock)
-            self.connect(self._thread, QtCore.SIGNAL("progress"), lambda percents, row: resetRow(row))
-            self._thread.start()
-
+                createCommand = lambda limit, page, after: \
+                    cmds.QueryItemsByParseTree(queryTree, limit, page, orderBy, after)
+                countCmd = cmds.CountItemsByParseTree(queryTree)
         except (errors.YaccError, errors.LexError) as ex:
             raise errors.MsgException(self.tr("Error in the query. Detail info: {}").format(str(ex)))
 
-        finally:
-            uow.close()
+        # When the result is not split into pages, only the first batch is fetched now,
+        # the view asks for more with fetchMore()
+        fetchSize = limit if limit > 0 else self._fetchSize()
+        if limit <= 0:
+            page = 1
+        countItems = limit > 0 and self.itemCount is None
+
+        def fetch(uow, cancelToken):
+            cmd = createCommand(fetchSize, page, after)
+            items = uow.executeCommand(cmd, cancelToken)
+            itemCount = uow.executeCommand(countCmd, cancelToken) if countItems else None
+            return (items, cmd.nextPageAfter, itemCount)
+
+        def setItems(result):
+            items, nextPageAfter, itemCount = result
+            if limit > 0:
+                if itemCount is not None:
+                    self.itemCount = itemCount
+                if nextPageAfter is not None:
+                    self._pageAfter[page + 1] = nextPageAfter
+            elif len(items) == fetchSize and nextPageAfter is not None:
+                self._nextBatch = (createCommand, nextPageAfter)
+
+            self.__stopThumbnailBuilder()
+            self.__setTableRows(items, 0)
             self.setObjs(items)
+            self.__startThumbnailBuilder(items)
+            self.emit(QtCore.SIGNAL("queryFinished"))
+            if limit > 0:
+                self.__prefetchPages(createCommand, limit, page)
+
+        self._nextBatch = None
+        prefetched = self._prefetched.pop(page, None) if limit > 0 else None
+        if prefetched is not None:
+            self.__cancelQuery()
+            items, nextPageAfter = prefetched
+            setItems((items, nextPageAfter, None))
+        else:
+            self.__startQuery(fetch, setItems)
 
     def isOpenItemActionAllowed(self, index):
         c = self.column(index.column())
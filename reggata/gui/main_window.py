@@ -9,12 +9,9 @@ from PyQt4 import QtGui, QtCore
 import reggata.consts as consts
 import reggata.helpers as helpers
 import reggata.errors as errors
-import reggata.data.repo_mgr as repo
 from reggata.logic.abstract_gui import AbstractGui
 from reggata.logic.main_window_model import MainWindowModel
-from reggata.logic.items_table import ItemsTable
 from reggata.logic.handler_signals import HandlerSignals
-from reggata.gui.user_dialogs_facade import UserDialogsFacade
 from reggata.ui.ui_mainwindow import Ui_MainWindow
 from reggata.user_config import UserConfig
 
@@ -23,7 +20,8 @@ logger = logging.getLogger(__name__)
 
 class MainWindow(QtGui.QMainWindow, AbstractGui):
     '''
-        Reggata's main window.
+        Reggata's main window. Tools, dialogs and the data layer (SQLAlchemy, parsers)
+    are not imported by the constructor, call initTools() after the window is shown.
     '''
     def __init__(self, parent=None):
         super(MainWindow, self).__init__(parent)
@@ -34,7 +32,7 @@ class MainWindow(QtGui.QMainWindow, AbstractGui):
         # TODO: updateManager should be moved to MainWindowModel
         self.__widgetsUpdateManager = WidgetsUpdateManager()
 
-        self.__dialogs = UserDialogsFacade()
+        self.__dialogs = None
 
         self._model = MainWindowModel(mainWindow=self, repo=None, user=None,
                                       guiUpdater=self.__widgetsUpdateManager)
@@ -54,6 +52,15 @@ class MainWindow(QtGui.QMainWindow, AbstractGui):
             self, self.showMessageOnStatusBar,
             [HandlerSignals.STATUS_BAR_MESSAGE])
 
+        self.__restoreWindowSize()
+
+
+    def initTools(self):
+        '''
+            Creates tools with their dock widgets, restores their state and opens
+        recent repository.
+        '''
+        self._model.initTools()
         self.__restoreGuiState()
 
 
@@ -61,6 +68,9 @@ class MainWindow(QtGui.QMainWindow, AbstractGui):
         return self.__widgetsUpdateManager
 
     def dialogsFacade(self):
+        if self.__dialogs is None:
+            from reggata.gui.user_dialogs_facade import UserDialogsFacade
+            self.__dialogs = UserDialogsFacade()
         return self.__dialogs
 
     def initDockWidgetForTool(self, aTool):
@@ -109,7 +119,14 @@ class MainWindow(QtGui.QMainWindow, AbstractGui):
         UserConfig().storeAll({"main_window.width":self.width(), "main_window.height":self.height()})
 
 
+    def __restoreWindowSize(self):
+        width = int(UserConfig().get("main_window.width", 640))
+        height = int(UserConfig().get("main_window.height", 480))
+        self.resize(width, height)
+
+
     def __restoreGuiState(self):
+        import reggata.data.repo_mgr as repo
 
         self._model.restoreRecentState()
 
@@ -128,11 +145,6 @@ class MainWindow(QtGui.QMainWindow, AbstractGui):
         except Exception:
             self.ui.statusbar.showMessage(self.tr("Cannot open/login recent repository."), consts.STATUSBAR_TIMEOUT)
 
-        #Restoring main window size
-        width = int(UserConfig().get("main_window.width", 640))
-        height = int(UserConfig().get("main_window.height", 480))
-        self.resize(width, height)
-
         #Restoring all dock widgets position and size
         state = UserConfig().get("main_window.state")
         if state:
@@ -221,17 +233,21 @@ class MainWindow(QtGui.QMainWindow, AbstractGui):
             self.ui.statusbar.showMessage(text)
 
     #TODO: This functions should be removed from MainWindow to Tools
+    def __itemsTableGui(self):
+        from reggata.logic.items_table import ItemsTable
+        return self._model.toolById(ItemsTable.TOOL_ID).gui
+
     def selectedRows(self):
-        return self._model.toolById(ItemsTable.TOOL_ID).gui.selectedRows()
+        return self.__itemsTableGui().selectedRows()
 
     def itemAtRow(self, row):
-        return self._model.toolById(ItemsTable.TOOL_ID).gui.itemsTableModel.items[row]
+        return self.__itemsTableGui().itemsTableModel.items[row]
 
     def rowCount(self):
-        return self._model.toolById(ItemsTable.TOOL_ID).gui.itemsTableModel.rowCount()
+        return self.__itemsTableGui().itemsTableModel.rowCount()
 
     def resetSingleRow(self, row):
-        return self._model.toolById(ItemsTable.TOOL_ID).gui.itemsTableModel.resetSingleRow(row)
+        return self.__itemsTableGui().itemsTableModel.resetSingleRow(row)
 
     def selectedItemIds(self):
         #Maybe we should use this fun only, and do not use rows outside the GUI code
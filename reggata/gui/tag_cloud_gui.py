@@ -3,19 +3,23 @@
 Created on 13.11.2010
 @author: vlkv
 '''
+import logging
 import PyQt4.QtCore as QtCore
 import PyQt4.QtGui as QtGui
 from PyQt4.QtCore import Qt
 import reggata.parsers as parsers
 import reggata.statistics as stats
 from reggata.helpers import show_exc_info, is_none_or_empty
-from reggata.errors import MsgException
+from reggata.errors import MsgException, QueryCancelledError
 from reggata.user_config import UserConfig
 from reggata.data.commands import GetRelatedTagsCommand
 from reggata.logic.abstract_tool_gui import AbstractToolGui
 from reggata.gui.tool_gui import ToolGui
 
 
+logger = logging.getLogger(__name__)
+
+
 def scale_value(value, src_range, dst_range):
     '''
         Scales 'value' from range [src_range[0], src_range[1]]
@@ -140,7 +144,13 @@ class TagCloudTextEdit(QtGui.QTextEdit):
         uow = self.repo.createUnitOfWork()
         try:
             cmd = GetRelatedTagsCommand(list(self.tags), limit=self.limit)
-            tags = uow.executeCommand(cmd)
+            try:
+                tags = uow.executeCommand(cmd)
+            except QueryCancelledError as ex:
+                # Related tags of many selected tags could take too long to compute,
+                # the cloud is left with the 'ALL' keyword only then
+                logger.warning(str(ex))
+                tags = []
 
             self.tag_count = tags
 
@@ -112,6 +112,18 @@ class UnivTableModel(QtCore.QAbstractTableModel):
         self._objs = objs
         self.reset()
 
+    def appendObjs(self, objs):
+        '''
+            Adds objs to the end of the table. Views keep their selection and scroll
+        position, unlike after setObjs().
+        '''
+        if len(objs) == 0:
+            return
+        firstRow = len(self._objs)
+        self.beginInsertRows(QtCore.QModelIndex(), firstRow, firstRow + len(objs) - 1)
+        self._objs = self._objs + list(objs)
+        self.endInsertRows()
+
     # rowIndex is a visible index of a row in a table
     def objAtRow(self, rowIndex):
         return self._objs[rowIndex]
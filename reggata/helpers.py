@@ -14,7 +14,10 @@ import os
 import hashlib
 import platform
 import math
+import re
 import logging
+import threading
+import collections
 import reggata.consts as consts
 from reggata.gui.my_message_box import MyMessageBox
 
@@ -129,6 +132,29 @@ def is_none_or_empty(s):
         return True if s == "" else False
 
 
+# Decimal number with optional sign and exponent, surrounded by optional whitespace.
+# Python float() accepts more than that (e.g. "1_000" or non-ASCII digits)
+_NUMBER_RE = re.compile(r"^\s*[-+]?([0-9]+(\.[0-9]*)?|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$")
+
+def parseNumber(s):
+    '''
+        Returns float value of a string, or None if the string is not a finite number.
+    '''
+    if s is None:
+        return None
+    if not isinstance(s, str):
+        s = str(s)
+    if _NUMBER_RE.match(s) is None:
+        return None
+    try:
+        number = float(s)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(number) or math.isinf(number):
+        return None
+    return number
+
+
 def stringToBool(s):
     return bool(s in ["True", "true", "TRUE", "1", "Yes", "yes", "YES"])
 
@@ -208,6 +234,64 @@ def computePasswordHash(strPassword):
     return hashlib.sha1(byteData).hexdigest()
 
 
+class LruCache(object):
+    '''
+        Thread safe dict with a limited number of entries and (optionally) a limited
+    total size of values. Size of a value is given to put(). When the cache is full,
+    the least recently used entries are removed. Counts hits and misses of get().
+    '''
+    def __init__(self, capacity=None, maxSize=None):
+        if capacity is not None and capacity < 1:
+            raise ValueError("Capacity of LruCache should be a positive number.")
+        if capacity is None and maxSize is None:
+            raise ValueError("LruCache should have a capacity or a max size.")
+        self.capacity = capacity
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict() # {key: (value, size)}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value, size=0):
+        '''
+            Stores value with key. A value bigger than maxSize is not stored.
+        '''
+        with self._lock:
+            if self.maxSize is not None and size > self.maxSize:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while (self.capacity is not None and len(self._entries) > self.capacity) or \
+                    (self.maxSize is not None and self._size > self.maxSize):
+                _oldKey, (_oldValue, oldSize) = self._entries.popitem(last=False)
+                self._size -= oldSize
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+
 class ImageThumbDelegate(QtGui.QStyledItemDelegate):
     '''
         This is an ItemDelegate for rendering an image thumbnail in Items Table Tool.
@@ -36,6 +36,39 @@ class ActionHandlerStorage():
 
 
 
+class LazyActionHandler():
+    '''
+        Creates an action handler with handlerFactory when the action is triggered
+    for the first time. It allows not to import modules of handlers (and all the
+    modules they depend on) before they are really needed.
+    '''
+    def __init__(self, handlerFactory):
+        self.__handlerFactory = handlerFactory
+        self.__handler = None
+        self.__widgetsUpdateManager = None
+
+    def handler(self):
+        if self.__handler is None:
+            self.__handler = self.__handlerFactory()
+            if self.__widgetsUpdateManager is not None:
+                self.__handler.connectSignals(self.__widgetsUpdateManager)
+        return self.__handler
+
+    def handle(self):
+        self.handler().handle()
+
+    def connectSignals(self, widgetsUpdateManager):
+        self.__widgetsUpdateManager = widgetsUpdateManager
+        if self.__handler is not None:
+            self.__handler.connectSignals(widgetsUpdateManager)
+
+    def disconnectSignals(self, widgetsUpdateManager):
+        if self.__handler is not None:
+            self.__handler.disconnectSignals(widgetsUpdateManager)
+        self.__widgetsUpdateManager = None
+
+
+
 class AbstractActionHandler(QtCore.QObject):
     def __init__(self, tool=None):
         super(AbstractActionHandler, self).__init__()
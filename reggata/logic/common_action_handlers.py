@@ -242,9 +242,7 @@ class EditItemsActionHandler(AbstractActionHandler):
         updated, skipped = 0, 0
         uow = self._tool.repo.createUnitOfWork()
         try:
-            items = []
-            for itemId in itemIds:
-                items.append(uow.executeCommand(cmds.GetExpungedItemCommand(itemId)))
+            items = uow.executeCommand(cmds.GetExpungedItemsCommand(itemIds))
 
             if not self._dialogs.execItemsDialog(
                 items, self._tool.gui, self._tool.repo, ItemsDialog.EDIT_MODE, sameDstPath=False):
@@ -17,6 +17,7 @@ import reggata.helpers as helpers
 from reggata.data.commands import FileInfo
 from reggata.data.commands import GetFileInfoCommand
 from reggata.data.commands import GetItemIdsWithFilesFrom
+from reggata.data.commands import GetDirectoryItemCountsCommand
 from reggata.logic.action_handlers import ActionHandlerStorage
 from reggata.logic.handler_signals import HandlerSignals
 from reggata.gui.drop_files_dialogs_facade import DropFilesDialogsFacade
@@ -303,6 +304,7 @@ class FileInfoSearcherThread(QtCore.QThread):
             shouldTakeTime = True
             shouldSendProgress = False
             topRow = bottomRow = 0
+            dirItemCounts = None
             for i in range(len(self.finfos)):
 
                 if shouldTakeTime:
@@ -317,6 +319,15 @@ class FileInfoSearcherThread(QtCore.QThread):
                 if self.interrupt:
                     logger.debug("FileInfoSearcherThread interrupted.")
                     break
+                if finfo.type == FileInfo.DIR and finfo.path != "..":
+                    if dirItemCounts is None:
+                        dirRelPath = os.path.relpath(os.path.dirname(finfo.path),
+                                                     self.repo.base_path)
+                        dirItemCounts = uow.executeCommand(GetDirectoryItemCountsCommand(dirRelPath))
+                    self.mutex.lock()
+                    finfo.itemCount = dirItemCounts.get(finfo.fileBaseName, 0)
+                    self.mutex.unlock()
+                    continue
                 if finfo.type != FileInfo.FILE:
                     continue
                 relPath = os.path.relpath(finfo.path, self.repo.base_path)
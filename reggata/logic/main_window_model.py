@@ -3,15 +3,18 @@ Created on 07.09.2012
 @author: vlkv
 '''
 from reggata.user_config import UserConfig
-from reggata.data.commands import LoginUserCommand
 from reggata.errors import CurrentRepoIsNoneError, CurrentUserIsNoneError
-from reggata.logic.items_table import ItemsTable
-from reggata.logic.tag_cloud import TagCloud
-from reggata.logic.file_browser import FileBrowser
-from reggata.logic.action_handlers import ActionHandlerStorage
-import reggata.logic.main_window_action_handlers as handlers
+from reggata.logic.action_handlers import ActionHandlerStorage, LazyActionHandler
 from reggata.logic.favorite_repos_storage import FavoriteReposStorage
 
+
+def _handlers():
+    # Module of handlers imports the data layer and dialogs, so it is imported
+    # when the first menu action is triggered
+    import reggata.logic.main_window_action_handlers as handlers
+    return handlers
+
+
 class AbstractMainWindowModel(object):
     '''
         This is a declarative base class for MainWindowModel,
@@ -32,6 +35,13 @@ class MainWindowModel(AbstractMainWindowModel):
         self.__favoriteReposStorage = FavoriteReposStorage()
 
         self._tools = []
+
+
+    def initTools(self):
+        '''
+            Creates all available tools. Tools import most of the GUI and data modules,
+        so they are created after the main window is shown.
+        '''
         for tool in self.__getAvailableTools():
             self.__initTool(tool)
 
@@ -43,6 +53,9 @@ class MainWindowModel(AbstractMainWindowModel):
 
     def __getAvailableTools(self):
         # TODO: Discovering of tools should be dynamic, like plugin system
+        from reggata.logic.items_table import ItemsTable
+        from reggata.logic.tag_cloud import TagCloud
+        from reggata.logic.file_browser import FileBrowser
         return [ItemsTable(self._mainWindow.widgetsUpdateManager(),
                            self._mainWindow,
                            self._mainWindow.dialogsFacade()),
@@ -120,6 +133,7 @@ class MainWindowModel(AbstractMainWindowModel):
 
 
     def loginUser(self, login, password):
+        from reggata.data.commands import LoginUserCommand
         self.checkActiveRepoIsNotNone()
 
         uow = self._repo.createUnitOfWork()
@@ -156,7 +170,8 @@ class MainWindowModel(AbstractMainWindowModel):
 
 
     def connectOpenFavoriteRepoAction(self, action):
-        actionHandler = handlers.OpenFavoriteRepoActionHandler(self)
+        # Not lazy, because the handler gets the triggered action with self.sender()
+        actionHandler = _handlers().OpenFavoriteRepoActionHandler(self)
         self.__actionHandlers.register(action, actionHandler)
 
 
@@ -169,47 +184,47 @@ class MainWindowModel(AbstractMainWindowModel):
 
         def initRepositoryMenu():
             self.__actionHandlers.register(
-                ui.action_repo_create, handlers.CreateRepoActionHandler(self))
+                ui.action_repo_create, LazyActionHandler(lambda: _handlers().CreateRepoActionHandler(self)))
 
             self.__actionHandlers.register(
-                ui.action_repo_close, handlers.CloseRepoActionHandler(self))
+                ui.action_repo_close, LazyActionHandler(lambda: _handlers().CloseRepoActionHandler(self)))
 
             self.__actionHandlers.register(
-                ui.action_repo_open, handlers.OpenRepoActionHandler(self))
+                ui.action_repo_open, LazyActionHandler(lambda: _handlers().OpenRepoActionHandler(self)))
 
             self.__actionHandlers.register(
                 ui.actionAdd_current_repository,
-                handlers.AddCurrentRepoToFavoritesActionHandler(self, self.__favoriteReposStorage))
+                LazyActionHandler(lambda: _handlers().AddCurrentRepoToFavoritesActionHandler(self, self.__favoriteReposStorage)))
 
             self.__actionHandlers.register(
                 ui.actionRemove_current_repository,
-                handlers.RemoveCurrentRepoFromFavoritesActionHandler(self, self.__favoriteReposStorage))
+                LazyActionHandler(lambda: _handlers().RemoveCurrentRepoFromFavoritesActionHandler(self, self.__favoriteReposStorage)))
 
             self.__actionHandlers.register(
-                ui.actionImportItems, handlers.ImportItemsActionHandler(self, self._mainWindow.dialogsFacade()))
+                ui.actionImportItems, LazyActionHandler(lambda: _handlers().ImportItemsActionHandler(self, self._mainWindow.dialogsFacade())))
 
             self.__actionHandlers.register(
-                ui.actionManageExtApps, handlers.ManageExternalAppsActionHandler(self, self._mainWindow.dialogsFacade()))
+                ui.actionManageExtApps, LazyActionHandler(lambda: _handlers().ManageExternalAppsActionHandler(self, self._mainWindow.dialogsFacade())))
 
             self.__actionHandlers.register(
-                ui.actionExitReggata, handlers.ExitReggataActionHandler(self))
+                ui.actionExitReggata, LazyActionHandler(lambda: _handlers().ExitReggataActionHandler(self)))
 
         def initUserMenu():
             self.__actionHandlers.register(
-                ui.action_user_create, handlers.CreateUserActionHandler(self))
+                ui.action_user_create, LazyActionHandler(lambda: _handlers().CreateUserActionHandler(self)))
 
             self.__actionHandlers.register(
-                ui.action_user_login, handlers.LoginUserActionHandler(self))
+                ui.action_user_login, LazyActionHandler(lambda: _handlers().LoginUserActionHandler(self)))
 
             self.__actionHandlers.register(
-                ui.action_user_logout, handlers.LogoutUserActionHandler(self))
+                ui.action_user_logout, LazyActionHandler(lambda: _handlers().LogoutUserActionHandler(self)))
 
             self.__actionHandlers.register(
-                ui.action_user_change_pass, handlers.ChangeUserPasswordActionHandler(self))
+                ui.action_user_change_pass, LazyActionHandler(lambda: _handlers().ChangeUserPasswordActionHandler(self)))
 
         def initHelpMenu():
             self.__actionHandlers.register(
-                ui.action_help_about, handlers.ShowAboutDialogActionHandler(self))
+                ui.action_help_about, LazyActionHandler(lambda: _handlers().ShowAboutDialogActionHandler(self)))
 
         initRepositoryMenu()
         initUserMenu()
@@ -9,11 +9,14 @@ from _pyio import open
 import logging
 import os
 import traceback
+import threading
 import datetime
 from PyQt4 import QtCore, QtGui
 import reggata.data.commands as cmds
 from reggata.data.db_schema import Thumbnail
+from reggata.data.thumbnail_store import ThumbnailStore
 from reggata.data.integrity_fixer import IntegrityFixerFactory
+from reggata.data.cancellation import CancelToken
 import reggata.errors as errors
 import reggata.consts as consts
 from reggata.helpers import is_none_or_empty
@@ -210,8 +213,8 @@ class ExportItemsFilesThread(AbstractWorkerThread):
         uow = self.repo.createUnitOfWork()
         try:
             i = 0
-            for itemId in self.item_ids:
-                item = uow.executeCommand(cmds.GetExpungedItemCommand(itemId))
+            items = uow.executeCommand(cmds.GetItemRowsCommand(self.item_ids))
+            for item in items:
                 if not item.hasDataRef():
                     continue
 
@@ -358,27 +361,63 @@ class ThumbnailBuilderThread(AbstractWorkerThread):
         self.lock = lock
         self.interrupt = False
         self.rebuild = rebuild
+        # Guards items list and acceptsItems flag, because items can be added while
+        # the thread is running (see addItems())
+        self._itemsLock = threading.Lock()
+        self._acceptsItems = True
+
+    def addItems(self, items):
+        '''
+            Adds items to be processed by the running thread. Returns False if the
+        thread has already processed all its items (or was interrupted), start a new
+        thread for the items then.
+        '''
+        with self._itemsLock:
+            if not self._acceptsItems:
+                return False
+            self.items = self.items + list(items)
+            return True
+
+    def __nextItem(self, i):
+        with self._itemsLock:
+            if self.interrupt:
+                logger.info("ThumbnailBuilderThread interrupted!")
+            elif i < len(self.items):
+                return self.items[i]
+            self._acceptsItems = False
+            return None
 
     def doWork(self):
+        try:
+            self.__buildThumbnails()
+        finally:
+            with self._itemsLock:
+                self._acceptsItems = False
+
+    def __buildThumbnails(self):
         uow = self.repo.createUnitOfWork()
         try:
             thumbnail_size = int(UserConfig().get("thumbnail_size", consts.THUMBNAIL_DEFAULT_SIZE))
+            store = ThumbnailStore(self.repo.base_path)
 
-            for i in range(len(self.items)):
-                item = self.items[i]
-
-                if self.interrupt:
-                    logger.info("ThumbnailBuilderThread interrupted!")
+            i = -1
+            while True:
+                i += 1
+                item = self.__nextItem(i)
+                if item is None:
                     break
 
-                if not item.data_ref or not item.data_ref.is_image():
+                if not item.data_ref or not item.data_ref.is_image() or item.data_ref.hash is None:
                     continue
 
 
-                if self.rebuild == False and len(item.data_ref.thumbnails) > 0:
+                hasThumbnails = len(item.data_ref.thumbnails) > 0
+                if self.rebuild == False and hasThumbnails and \
+                        store.contains(item.data_ref.hash, thumbnail_size):
                     continue
-                elif self.rebuild:
+                elif self.rebuild or hasThumbnails:
                     #Delete ALL existing thumbnails linked with current item.data_ref from database
+                    #(also when a thumbnail file is missing in the thumbnail store)
                     uow.session.query(Thumbnail).filter(Thumbnail.data_ref_id==item.data_ref.id)\
                         .delete(synchronize_session=False)
                     uow.session.flush()
@@ -433,6 +472,47 @@ class ThumbnailBuilderThread(AbstractWorkerThread):
 
 
 
+class QueryItemsThread(AbstractWorkerThread):
+    '''
+        Executes commands of an Items Table query in background. Function fetch(uow,
+    cancelToken) executes the commands and returns their results, the results are
+    delivered with signal "queryFinished" (generation, result). A query that was
+    cancelled (see cancel()) delivers nothing, a query that ran out of time (see
+    UnitOfWork.executeCommand) emits signal "exception".
+    '''
+    def __init__(self, parent, repo, generation, fetch):
+        super(QueryItemsThread, self).__init__(parent)
+        self.repo = repo
+        self.generation = generation
+        self._fetch = fetch
+        self._cancelToken = CancelToken()
+
+    def cancel(self):
+        '''
+            Stops the query, SQL statement that is being executed is interrupted.
+        It can be called from any thread.
+        '''
+        self._cancelToken.cancel()
+
+    def isCancelled(self):
+        return self._cancelToken.isCancelled
+
+    def doWork(self):
+        uow = self.repo.createUnitOfWork()
+        try:
+            result = self._fetch(uow, self._cancelToken)
+        except errors.QueryCancelledError:
+            if not self._cancelToken.isCancelled:
+                # The query ran out of time, this is reported as an error
+                raise
+            logger.debug("Query of generation {} is cancelled".format(self.generation))
+            return
+        finally:
+            uow.close()
+        if not self._cancelToken.isCancelled:
+            self.emit(QtCore.SIGNAL("queryFinished"), self.generation, result)
+
+
 class DeleteGroupOfItemsThread(AbstractWorkerThread):
     def __init__(self, parent, repo, item_ids, user_login):
         super(DeleteGroupOfItemsThread, self).__init__(parent)
@@ -480,26 +560,27 @@ class CreateGroupOfItemsThread(AbstractWorkerThread):
         logger.info("CreateGroupOfItemsThread is going to process {} items".format(len(self.items)))
         self.skippedCount = 0
         self.createdCount = 0
+        def onProgress(processedCount, totalCount):
+            self.emit(QtCore.SIGNAL("progress"), int(100.0*float(processedCount)/totalCount))
+
         uow = self.repo.createUnitOfWork()
         try:
-            i = 0
-            for item in self.items:
-                try:
-                    #Every item is saved in a separate transaction
-                    srcAbsPath = None
-                    dstRelPath = None
-                    if item.data_ref:
-                        srcAbsPath = item.data_ref.srcAbsPath
-                        dstRelPath = item.data_ref.dstRelPath
-                    savedItemId = uow.executeCommand(cmds.SaveNewItemCommand(item, srcAbsPath, dstRelPath))
-                    self.lastSavedItemIds.append(savedItemId)
-                    self.createdCount += 1
-
-                except (ValueError, errors.DataRefAlreadyExistsError):
+            savedItemIds, failures = uow.executeCommand(
+                cmds.SaveNewItemsCommand(self.items, progressCallback=onProgress))
+            self.lastSavedItemIds.extend(savedItemIds)
+            self.createdCount = len(savedItemIds)
+            # Only items that are rejected as invalid or already existing are skipped,
+            # other errors are reported to the user (see AbstractWorkerThread.run())
+            unexpectedErrors = []
+            for item, ex in failures:
+                if isinstance(ex, (ValueError, errors.DataRefAlreadyExistsError)):
                     self.skippedCount += 1
-
-                i = i + 1
-                self.emit(QtCore.SIGNAL("progress"), int(100.0*float(i)/len(self.items)))
+                    logger.info("Item '{}' is skipped: {}".format(item.title, ex))
+                else:
+                    logger.error("Item '{}' is not saved: {}".format(item.title, ex))
+                    unexpectedErrors.append(ex)
+            if len(unexpectedErrors) > 0:
+                raise unexpectedErrors[0]
         finally:
             uow.close()
 
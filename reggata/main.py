@@ -26,22 +26,19 @@ import codecs
 import time
 import logging.config
 from datetime import datetime
-from PyQt4 import QtCore, QtGui
-from PyQt4.QtGui import QApplication
-from PyQt4.QtCore import QCoreApplication
 import reggata.consts as consts
-import reggata.statistics as stats
-import reggata.reggata_dir_locator
-import reggata.logging_default_conf as logging_default_conf
-from reggata.gui.main_window import MainWindow
-from reggata.gui.user_dialogs_facade import UserDialogsFacade
-from reggata.user_config import UserConfig
+import reggata.startup_profiler as startup_profiler
 
+# NOTE: PyQt, the GUI and the data layer are imported inside main(), so that
+# --profile-startup could measure their import time
 
 logger = logging.getLogger(__name__)
 
+PROFILE_STARTUP_FLAG = "--profile-startup"
+
 
 def configureLogging():
+    import reggata.logging_default_conf as logging_default_conf
     if not os.path.exists(consts.LOGGING_CONFIG_FILE):
         with codecs.open(consts.LOGGING_CONFIG_FILE, "w", "utf-8") as f:
             text = logging_default_conf.loggingDefaultConf
@@ -56,12 +53,16 @@ def configureConfigDir():
 
 
 def configureTmpDir():
+    from reggata.user_config import UserConfig
     tmpDir = UserConfig().get("tmp_dir", consts.DEFAULT_TMP_DIR)
     if not os.path.exists(tmpDir):
         os.makedirs(tmpDir)
 
 
 def configureTranslations(app):
+    from PyQt4 import QtCore
+    import reggata.reggata_dir_locator
+    from reggata.user_config import UserConfig
     qtr = QtCore.QTranslator(app)
     language = UserConfig().get("language")
     if language:
@@ -83,6 +84,10 @@ def configureTranslations(app):
 
 
 def askUserAboutSendStatistics(mainWindow):
+    from PyQt4 import QtGui
+    from PyQt4.QtCore import QCoreApplication
+    import reggata.statistics as stats
+    from reggata.gui.user_dialogs_facade import UserDialogsFacade
     title = "Reggata"
     question = QCoreApplication.translate("main", "Do you want to help make Reggata better by automatically sending usage statistics?", None, QCoreApplication.UnicodeUTF8)
     res = UserDialogsFacade().execGetYesNoAnswerDialog(mainWindow, title, question)
@@ -99,20 +104,47 @@ def askUserAboutSendStatistics(mainWindow):
 
 def main():
     startTime = datetime.now()
-    configureConfigDir()
-    configureTmpDir()
-    configureLogging()
+    profileStartup = PROFILE_STARTUP_FLAG in sys.argv
+    if profileStartup:
+        sys.argv.remove(PROFILE_STARTUP_FLAG)
+    profiler = startup_profiler.create(profileStartup)
+    profiler.install()
+
+    with profiler.stage("Import PyQt4"):
+        from PyQt4 import QtCore
+        from PyQt4.QtGui import QApplication
+
+    with profiler.stage("Configure dirs and logging"):
+        configureConfigDir()
+        configureTmpDir()
+        configureLogging()
 
     logger.info("========= Reggata started =========")
     logger.debug("pyqt_version = {}".format(QtCore.PYQT_VERSION_STR))
     logger.debug("qt_version = {}".format(QtCore.QT_VERSION_STR))
     logger.debug("current dir is " + os.path.abspath("."))
 
-    app = QApplication(sys.argv)
-    configureTranslations(app)
+    with profiler.stage("Create QApplication"):
+        app = QApplication(sys.argv)
+        configureTranslations(app)
+
+    with profiler.stage("Create main window"):
+        from reggata.gui.main_window import MainWindow
+        mw = MainWindow()
+
+    with profiler.stage("Show main window"):
+        mw.show()
+        app.processEvents()
+
+    with profiler.stage("Init tools and open recent repository"):
+        mw.initTools()
+
+    with profiler.stage("Import statistics"):
+        import reggata.statistics as stats
 
-    mw = MainWindow()
-    mw.show()
+    profiler.uninstall()
+    if profileStartup:
+        print(profiler.report())
 
     if not stats.isReggataInstanceRegistered() and not stats.isUserGaveTheAnswerAboutSendStatistics():
         askUserAboutSendStatistics(mw)
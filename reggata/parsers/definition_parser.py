@@ -5,6 +5,8 @@ Created on 28.11.2010
 
 Parser for text definition of tags and fields.
 '''
+import sys
+import threading
 import ply.yacc as yacc
 from reggata.parsers.definition_tokens import tokens, build_lexer
 from reggata.errors import YaccError
@@ -60,22 +62,38 @@ def p_error(p):
     raise YaccError("Syntax error in '{}'".format(str(p)))
 
 
-lexer = build_lexer()
-
 # TODO: use file for logging
 #yacc_errorlog = ply.yacc.PlyLogger(open(os.path.join(USER_CONFIG_DIR, "yacc.log"), "w"))
 yacc_errorlog = yacc.NullLogger()
 
 tokens  # This line is needed to supress warning that 'tokens is unused'
-parsetabPyDir = consts.USER_CONFIG_DIR
-parser = yacc.yacc(errorlog=yacc_errorlog,
-                   debug=(1 if consts.DEBUG else 0), # If debug yacc creates parser.out log file
-                   tabmodule="parsetab_def",
-                   outputdir=parsetabPyDir)
+
+# Lexer and parser are built on the first parse() call (see query_parser)
+_parserLock = threading.Lock()
+_lexer = None
+_parser = None
+
+
+def _buildParser(writeTables=False):
+    '''
+        Returns a pair (lexer, parser). Parse tables are read from module
+    reggata.parsers.parsetab_def, that is shipped with the package.
+    '''
+    lexer = build_lexer()
+    parser = yacc.yacc(module=sys.modules[__name__],
+                       errorlog=yacc_errorlog,
+                       debug=(1 if consts.DEBUG else 0), # If debug yacc creates parser.out log file
+                       tabmodule="parsetab_def",
+                       write_tables=writeTables)
+    return (lexer, parser)
 
 
 def parse(text):
-    return parser.parse(text, lexer=lexer)
+    global _lexer, _parser
+    with _parserLock:
+        if _parser is None:
+            _lexer, _parser = _buildParser()
+        return _parser.parse(text, lexer=_lexer)
 
 
 if __name__ == '__main__':
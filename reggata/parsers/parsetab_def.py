@@ -0,0 +1,38 @@
+
+# parsetab_def.py
+# This file is automatically generated. Do not edit.
+# pylint: disable=W,C,R
+_tabversion = '3.10'
+
+_lr_method = 'LALR'
+
+_lr_signature = 'COLON STRINGdefinition :\n    definition : definition field_value_pair\n    definition : definition tag\n    field_value_pair : field COLON value\n    field : STRING\n    value : STRING\n    tags_def_expression :\n    tag : STRING\n    '
+    
+_lr_action_items = {'STRING':([0,1,2,3,5,6,7,8,],[-1,5,-2,-3,-8,8,-4,-6,]),'$end':([0,1,2,3,5,7,8,],[-1,0,-2,-3,-8,-4,-6,]),'COLON':([4,5,],[6,-5,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'definition':([0,],[1,]),'field_value_pair':([1,],[2,]),'tag':([1,],[3,]),'field':([1,],[4,]),'value':([6,],[7,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> definition","S'",1,None,None,None),
+  ('definition -> <empty>','definition',0,'p_definition_empty','definition_parser.py',17),
+  ('definition -> definition field_value_pair','definition',2,'p_definition_fields','definition_parser.py',22),
+  ('definition -> definition tag','definition',2,'p_definition_tags','definition_parser.py',29),
+  ('field_value_pair -> field COLON value','field_value_pair',3,'p_field_value_pair','definition_parser.py',36),
+  ('field -> STRING','field',1,'p_field','definition_parser.py',41),
+  ('value -> STRING','value',1,'p_value','definition_parser.py',46),
+  ('tags_def_expression -> <empty>','tags_def_expression',0,'p_tags_def_expression_empty','definition_parser.py',51),
+  ('tag -> STRING','tag',1,'p_tag','definition_parser.py',56),
+]
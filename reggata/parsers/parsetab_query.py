@@ -0,0 +1,67 @@
+
+# parsetab_query.py
+# This file is automatically generated. Do not edit.
+# pylint: disable=W,C,R
+_tabversion = '3.10'
+
+_lr_method = 'LALR'
+
+_lr_signature = 'ALL ALL ALL AND AND AND COLON EQUAL GREATER GREATER_EQ LESS LESS_EQ LIKE LPAREN NOT NOT NOT OR OR OR PATH PATH PATH RPAREN STRING TITLE TITLE TITLE USER USER USERquery : simple_query\n             | compound_query\n             | compound_query extra_clause\n    compound_query : LPAREN simple_query RPAREN\n    compound_query : compound_query AND LPAREN simple_query RPAREN\n                      | compound_query LPAREN simple_query RPAREN\n    compound_query : compound_query OR LPAREN simple_query RPAREN\n    compound_query : compound_query AND NOT LPAREN simple_query RPAREN\n    simple_query : tags_conjunction\n                    | tags_conjunction extra_clause\n                    | fields_conjunction\n                    | fields_conjunction extra_clause\n                    | all_items\n    simple_query : extra_clause\n    extra_clause : USER COLON STRING extra_clause\n    extra_clause : PATH COLON STRING extra_clause\n    extra_clause : TITLE COLON STRING extra_clause\n    extra_clause :\n    tags_conjunction : tags_conjunction AND tag_not_tag\n                        | tags_conjunction tag_not_tag\n                        | tag_not_tag\n    tag_not_tag : NOT tag\n                   | tag\n    tag : STRING\n    fields_conjunction : fields_conjunction field_op_value\n                          | fields_conjunction AND field_op_value\n    fields_conjunction : field_op_value\n    field_op_value : field_name field_op field_value\n    field_name : STRING\n    field_op : EQUAL\n                | GREATER\n                | GREATER_EQ\n                | LESS\n                | LESS_EQ\n                | LIKE\n    field_value : STRING\n    all_items : ALL\n    '
+    
+_lr_action_items = {'LPAREN':([0,3,20,22,44,49,57,62,64,65,],[8,21,43,46,56,-4,-6,-5,-7,-8,]),'ALL':([0,8,21,43,46,56,],[12,12,12,12,12,12,]),'USER':([0,3,5,6,8,10,11,14,17,21,25,26,28,32,43,46,47,48,49,50,51,52,53,54,56,57,62,64,65,],[13,13,13,13,13,-21,-27,-24,-23,13,-20,-24,-25,-22,13,13,-19,-26,-4,13,13,13,-28,-36,13,-6,-5,-7,-8,]),'PATH':([0,3,5,6,8,10,11,14,17,21,25,26,28,32,43,46,47,48,49,50,51,52,53,54,56,57,62,64,65,],[15,15,15,15,15,-21,-27,-24,-23,15,-20,-24,-25,-22,15,15,-19,-26,-4,15,15,15,-28,-36,15,-6,-5,-7,-8,]),'TITLE':([0,3,5,6,8,10,11,14,17,21,25,26,28,32,43,46,47,48,49,50,51,52,53,54,56,57,62,64,65,],[16,16,16,16,16,-21,-27,-24,-23,16,-20,-24,-25,-22,16,16,-19,-26,-4,16,16,16,-28,-36,16,-6,-5,-7,-8,]),'$end':([0,1,2,3,4,5,6,7,10,11,12,14,17,19,23,25,26,27,28,32,47,48,49,50,51,52,53,54,57,59,60,61,62,64,65,],[-18,0,-1,-2,-14,-9,-11,-13,-21,-27,-37,-24,-23,-3,-10,-20,-24,-12,-25,-22,-19,-26,-4,-18,-18,-18,-28,-36,-6,-15,-16,-17,-5,-7,-8,]),'NOT':([0,5,8,10,14,17,20,21,24,25,26,32,43,46,47,56,],[9,9,9,-21,-24,-23,44,9,9,-20,-24,-22,9,9,-19,9,]),'STRING':([0,5,6,8,9,10,11,14,17,21,24,25,26,28,29,32,33,34,35,36,37,38,39,40,41,42,43,46,47,48,53,54,56,],[14,26,30,14,26,-21,-27,-24,-23,14,26,-20,-24,-25,30,-22,50,51,52,54,-30,-31,-32,-33,-34,-35,14,14,-19,-26,-28,-36,14,]),'AND':([3,5,6,10,11,14,17,25,26,28,32,47,48,49,53,54,57,62,64,65,],[20,24,29,-21,-27,-24,-23,-20,-24,-25,-22,-19,-26,-4,-28,-36,-6,-5,-7,-8,]),'OR':([3,49,57,62,64,65,],[22,-4,-6,-5,-7,-8,]),'RPAREN':([4,5,6,7,8,10,11,12,14,17,21,23,25,26,27,28,31,32,43,45,46,47,48,50,51,52,53,54,55,56,58,59,60,61,63,],[-14,-9,-11,-13,-18,-21,-27,-37,-24,-23,-18,-10,-20,-24,-12,-25,49,-22,-18,57,-18,-19,-26,-18,-18,-18,-28,-36,62,-18,64,-15,-16,-17,65,]),'COLON':([13,15,16,],[33,34,35,]),'EQUAL':([14,18,30,],[-29,37,-29,]),'GREATER':([14,18,30,],[-29,38,-29,]),'GREATER_EQ':([14,18,30,],[-29,39,-29,]),'LESS':([14,18,30,],[-29,40,-29,]),'LESS_EQ':([14,18,30,],[-29,41,-29,]),'LIKE':([14,18,30,],[-29,42,-29,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'query':([0,],[1,]),'simple_query':([0,8,21,43,46,56,],[2,31,45,55,58,63,]),'compound_query':([0,],[3,]),'extra_clause':([0,3,5,6,8,21,43,46,50,51,52,56,],[4,19,23,27,4,4,4,4,59,60,61,4,]),'tags_conjunction':([0,8,21,43,46,56,],[5,5,5,5,5,5,]),'fields_conjunction':([0,8,21,43,46,56,],[6,6,6,6,6,6,]),'all_items':([0,8,21,43,46,56,],[7,7,7,7,7,7,]),'tag_not_tag':([0,5,8,21,24,43,46,56,],[10,25,10,10,47,10,10,10,]),'field_op_value':([0,6,8,21,29,43,46,56,],[11,28,11,11,48,11,11,11,]),'tag':([0,5,8,9,21,24,43,46,56,],[17,17,17,32,17,17,17,17,17,]),'field_name':([0,6,8,21,29,43,46,56,],[18,18,18,18,18,18,18,18,]),'field_op':([18,],[36,]),'field_value':([36,],[53,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> query","S'",1,None,None,None),
+  ('query -> simple_query','query',1,'p_query','query_parser.py',19),
+  ('query -> compound_query','query',1,'p_query','query_parser.py',20),
+  ('query -> compound_query extra_clause','query',2,'p_query','query_parser.py',21),
+  ('compound_query -> LPAREN simple_query RPAREN','compound_query',3,'p_compound_query','query_parser.py',34),
+  ('compound_query -> compound_query AND LPAREN simple_query RPAREN','compound_query',5,'p_compound_query_and','query_parser.py',40),
+  ('compound_query -> compound_query LPAREN simple_query RPAREN','compound_query',4,'p_compound_query_and','query_parser.py',41),
+  ('compound_query -> compound_query OR LPAREN simple_query RPAREN','compound_query',5,'p_compound_query_or','query_parser.py',53),
+  ('compound_query -> compound_query AND NOT LPAREN simple_query RPAREN','compound_query',6,'p_compound_query_and_not','query_parser.py',60),
+  ('simple_query -> tags_conjunction','simple_query',1,'p_simple_query','query_parser.py',67),
+  ('simple_query -> tags_conjunction extra_clause','simple_query',2,'p_simple_query','query_parser.py',68),
+  ('simple_query -> fields_conjunction','simple_query',1,'p_simple_query','query_parser.py',69),
+  ('simple_query -> fields_conjunction extra_clause','simple_query',2,'p_simple_query','query_parser.py',70),
+  ('simple_query -> all_items','simple_query',1,'p_simple_query','query_parser.py',71),
+  ('simple_query -> extra_clause','simple_query',1,'p_simple_query_single_extra_clause','query_parser.py',82),
+  ('extra_clause -> USER COLON STRING extra_clause','extra_clause',4,'p_extra_clause_user','query_parser.py',91),
+  ('extra_clause -> PATH COLON STRING extra_clause','extra_clause',4,'p_extra_clause_path','query_parser.py',99),
+  ('extra_clause -> TITLE COLON STRING extra_clause','extra_clause',4,'p_extra_clause_title','query_parser.py',107),
+  ('extra_clause -> <empty>','extra_clause',0,'p_extra_clause_empty','query_parser.py',115),
+  ('tags_conjunction -> tags_conjunction AND tag_not_tag','tags_conjunction',3,'p_tags_conjunction','query_parser.py',121),
+  ('tags_conjunction -> tags_conjunction tag_not_tag','tags_conjunction',2,'p_tags_conjunction','query_parser.py',122),
+  ('tags_conjunction -> tag_not_tag','tags_conjunction',1,'p_tags_conjunction','query_parser.py',123),
+  ('tag_not_tag -> NOT tag','tag_not_tag',2,'p_tag_not_tag','query_parser.py',137),
+  ('tag_not_tag -> tag','tag_not_tag',1,'p_tag_not_tag','query_parser.py',138),
+  ('tag -> STRING','tag',1,'p_tag','query_parser.py',148),
+  ('fields_conjunction -> fields_conjunction field_op_value','fields_conjunction',2,'p_fields_conjunction','query_parser.py',154),
+  ('fields_conjunction -> fields_conjunction AND field_op_value','fields_conjunction',3,'p_fields_conjunction','query_parser.py',155),
+  ('fields_conjunction -> field_op_value','fields_conjunction',1,'p_fields_conjunction_empty','query_parser.py',164),
+  ('field_op_value -> field_name field_op field_value','field_op_value',3,'p_field_op_value','query_parser.py',172),
+  ('field_name -> STRING','field_name',1,'p_field_name','query_parser.py',178),
+  ('field_op -> EQUAL','field_op',1,'p_field_op','query_parser.py',184),
+  ('field_op -> GREATER','field_op',1,'p_field_op','query_parser.py',185),
+  ('field_op -> GREATER_EQ','field_op',1,'p_field_op','query_parser.py',186),
+  ('field_op -> LESS','field_op',1,'p_field_op','query_parser.py',187),
+  ('field_op -> LESS_EQ','field_op',1,'p_field_op','query_parser.py',188),
+  ('field_op -> LIKE','field_op',1,'p_field_op','query_parser.py',189),
+  ('field_value -> STRING','field_value',1,'p_field_value','query_parser.py',195),
+  ('all_items -> ALL','all_items',1,'p_all_items','query_parser.py',201),
+]
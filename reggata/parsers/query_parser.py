@@ -5,7 +5,10 @@ Created on 24.10.2010
 
 Module contains productions of reggata query language grammar.
 '''
+import sys
+import threading
 import ply.yacc as yacc
+import reggata.helpers as helpers
 import reggata.parsers.query_tree_nodes as tree
 from reggata.parsers.query_tokens import tokens, build_lexer
 from reggata.errors import YaccError
@@ -209,19 +212,61 @@ def p_error(p):
 yacc_errorlog = yacc.NullLogger()
 
 tokens  # This line is needed to supress warning that 'tokens is unused'
-lexer = build_lexer()
-parsetabPyDir = consts.USER_CONFIG_DIR
-parser = yacc.yacc(errorlog=yacc_errorlog,
-                   debug=(1 if consts.DEBUG else 0), # If debug yacc creates parser.out log file
-                   tabmodule="parsetab_query",
-                   outputdir=parsetabPyDir)
 
+# Lexer and parser are built on the first parse() call. They keep state of the text
+# being parsed, so parsing is serialized with _parserLock
+_parserLock = threading.Lock()
+_lexer = None
+_parser = None
 
-def parse(text):
+
+def _buildParser(writeTables=False):
+    '''
+        Returns a pair (lexer, parser). Parse tables are read from module
+    reggata.parsers.parsetab_query, that is shipped with the package. If the grammar
+    was changed, tables are regenerated in memory (and are written to the package
+    directory only if writeTables is True).
+    '''
+    lexer = build_lexer()
+    parser = yacc.yacc(module=sys.modules[__name__],
+                       errorlog=yacc_errorlog,
+                       debug=(1 if consts.DEBUG else 0), # If debug yacc creates parser.out log file
+                       tabmodule="parsetab_query",
+                       write_tables=writeTables)
+    return (lexer, parser)
+
+
+def _parse(text):
+    global _lexer, _parser
+    with _parserLock:
+        if _parser is None:
+            _lexer, _parser = _buildParser()
+        return _parser.parse(text, lexer=_lexer)
+
+
+# Syntax trees of recently parsed queries: {normalized query text: root node}
+parseCache = helpers.LruCache(consts.QUERY_CACHE_SIZE)
+
+
+def normalizeQueryText(text):
+    return text.strip()
+
+
+def parse(text, useCache=True):
     '''
-        Returns the root node of syntax tree, constructed from text.
+        Returns the root node of syntax tree, constructed from text. Trees are cached
+    by text, so the same tree object is returned for the same text and it must not be
+    modified. If useCache is False, text is always parsed and the cache is not used.
     '''
-    return parser.parse(text, lexer=lexer)
+    key = normalizeQueryText(text)
+    if not useCache:
+        return _parse(key)
+    root = parseCache.get(key)
+    if root is None:
+        root = _parse(key)
+        if root is not None:
+            parseCache.put(key, root)
+    return root
 
 
 if __name__ == '__main__':
@@ -247,6 +292,7 @@ if __name__ == '__main__':
 
 ##############################
 
+    lexer = build_lexer()
     lexer.input(data)
 
     while True:
@@ -254,7 +300,7 @@ if __name__ == '__main__':
         if not tok: break      # No more input
         print(tok)
 ##############################
-    result = parser.parse(data)
+    result = parse(data)
     print(result.interpret())
 
 
@@ -7,14 +7,110 @@ Module consists of classes, which represent nodes of syntax tree of
 reggata query language.
 '''
 import reggata.helpers as helpers
+import reggata.consts as consts
 from reggata.data import db_schema
 
 
+# Results of QueryExpression.interpret(), syntax trees are kept by the parser cache
+# (see query_parser.parse()), so the same query is not interpreted again
+sqlCache = helpers.LruCache(4*consts.QUERY_CACHE_SIZE)
+
+
+class SqlParams(object):
+    '''
+        Values of bind parameters of an SQL query, that are collected while the query
+    is built. All the values from a query text (tag names, field values, etc.) are
+    bound as parameters, so SQL of a query depends only on its shape, and queries
+    of the same shape share prepared statements.
+    '''
+    def __init__(self):
+        self.values = dict()
+
+    def bind(self, value):
+        '''
+            Adds a parameter with the given value and returns its placeholder.
+        '''
+        name = "q{}".format(len(self.values))
+        self.values[name] = value
+        return ":" + name
+
+    def bindList(self, values):
+        '''
+            Returns a comma separated list of placeholders of the given values.
+        '''
+        return helpers.to_commalist(values, self.bind, ", ")
+
+
+def _titleLike(ext, params, useFullTextIndex):
+    '''
+        Returns an SQL condition for a "title:" extra clause. When useFullTextIndex is
+    True, the condition uses full-text index items_title_fts (see db_migrations), so
+    items table is not scanned. The trigram tokenizer of the index may fold case of
+    any letters, but LIKE folds only ASCII letters, so titles found in the index are
+    checked with LIKE again. The result doesn't depend on the index then.
+    '''
+    pattern = params.bind("%" + ext.interpret() + "%")
+    if useFullTextIndex:
+        return "(i.id IN (select rowid from items_title_fts where title LIKE " + pattern + \
+            ") AND i.title LIKE " + pattern + ")"
+    return "i.title LIKE " + pattern
+
+
+def _pathPrefix(ext, params):
+    '''
+        Returns an SQL condition for a "path:" extra clause. It is true for urls that
+    start with the given path, case of ASCII letters is ignored. Characters % and _ of
+    the path are not wildcards. SQLite finds such urls by a range of the case-insensitive
+    index ix_data_refs_url_nocase (see db_migrations).
+    '''
+    path = ext.interpret()
+    if path == "":
+        return " 1 "
+    pattern = path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return "data_refs.url LIKE " + params.bind(pattern) + " ESCAPE '\\'"
+
+
 class QueryExpression(object):
     '''
         This is a base class for all nodes of syntax tree.
     '''
-    def interpret(self):
+    def interpret(self, useFullTextIndex=False, resolveTags=None, useCache=True):
+        '''
+            Returns a pair (sql, params), where params is a dict of values of the
+        bind parameters of sql.
+
+            resolveTags is a function that takes a list of tag names and returns a dict
+        {tagName: (tagId, itemCount)} for existing tags (see
+        operations.TagStatsOperations.tagIdsAndCounts). With it tag conditions use tag
+        ids and the most selective tags are checked first.
+
+            Results are cached in sqlCache (unless useCache is False), the key includes
+        resolved tags, so the cached SQL is not used after tags are created or their
+        counts are changed.
+        '''
+        tagInfos = resolveTags(sorted(self._tagNames())) if resolveTags is not None else None
+        key = (self, useFullTextIndex,
+               tuple(sorted(tagInfos.items())) if tagInfos is not None else None)
+        result = sqlCache.get(key) if useCache else None
+        if result is None:
+            params = SqlParams()
+            sql = self._sql(params, useFullTextIndex, tagInfos)
+            result = (sql, params.values)
+            if useCache:
+                sqlCache.put(key, result)
+        return (result[0], dict(result[1]))
+
+    def _tagNames(self):
+        '''
+            Returns a set of names of all the tags in the query.
+        '''
+        return set()
+
+    def _sql(self, params, useFullTextIndex, tagInfos=None):
+        '''
+            Returns SQL of this node, values are bound in params. tagInfos is a
+        result of resolveTags (see interpret()) or None.
+        '''
         raise NotImplementedError("This is an abstract method.")
 
 
@@ -47,12 +143,19 @@ class CompoundQuery(QueryExpression):
                 elem.add_extra_clause(ext)
 
 
-    def interpret(self):
+    def _tagNames(self):
+        names = set()
+        for elem in self.elems:
+            if isinstance(elem, QueryExpression):
+                names |= elem._tagNames()
+        return names
+
+    def _sql(self, params, useFullTextIndex, tagInfos=None):
         s = ""
         for elem in self.elems:
 
             if isinstance(elem, QueryExpression):
-                s = s + elem.interpret()
+                s = s + elem._sql(params, useFullTextIndex, tagInfos)
             else:
                 s = s + elem
         return s
@@ -67,7 +170,7 @@ class FieldOpVal(QueryExpression):
         self.op = op
         self.value = value
 
-    def interpret(self, i=0):
+    def _sql(self, params, useFullTextIndex, tagInfos=None, i=0):
         value = self.value
         ok = False
         try:
@@ -84,11 +187,17 @@ class FieldOpVal(QueryExpression):
 
         #Now value may be of type: str, int or float
         if self.op in ['=', '>', '>=', '<', '<='] and type(value) in [int, float]:
-            return """ CAST(if{0}.field_value as REAL) {1} {2} """.format(i, self.op, value)
+            # field_value_num is NULL for values that are not numbers, so they never match
+            return """ if{0}.field_value_num {1} {2} """.format(i, self.op, params.bind(value))
+        elif self.op == '~' and useFullTextIndex:
+            # Values found in the index are checked with LIKE again (see _titleLike())
+            pattern = params.bind(str(value))
+            return """ (if{0}.id IN (select rowid from items_fields_fts
+                where field_value LIKE {1}) AND if{0}.field_value LIKE {1}) """.format(i, pattern)
         elif self.op == '~':
-            return """ if{0}.field_value LIKE '{1}' """.format(i, value)
+            return """ if{0}.field_value LIKE {1} """.format(i, params.bind(str(value)))
         else:
-            return """ if{0}.field_value {1} '{2}' """.format(i, self.op, value)
+            return """ if{0}.field_value {1} {2} """.format(i, self.op, params.bind(str(value)))
 
 
 class SimpleQuery(QueryExpression):
@@ -111,15 +220,24 @@ class SimpleQuery(QueryExpression):
         else:
             raise Exception("Unexpected type of extra_clause {}".format(str(ext.type)))
 
+    def _dataRefsJoin(self):
+        '''
+            Returns a join of data_refs table. Items without files never match "path:"
+        extra clauses, so with them it is an inner join. Then SQLite may find the urls
+        in the index first (see _pathPrefix()), and only after that their items.
+        '''
+        join = "join" if len(self.extra_paths) > 0 else "left join"
+        return join + " data_refs on data_refs.id = i.data_ref_id"
+
 class SingleExtraClause(SimpleQuery):
 
     def __init__(self):
         super(SingleExtraClause, self).__init__()
 
-    def interpret(self):
+    def _sql(self, params, useFullTextIndex, tagInfos=None):
         #extra_users_str
         if len(self.extra_users) > 0:
-            comma_list = helpers.to_commalist(self.extra_users, lambda x: "'" + x.interpret() + "'", ", ")
+            comma_list = params.bindList([x.interpret() for x in self.extra_users])
             extra_users_str = " i.user_login IN (" + comma_list + ") "
         else:
             extra_users_str = " 1 "
@@ -127,14 +245,14 @@ class SingleExtraClause(SimpleQuery):
         #extra_paths_str
         if len(self.extra_paths) > 0:
             extra_paths_str = helpers.to_commalist( \
-                self.extra_paths, lambda x: "data_refs.url LIKE '" + x.interpret() + "%'", " OR ")
+                self.extra_paths, lambda x: _pathPrefix(x, params), " OR ")
         else:
             extra_paths_str = " 1 "
 
         #extra_titles_str
         if len(self.extra_titles) > 0:
             extra_titles_str = helpers.to_commalist( \
-                self.extra_titles, lambda x: "i.title LIKE '%" + x.interpret() + "%'", " OR ")
+                self.extra_titles, lambda x: _titleLike(x, params, useFullTextIndex), " OR ")
         else:
             extra_titles_str = " 1 "
 
@@ -145,7 +263,7 @@ class SingleExtraClause(SimpleQuery):
             i.*,
             ''' + db_schema.DataRef._sql_from() + '''
         from items i
-        left join data_refs on data_refs.id = i.data_ref_id
+        ''' + self._dataRefsJoin() + '''
             where (''' + extra_users_str + ''')
             and (''' + extra_paths_str + ''')
             and (''' + extra_titles_str + ''')
@@ -171,7 +289,7 @@ class FieldsConjunction(SimpleQuery):
         inner join fields f3 on f3.id = if3.field_id
     where
             f2.name = 'Author' and if2.field_value LIKE 'Dostoevsky'
-        and f1.name = 'Rating' and CAST(if1.field_value as REAL) < 5
+        and f1.name = 'Rating' and if1.field_value_num < 5
         and f3.name = 'Year' and if3.field_value = '2010'
     '''
     # Maybe we should add here a condition like:
@@ -184,18 +302,17 @@ class FieldsConjunction(SimpleQuery):
         self.field_op_vals = []
 
 
-    def interpret(self):
+    def _sql(self, params, useFullTextIndex, tagInfos=None):
         #extra_users_str
         if len(self.extra_users) > 0:
-            users_comma_list = helpers.to_commalist(self.extra_users,
-                                                    lambda x: "'" + x.interpret() + "'", ", ")
+            users_comma_list = params.bindList([x.interpret() for x in self.extra_users])
         else:
             users_comma_list = None
 
         #extra_titles_str
         if len(self.extra_titles) > 0:
             extra_titles_str = helpers.to_commalist( \
-                self.extra_titles, lambda x: "i.title LIKE '%" + x.interpret() + "%'", " OR ")
+                self.extra_titles, lambda x: _titleLike(x, params, useFullTextIndex), " OR ")
         else:
             extra_titles_str = " 1 "
 
@@ -214,9 +331,9 @@ class FieldsConjunction(SimpleQuery):
                 from_part = from_part + ''' and if{0}.field_id <> if{1}.field_id '''.format(i-1, i)
             from_parts.append(from_part)
 
-            where_part = '''f{0}.name = '{1}' and {2} {3}'''.format(i, field_op_val.name,
-                                                                    field_op_val.interpret(i),
-                                                                    extra_users_str)
+            where_part = '''f{0}.name = {1} and {2} {3}'''.format(
+                i, params.bind(field_op_val.name),
+                field_op_val._sql(params, useFullTextIndex, i=i), extra_users_str)
             where_parts.append(where_part)
             i = i + 1
 
@@ -233,7 +350,7 @@ class FieldsConjunction(SimpleQuery):
         #extra_paths_str
         if len(self.extra_paths) > 0:
             extra_paths_str = helpers.to_commalist( \
-                self.extra_paths, lambda x: "data_refs.url LIKE '" + x.interpret() + "%'", " OR ")
+                self.extra_paths, lambda x: _pathPrefix(x, params), " OR ")
         else:
             extra_paths_str = " 1 "
 
@@ -244,7 +361,7 @@ class FieldsConjunction(SimpleQuery):
             ''' + db_schema.DataRef._sql_from() + '''
         from items i
         ''' + from_str + '''
-        left join data_refs on data_refs.id = i.data_ref_id
+        ''' + self._dataRefsJoin() + '''
             where (''' + where_str + ''')
             and (''' + extra_paths_str + ''')
             and (''' + extra_titles_str + ''')
@@ -281,15 +398,13 @@ class AllItems(SimpleQuery):
     def __init__(self):
         super(AllItems, self).__init__()
 
-    def interpret(self):
+    def _sql(self, params, useFullTextIndex, tagInfos=None):
         s = '''
         --AllItems.interpret()
-        select distinct
+        select
             i.*,
             ''' + db_schema.DataRef._sql_from() + '''
         from items i
-        left join items_tags it on i.id = it.item_id
-        left join tags t on t.id = it.tag_id
         left join data_refs on data_refs.id = i.data_ref_id
             where 1'''
         return s
@@ -300,20 +415,24 @@ class TagsConjunction(SimpleQuery):
         Conjunction of Tags or their or their negations. For example:
     "Book AND Programming AND NOT Design"
 
-    SQL query for this:
+    SQL query for this (ids of tags are bound as parameters, the tag with the least
+    number of items is the first one):
 
-    select * from items i
-    left join items_tags it on i.id = it.item_id
-    left join tags t on t.id = it.tag_id
+    select i.* from items i
     where
-        (t.name='Book' or t.name='Programming')    --yes_tags_str
-
-        and i.id NOT IN (select i.id from items i        --no_tags_str
-        left join items_tags it on i.id = it.item_id
-        left join tags t on t.id = it.tag_id
-        where t.name='Design')
-
-        group by i.id having count(*)=2                  --group_by_having
+        i.id IN (select it.item_id from items_tags it            --yes_tags_str
+                 where it.tag_id = 12)
+        and exists (select 1 from items_tags it2
+                    where it2.item_id = i.id and it2.tag_id = 5)
+
+        and not exists (select 1 from items_tags itn             --no_tags_str
+                        where itn.item_id = i.id and itn.tag_id IN (7))
+
+        Every items_tags row is looked up by index and items are not grouped. The
+    primary key of items_tags is (item_id, tag_id, user_login), so the same tag may
+    be applied to an item several times (by different users). That is why items are
+    selected from items table, and the first tag is an IN subquery (a set of item ids)
+    instead of a join, so every item is returned once without DISTINCT.
     '''
 
     def __init__(self):
@@ -323,72 +442,87 @@ class TagsConjunction(SimpleQuery):
         self.no_tags = []
 
 
-    def interpret(self):
-        #yes_tags_str, group_by_having
-        group_by_having = ""
-        if len(self.yes_tags) > 0:
-            yes_tags_str = helpers.to_commalist(self.yes_tags,
-                                                lambda x: "t.name='" + x.interpret() + "'", " or ")
-
-            if len(self.yes_tags) > 1:
-                group_by_having = " group by i.id having count(*)={} ".format(len(self.yes_tags))
-        else:
-            yes_tags_str = " 1 "
+    def _sql(self, params, useFullTextIndex, tagInfos=None):
+        yesTagNames = []
+        for tag in self.yes_tags:
+            if tag.interpret() not in yesTagNames:
+                yesTagNames.append(tag.interpret())
+        noTagNames = [tag.interpret() for tag in self.no_tags]
+
+        #Tags that do not exist in the database: if any of yes_tags does not exist,
+        #nothing matches, no_tags that do not exist are just skipped
+        matchesNothing = False
+        if tagInfos is not None:
+            matchesNothing = any(name not in tagInfos for name in yesTagNames)
+            yesTagNames = [name for name in yesTagNames if name in tagInfos]
+            yesTagNames.sort(key=lambda name: tagInfos[name][1])
+            noTagNames = [name for name in noTagNames if name in tagInfos]
+
+        def tagIdSql(name):
+            if tagInfos is not None:
+                return params.bind(tagInfos[name][0])
+            return "(select id from tags where name = " + params.bind(name) + ")"
 
         #extra_users_str
         if len(self.extra_users) > 0:
-            comma_list = helpers.to_commalist(self.extra_users,
-                                              lambda x: "'" + x.interpret() + "'", ", ")
-            extra_users_str = " it.user_login IN (" + comma_list + ") "
+            users_comma_list = params.bindList([x.interpret() for x in self.extra_users])
         else:
-            extra_users_str = " 1 "
+            users_comma_list = None
+
+        def usersSql(alias):
+            if users_comma_list is None:
+                return ""
+            return " and {0}.user_login IN ({1})".format(alias, users_comma_list)
+
+        #yes_tags_str
+        conditions = []
+        if matchesNothing:
+            conditions.append(" 0 ")
+        elif len(yesTagNames) > 0:
+            conditions.append('''i.id IN (select it.item_id from items_tags it
+                where it.tag_id = {0}{1})'''.format(tagIdSql(yesTagNames[0]), usersSql("it")))
+            for k, name in enumerate(yesTagNames[1:], 2):
+                conditions.append('''exists (select 1 from items_tags it{0}
+                    where it{0}.item_id = i.id and it{0}.tag_id = {1}{2})'''.format(
+                    k, tagIdSql(name), usersSql("it{}".format(k))))
+        elif users_comma_list is not None:
+            conditions.append('''exists (select 1 from items_tags itu
+                where itu.item_id = i.id''' + usersSql("itu") + ")")
+
+        #no_tags_str
+        if len(noTagNames) > 0:
+            conditions.append('''not exists (select 1 from items_tags itn
+                where itn.item_id = i.id and itn.tag_id IN (''' +
+                helpers.to_commalist(noTagNames, tagIdSql, ", ") + "))")
 
         #extra_paths_str
         if len(self.extra_paths) > 0:
-            extra_paths_str = helpers.to_commalist( \
-                self.extra_paths, lambda x: "data_refs.url LIKE '" + x.interpret() + "%'", " OR ")
-        else:
-            extra_paths_str = " 1 "
+            conditions.append("(" + helpers.to_commalist( \
+                self.extra_paths, lambda x: _pathPrefix(x, params), " OR ") + ")")
 
         #extra_titles_str
         if len(self.extra_titles) > 0:
-            extra_titles_str = helpers.to_commalist( \
-                self.extra_titles, lambda x: "i.title LIKE '%" + x.interpret() + "%'", " OR ")
-        else:
-            extra_titles_str = " 1 "
-
-
-        #no_tags_str
-        if len(self.no_tags) > 0:
-            no_tags_str = " i.id NOT IN (select i.id from items i " + \
-            " left join items_tags it on i.id = it.item_id " + \
-            " left join tags t on t.id = it.tag_id " + \
-            " where (" + helpers.to_commalist(self.no_tags,
-                lambda x: "t.name='" + x.interpret() + "'", " or ") + ") " + ") "
-        else:
-            no_tags_str = " 1 "
+            conditions.append("(" + helpers.to_commalist( \
+                self.extra_titles, lambda x: _titleLike(x, params, useFullTextIndex), " OR ") + ")")
 
         s = '''
         --TagsConjunction.interpret()
-        select distinct
+        select
             i.*,
             ''' + db_schema.DataRef._sql_from() + '''
         from items i
-        left join items_tags it on i.id = it.item_id
-        left join tags t on t.id = it.tag_id
-        left join data_refs on data_refs.id = i.data_ref_id
-            where (''' + yes_tags_str + ''')
-            and (''' + extra_users_str + ''')
-            and (''' + no_tags_str + ''')
-            and (''' + extra_paths_str + ''')
-            and (''' + extra_titles_str + ''')
-            ''' + group_by_having
+        ''' + self._dataRefsJoin() + '''
+            where ''' + (" and ".join(conditions) if conditions else " 1 ") + '''
+            '''
         return s
 
     @property
     def tags(self):
         return self.yes_tags + self.no_tags
 
+    def _tagNames(self):
+        return set(tag.interpret() for tag in self.tags)
+
     def add_tag(self, tag):
         if tag.is_negative:
             self.no_tags.append(tag)
@@ -396,6 +530,33 @@ class TagsConjunction(SimpleQuery):
             self.yes_tags.append(tag)
 
 
+def formatTree(node, indent=0):
+    '''
+        Returns a human readable multiline representation of syntax tree node.
+    '''
+    pad = "    " * indent
+    if isinstance(node, CompoundQuery):
+        lines = [pad + "CompoundQuery"]
+        for elem in node.elems:
+            if isinstance(elem, QueryExpression):
+                lines.append(formatTree(elem, indent + 1))
+            else:
+                lines.append(pad + "    " + elem.strip())
+        return "\n".join(lines)
+
+    line = pad + type(node).__name__
+    if isinstance(node, TagsConjunction):
+        line += " " + " AND ".join(["'{}'".format(tag.name) for tag in node.yes_tags] +
+                                   ["NOT '{}'".format(tag.name) for tag in node.no_tags])
+    elif isinstance(node, FieldsConjunction):
+        line += " " + " AND ".join("'{}' {} '{}'".format(f.name, f.op, f.value)
+                                   for f in node.field_op_vals)
+    if isinstance(node, SimpleQuery):
+        for ext in node.extra_users + node.extra_paths + node.extra_titles:
+            line += " {}:'{}'".format(ext.type.lower(), ext.value)
+    return line
+
+
 class ExtraClause(QueryExpression):
     '''
         ExtraClause is a part of query, which allow you to restrict items
@@ -27,6 +27,23 @@ language = en
 
 sqlalchemy.engine_echo = False
 
+# Storage profile of repository database. Reads go through a pool of read-only
+# connections, writes go through a separate writer engine.
+sqlite.journal_mode = WAL
+sqlite.synchronous = NORMAL
+sqlite.mmap_size = 268435456
+sqlite.cache_size = -65536
+sqlite.temp_store = MEMORY
+sqlite.busy_timeout_sec = 30
+sqlite.read_pool_size = 4
+
+# Queries (of Items Table, Tag Cloud, etc.) running longer than this number of
+# seconds are interrupted, 0 means no limit
+query_timeout_sec = 60
+
+# Number of items saved in one transaction when a group of items is added
+save_new_items.chunk_size = 1000
+
 '''
 
 _confTemplate = \
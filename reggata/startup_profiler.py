@@ -0,0 +1,147 @@
+'''
+Created on 18.10.2026
+
+Startup profiler measures how long Reggata spends importing modules and initializing
+itself before (and right after) the main window is shown. It is enabled with the
+--profile-startup command line flag, the report is printed to stdout.
+'''
+import sys
+import time
+import contextlib
+import importlib.abc
+
+
+class _TimedLoader(object):
+    '''
+        Wraps a module loader and measures execution time of the module body.
+    '''
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enterImport(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exitImport(module.__name__)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _TimedFinder(importlib.abc.MetaPathFinder):
+    '''
+        Finds modules with the rest of sys.meta_path finders and wraps their loaders
+    with _TimedLoader.
+    '''
+    def __init__(self, profiler):
+        self._profiler = profiler
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, self._profiler)
+            return spec
+        return None
+
+
+class StartupProfiler(object):
+    '''
+        Collects two kinds of timings:
+        - stages, that are named intervals of startup (see stage()), with the number
+    of modules imported during each stage;
+        - imports, self and cumulative time of each module import (like
+    'python -X importtime' does).
+    '''
+    def __init__(self):
+        self._finder = _TimedFinder(self)
+        self._startTime = time.perf_counter()
+        self._stages = []
+        self._imports = dict()
+        self._importStack = []
+
+    def install(self):
+        if self._finder not in sys.meta_path:
+            sys.meta_path.insert(0, self._finder)
+
+    def uninstall(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+            Measures a named stage of startup:
+
+            with profiler.stage("Create main window"):
+                mw = MainWindow()
+        '''
+        modulesBefore = len(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stages.append((name, time.perf_counter() - start,
+                                 len(sys.modules) - modulesBefore))
+
+    def _enterImport(self, moduleName):
+        # Stack entries are [moduleName, startTime, time of nested imports]
+        self._importStack.append([moduleName, time.perf_counter(), 0.0])
+
+    def _exitImport(self, moduleName):
+        name, start, nestedTime = self._importStack.pop()
+        assert name == moduleName
+        cumulative = time.perf_counter() - start
+        self._imports[name] = (cumulative - nestedTime, cumulative)
+        if len(self._importStack) > 0:
+            self._importStack[-1][2] += cumulative
+
+    def report(self, topImports=25):
+        '''
+            Returns timings as a text table. Only topImports modules with the largest
+        cumulative import time are listed.
+        '''
+        lines = []
+        lines.append("Startup profile ({:.1f} ms since start of profiling)".format(
+            1000 * (time.perf_counter() - self._startTime)))
+        lines.append("")
+        lines.append("{:>10}  {:>8}  {}".format("ms", "modules", "stage"))
+        for name, duration, moduleCount in self._stages:
+            lines.append("{:10.1f}  {:8d}  {}".format(1000 * duration, moduleCount, name))
+        lines.append("")
+        lines.append("{:>10}  {:>10}  {}".format("self ms", "cumul. ms", "module"))
+        imports = sorted(self._imports.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (selfTime, cumulative) in imports[:topImports]:
+            lines.append("{:10.1f}  {:10.1f}  {}".format(1000 * selfTime, 1000 * cumulative, name))
+        return "\n".join(lines)
+
+
+class _NullProfiler(object):
+    '''
+        Does nothing, it is used when startup profiling is disabled.
+    '''
+    def install(self):
+        pass
+
+    def uninstall(self):
+        pass
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        yield
+
+    def report(self, topImports=25):
+        return ""
+
+
+def create(enabled):
+    return StartupProfiler() if enabled else _NullProfiler()
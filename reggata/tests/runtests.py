@@ -1,7 +1,8 @@
 import unittest
 import os
 from reggata.tests import test_memento, test_helpers, test_repo_mgr, test_worker_threads,\
-    test_action_handlers, test_items_integrity
+    test_action_handlers, test_items_integrity, test_db_migrations, test_storage_profile, \
+    test_thumbnail_store, test_startup_profiler, test_items_table_model
 from reggata import consts, logging_default_conf
 import logging
 
@@ -30,11 +31,33 @@ class TestRunner():
         self.addTestCase(test_repo_mgr.GetItemTest)
         self.addTestCase(test_repo_mgr.DeleteItemTest)
         self.addTestCase(test_repo_mgr.SaveNewItemTest)
+        self.addTestCase(test_repo_mgr.SaveNewItemsTest)
         self.addTestCase(test_repo_mgr.UpdateItemTest)
+        self.addTestCase(test_repo_mgr.GetRelatedTagsTest)
+        self.addTestCase(test_repo_mgr.ItemRowsTest)
+        self.addTestCase(test_repo_mgr.NameCacheTest)
+        self.addTestCase(test_repo_mgr.DirectoriesTest)
+        self.addTestCase(test_repo_mgr.QueryResultCacheTest)
+        self.addTestCase(test_repo_mgr.CancelCommandTest)
+
+        self.addTestCase(test_db_migrations.UpgradeExistingRepoTest)
+        self.addTestCase(test_db_migrations.CreateNewRepoTest)
+
+        self.addTestCase(test_storage_profile.StorageProfileTest)
+        self.addTestCase(test_storage_profile.ReaderWriterSessionsTest)
+
+        self.addTestCase(test_thumbnail_store.ThumbnailStoreTest)
+
+        self.addTestCase(test_startup_profiler.StartupProfilerTest)
 
         self.addTestCase(test_worker_threads.DeleteGroupOfItemsThreadTest)
+        self.addTestCase(test_worker_threads.CreateGroupOfItemsThreadTest)
+
+        self.addTestCase(test_items_table_model.PrefetchPagesTest)
 
         self.addTestCase(test_helpers.IsNoneOrEmptyTest)
+        self.addTestCase(test_helpers.ParseNumberTest)
+        self.addTestCase(test_helpers.LruCacheTest)
 
 
     def addTestCase(self, testCaseCls):
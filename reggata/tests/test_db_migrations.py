@@ -0,0 +1,202 @@
+import os
+import shutil
+import unittest
+import sqlalchemy as sqa
+import reggata.consts as consts
+import reggata.tests.tests_context as context
+from reggata.data import db_migrations
+import reggata.data.commands as cmds
+from reggata.data.repo_mgr import RepoMgr
+from reggata.data.thumbnail_store import ThumbnailStore
+from reggata.parsers import query_parser
+from reggata.tests.abstract_test_cases import AbstractTestCaseWithRepo
+
+
+def createEngine(repoBasePath):
+    return sqa.create_engine("sqlite:///" + os.path.join(repoBasePath, consts.METADATA_DIR,
+                                                         consts.DB_FILE))
+
+
+class UpgradeExistingRepoTest(AbstractTestCaseWithRepo):
+
+    def test_schemaVersionIsLatest(self):
+        conn = createEngine(self.repo.base_path).connect()
+        try:
+            self.assertEqual(db_migrations.currentVersion(conn), db_migrations.LATEST_VERSION)
+        finally:
+            conn.close()
+
+    def test_fieldIdHasIntegerAffinity(self):
+        conn = createEngine(self.repo.base_path).connect()
+        try:
+            self.assertEqual(conn.execute(
+                "select count(*) from items_fields where typeof(field_id) <> 'integer'").scalar(), 0)
+        finally:
+            conn.close()
+
+    def test_secondaryIndexesExist(self):
+        conn = createEngine(self.repo.base_path).connect()
+        try:
+            indexNames = set(row[0] for row in conn.execute(
+                "select name from sqlite_master where type = 'index'"))
+            self.assertTrue("ix_items_tags_tag_id_item_id" in indexNames)
+            self.assertTrue("ix_items_fields_field_id_value" in indexNames)
+            self.assertTrue("ix_data_refs_hash" in indexNames)
+            self.assertTrue("ix_data_refs_url_nocase" in indexNames)
+        finally:
+            conn.close()
+
+    def test_directoriesOfDataRefs(self):
+        conn = createEngine(self.repo.base_path).connect()
+        try:
+            self.assertEqual(conn.execute('''select count(*) from data_refs d
+                left join directories dirs on dirs.id = d.dir_id
+                where d.type = 'FILE' and (dirs.id is null or d.url not like dirs.rel_path || '%')
+                ''').scalar(), 0)
+            self.assertEqual(conn.execute('''select count(*) from directories
+                where rel_path <> '' and parent_id is null''').scalar(), 0)
+        finally:
+            conn.close()
+
+    def test_numericFieldValues(self):
+        conn = createEngine(self.repo.base_path).connect()
+        try:
+            self.assertEqual(conn.execute('''select count(*) from items_fields
+                where field_value_num is not null and typeof(field_value_num) <> 'real'
+                ''').scalar(), 0)
+            self.assertEqual(conn.execute('''select count(*) from items_fields
+                where field_value_num is null and cast(field_value as real) <> 0
+                ''').scalar(), 0)
+            self.assertTrue(conn.execute('''select count(*) from items_fields
+                where field_value_num is not null''').scalar() > 0)
+        finally:
+            conn.close()
+
+    def test_upgradeIsIdempotent(self):
+        engine = createEngine(self.repo.base_path)
+        self.assertEqual(db_migrations.upgrade(engine), db_migrations.LATEST_VERSION)
+
+    def test_thumbnailsAreMovedToStore(self):
+        engine = createEngine(self.repo.base_path)
+        conn = engine.connect()
+        try:
+            # Make thumbnails table look like it was before schema version 3
+            conn.execute("DROP TABLE thumbnails")
+            conn.execute('''CREATE TABLE thumbnails (
+                data_ref_id INTEGER NOT NULL, size INTEGER NOT NULL,
+                data BLOB, date_created DATETIME,
+                PRIMARY KEY (data_ref_id, size))''')
+            (dataRefId, dataRefHash) = conn.execute(
+                "select id, hash from data_refs where hash is not null").first()
+            conn.execute(sqa.text("insert into thumbnails (data_ref_id, size, data) values (:id, 100, :data)"),
+                         id=dataRefId, data=b"JPEG data")
+            conn.execute("delete from schema_version where version >= 3")
+        finally:
+            conn.close()
+
+        self.assertEqual(db_migrations.upgrade(engine), db_migrations.LATEST_VERSION)
+
+        conn = engine.connect()
+        try:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(thumbnails)")]
+            self.assertFalse("data" in columns)
+            self.assertEqual(conn.execute("select count(*) from thumbnails").scalar(), 1)
+        finally:
+            conn.close()
+        self.assertEqual(ThumbnailStore(self.repo.base_path).read(dataRefHash, 100), b"JPEG data")
+
+    def checkFullTextIndex(self):
+        conn = createEngine(self.repo.base_path).connect()
+        try:
+            self.assertTrue(db_migrations.hasFullTextIndex(conn))
+            # Raises an error if an index doesn't match its content table
+            conn.execute("INSERT INTO items_title_fts (items_title_fts, rank) "
+                         "VALUES ('integrity-check', 1)")
+            conn.execute("INSERT INTO items_fields_fts (items_fields_fts, rank) "
+                         "VALUES ('integrity-check', 1)")
+            return conn.execute("select rowid from items_title_fts where title LIKE '%changed%'") \
+                .fetchall()
+        finally:
+            conn.close()
+
+    def test_fullTextIndexFollowsChanges(self):
+        item = self.getExistingItem(context.itemWithTagsAndFields.id)
+        item.title = "Changed title"
+        item.setFieldValue("Notes", "Changed notes", item.user_login)
+        self.updateExistingItem(item, os.path.join(self.repo.base_path, item.data_ref.url),
+                                item.data_ref.url, item.user_login)
+        self.assertEqual(self.checkFullTextIndex(), [(item.id,)])
+
+    def test_rebuildFullTextIndex(self):
+        conn = createEngine(self.repo.base_path).connect()
+        try:
+            conn.execute("INSERT INTO items_title_fts (items_title_fts) VALUES ('delete-all')")
+            conn.execute("INSERT INTO items_fields_fts (items_fields_fts) VALUES ('delete-all')")
+        finally:
+            conn.close()
+        uow = self.repo.createUnitOfWork()
+        try:
+            uow.executeCommand(cmds.RebuildFullTextIndexCommand())
+        finally:
+            uow.close()
+        self.checkFullTextIndex()
+
+    def test_vacuumKeepsFullTextIndex(self):
+        conn = createEngine(self.repo.base_path).connect()
+        try:
+            # VACUUM may renumber implicit rowids, but not values of an INTEGER PRIMARY
+            # KEY column, items_fields_fts is keyed on such a column
+            columns = dict((row[1], (row[2], row[5]))
+                           for row in conn.execute("PRAGMA table_info(items_fields)"))
+            self.assertEqual(columns["id"], ("INTEGER", 1))
+            conn.execute("DELETE FROM items_fields WHERE item_id = {}"
+                         .format(context.itemWithTagsAndFields.id))
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        self.checkFullTextIndex()
+
+    def test_fullTextIndexFoldsCaseAsLike(self):
+        # LIKE ignores case of ASCII letters only, queries that use full-text index
+        # return the same items as queries that don't use it
+        item = self.getExistingItem(context.itemWithTagsAndFields.id)
+        item.title = "\u00c4pfel und Birnen"
+        item.setFieldValue("Notes", "\u041f\u0440\u0438\u0432\u0435\u0442", item.user_login)
+        self.updateExistingItem(item, os.path.join(self.repo.base_path, item.data_ref.url),
+                                item.data_ref.url, item.user_login)
+
+        queries = [('title:"\u00e4pfel"', []),
+                   ('title:"\u00c4pfel"', [item.id]),
+                   ('title:"PFEL"', [item.id]),
+                   ('Notes~"%\u043f\u0440\u0438\u0432\u0435\u0442%"', []),
+                   ('Notes~"%\u041f\u0440\u0438\u0432\u0435\u0442%"', [item.id])]
+        uow = self.repo.createUnitOfWork()
+        try:
+            for query, expectedItemIds in queries:
+                for useFullTextIndex in [True, False]:
+                    sql, params = query_parser.parse(query).interpret(useFullTextIndex)
+                    itemIds = sorted(row.id for row in uow.session.execute(sql, params))
+                    self.assertEqual(itemIds, expectedItemIds,
+                                     "Query: {}, full-text index: {}".format(query, useFullTextIndex))
+        finally:
+            uow.close()
+
+
+class CreateNewRepoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repoBasePath = os.path.join(os.path.dirname(context.TEST_REPO_BASE_PATH), "new_repo.rgt")
+        if os.path.exists(self.repoBasePath):
+            shutil.rmtree(self.repoBasePath)
+        os.mkdir(self.repoBasePath)
+
+    def tearDown(self):
+        shutil.rmtree(self.repoBasePath)
+
+    def test_newRepoHasLatestSchemaVersion(self):
+        RepoMgr.createNewRepo(self.repoBasePath)
+        conn = createEngine(self.repoBasePath).connect()
+        try:
+            self.assertEqual(db_migrations.currentVersion(conn), db_migrations.LATEST_VERSION)
+        finally:
+            conn.close()
@@ -21,6 +21,53 @@ class IsNoneOrEmptyTest(unittest.TestCase):
         self.assertRaises(TypeError, helpers.is_none_or_empty, (listObj))
 
 
+class ParseNumberTest(unittest.TestCase):
+
+    def test_parseNumber_numbers(self):
+        self.assertEqual(helpers.parseNumber("5"), 5.0)
+        self.assertEqual(helpers.parseNumber(" -2.5 "), -2.5)
+        self.assertEqual(helpers.parseNumber("1e3"), 1000.0)
+        self.assertEqual(helpers.parseNumber(".5"), 0.5)
+        self.assertEqual(helpers.parseNumber(7), 7.0)
+
+    def test_parseNumber_notNumbers(self):
+        self.assertIsNone(helpers.parseNumber(None))
+        self.assertIsNone(helpers.parseNumber(""))
+        self.assertIsNone(helpers.parseNumber("five"))
+        self.assertIsNone(helpers.parseNumber("nan"))
+        self.assertIsNone(helpers.parseNumber("inf"))
+        self.assertIsNone(helpers.parseNumber("1_000"))
+        self.assertIsNone(helpers.parseNumber("0x10"))
+        self.assertIsNone(helpers.parseNumber("1e999"))
+
+
+class LruCacheTest(unittest.TestCase):
+
+    def test_leastRecentlyUsedIsEvicted(self):
+        cache = helpers.LruCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_sizeBudget(self):
+        cache = helpers.LruCache(maxSize=10)
+        cache.put("a", 1, 4)
+        cache.put("b", 2, 4)
+        cache.put("c", 3, 4)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.size, 8)
+        cache.put("b", 2, 1)
+        self.assertEqual(cache.size, 5)
+        cache.put("d", 4, 11) # Bigger than the whole budget
+        self.assertIsNone(cache.get("d"))
+        self.assertEqual(len(cache), 2)
+
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
@@ -0,0 +1,77 @@
+'''
+Created on 18.10.2026
+'''
+import time
+from PyQt4 import QtCore
+from reggata.gui.items_table_gui import ItemsTableModel
+from reggata.tests.abstract_test_cases import AbstractTestCaseWithRepo
+from reggata.tests.tests_context import itemWithTagsAndFields
+
+
+class PrefetchPagesTest(AbstractTestCaseWithRepo):
+    '''
+        Pages next to the shown one are prefetched in background, because queries
+    are executed in threads the test processes events until they are finished.
+    '''
+    QUERY = "RHCP"
+
+    def setUp(self):
+        super(PrefetchPagesTest, self).setUp()
+        self.app = QtCore.QCoreApplication.instance()
+        if self.app is None:
+            self.app = QtCore.QCoreApplication([])
+        self.model = ItemsTableModel(self.repo, QtCore.QReadWriteLock(), "user")
+
+    def waitForQueries(self, timeoutSec=10):
+        deadline = time.time() + timeoutSec
+        while self.model._queryThread is not None or self.model._prefetchThread is not None:
+            self.assertLess(time.time(), deadline, "Query is not finished in time")
+            QtCore.QCoreApplication.processEvents()
+            time.sleep(0.01)
+
+    def test_nextPageIsShownFromPrefetched(self):
+        self.model.query(self.QUERY, limit=1, page=1)
+        self.waitForQueries()
+        self.assertIn(2, self.model._prefetched)
+        prefetchedItems, _ = self.model._prefetched[2]
+
+        self.model.query(self.QUERY, limit=1, page=2)
+
+        # The page is set at once, no query is started for it
+        self.assertIsNone(self.model._queryThread)
+        self.assertEqual(self.model.rowCount(), 1)
+        self.assertEqual(self.model.objAtRow(0).id, prefetchedItems[0].id)
+        self.assertNotIn(2, self.model._prefetched)
+
+    def test_otherQueryDropsPrefetched(self):
+        self.model.query(self.QUERY, limit=1, page=1)
+        self.waitForQueries()
+        self.assertIn(2, self.model._prefetched)
+
+        self.model.query("Lyrics", limit=1, page=1)
+        self.assertEqual(len(self.model._prefetched), 0)
+        self.waitForQueries()
+
+    def test_resetPagesDropsPrefetched(self):
+        self.model.query(self.QUERY, limit=1, page=1)
+        self.waitForQueries()
+        self.assertIn(2, self.model._prefetched)
+
+        self.model.resetPages()
+        self.assertEqual(len(self.model._prefetched), 0)
+        self.assertIsNone(self.model.itemCount)
+
+    def test_ratingChangeDropsPrefetched(self):
+        self.model.query(self.QUERY, limit=1, page=1)
+        self.waitForQueries()
+        self.model.query(self.QUERY, limit=1, page=2)
+        self.waitForQueries()
+        self.assertIn(1, self.model._prefetched)
+
+        ratingColumn = self.model.columnVisibleIndexById(ItemsTableModel.RATING)
+        row = self.model.objAtRow(0)
+        newRating = 1 if row.id == itemWithTagsAndFields.id else 3
+        index = self.model.index(0, ratingColumn)
+        self.assertTrue(self.model.setData(index, newRating, QtCore.Qt.EditRole))
+
+        self.assertEqual(len(self.model._prefetched), 0)
@@ -6,7 +6,13 @@ import reggata.data.db_schema as db
 import reggata.data.commands as cmds
 import reggata.errors as err
 import reggata.helpers as hlp
+import reggata.consts as consts
+from reggata.user_config import UserConfig
+from reggata.parsers import query_parser
+from reggata.data import cancellation
 import os
+import time
+import threading
 
 
 
@@ -23,6 +29,27 @@ class GetItemTest(AbstractTestCaseWithRepoAndSingleUOW):
         cmd = cmds.GetExpungedItemCommand("This str is NOT a valid item id!")
         self.assertRaises(err.NotFoundError, self.uow.executeCommand, (cmd))
 
+    def test_getItemWithTagsAndFields(self):
+        item = self.uow.executeCommand(cmds.GetExpungedItemCommand(context.itemWithTagsAndFields.id))
+        self.assertEqual(sorted(it.tag.name for it in item.item_tags),
+                         sorted(context.itemWithTagsAndFields.tags))
+        self.assertEqual(sorted(itf.field.name for itf in item.item_fields),
+                         sorted(context.itemWithTagsAndFields.fields.keys()))
+
+    def test_getManyItems(self):
+        itemIds = [context.itemWithTagsAndFields.id, context.itemWithFile.id,
+                   context.itemWithoutFile.id]
+        items = self.uow.executeCommand(cmds.GetExpungedItemsCommand(itemIds))
+        self.assertEqual([item.id for item in items], itemIds)
+        self.assertEqual(sorted(it.tag.name for it in items[2].item_tags),
+                         sorted(context.itemWithoutFile.tags))
+        self.assertEqual(sorted(itf.field.name for itf in items[2].item_fields),
+                         sorted(context.itemWithoutFile.fields.keys()))
+        self.assertIsNone(items[2].data_ref)
+
+        cmd = cmds.GetExpungedItemsCommand([context.itemWithFile.id, context.nonExistingItem.id])
+        self.assertRaises(err.NotFoundError, self.uow.executeCommand, (cmd))
+
 
 class SaveNewItemTest(AbstractTestCaseWithRepo):
 
@@ -211,6 +238,102 @@ class SaveNewItemTest(AbstractTestCaseWithRepo):
         self.assertEqual(len(savedItem.item_fields), 2)
 
 
+class SaveNewItemsTest(AbstractTestCaseWithRepo):
+
+    def test_saveNewItems(self):
+        userLogin = "user"
+        itemWithTags = db.Item(userLogin, "Item with tags and fields")
+        itemWithTags.addTag("Lyrics", userLogin)
+        itemWithTags.addTag("No items in test repo with such Tag!", userLogin)
+        itemWithTags.setFieldValue("Year", "2013", userLogin)
+
+        itemWithFile = db.Item(userLogin, "Item with file")
+        itemWithFile.data_ref = db.DataRef(objType=db.DataRef.FILE)
+        itemWithFile.data_ref.srcAbsPath = os.path.abspath(
+            os.path.join(self.repo.base_path, "..", "tmp", "file.txt"))
+        itemWithFile.data_ref.dstRelPath = os.path.join("dir1", "newFile.txt")
+
+        itemWithStoredFile = db.Item(userLogin, "Item with already stored file")
+        itemWithStoredFile.data_ref = db.DataRef(objType=db.DataRef.FILE)
+        itemWithStoredFile.data_ref.srcAbsPath = os.path.join(
+            self.repo.base_path, context.itemWithFile.relFilePath)
+        itemWithStoredFile.data_ref.dstRelPath = context.itemWithFile.relFilePath
+
+        itemOfNonExistentUser = db.Item("NonExistentUserLogin", "Item of non existent user")
+
+        items = [itemWithTags, itemWithFile, itemWithStoredFile, itemOfNonExistentUser]
+        progress = []
+        try:
+            uow = self.repo.createUnitOfWork()
+            cmd = cmds.SaveNewItemsCommand(items, chunkSize=2,
+                progressCallback=lambda processed, total: progress.append((processed, total)))
+            savedItemIds, failures = uow.executeCommand(cmd)
+        finally:
+            uow.close()
+
+        self.assertEqual(len(savedItemIds), 2)
+        self.assertEqual(set(item for item, _ex in failures),
+                         set([itemWithStoredFile, itemOfNonExistentUser]))
+        self.assertEqual(progress[-1], (4, 4))
+
+        savedItem = self.getExistingItem(savedItemIds[0])
+        self.assertEqual(savedItem.title, itemWithTags.title)
+        self.assertTrue(savedItem.hasTag("Lyrics"))
+        self.assertTrue(savedItem.hasTag("No items in test repo with such Tag!"))
+        self.assertEqual(savedItem.getFieldValue("Year"), "2013")
+
+        savedItem = self.getExistingItem(savedItemIds[1])
+        self.assertEqual(savedItem.title, itemWithFile.title)
+        self.assertEqual(savedItem.data_ref.url_raw,
+                         hlp.to_db_format(itemWithFile.data_ref.dstRelPath))
+        self.assertIsNotNone(savedItem.data_ref.hash)
+        self.assertTrue(os.path.exists(os.path.join(self.repo.base_path, savedItem.data_ref.url)))
+
+        try:
+            uow = self.repo.createUnitOfWork()
+            rows = uow.executeCommand(cmds.GetRelatedTagsCommand())
+        finally:
+            uow.close()
+        self.assertEqual(dict((row.name, row.c) for row in rows)["No items in test repo with such Tag!"], 1)
+
+
+    def test_failedItemDoesNotFailItsChunk(self):
+        userLogin = "user"
+        itemWithFile = db.Item(userLogin, "Item with file")
+        itemWithFile.data_ref = db.DataRef(objType=db.DataRef.FILE)
+        itemWithFile.data_ref.srcAbsPath = os.path.abspath(
+            os.path.join(self.repo.base_path, "..", "tmp", "file.txt"))
+        itemWithFile.data_ref.dstRelPath = os.path.join("dir1", "fileOfGoodItem.txt")
+
+        # Title of an item cannot be NULL, so this item fails on insert
+        badItem = db.Item(userLogin, None)
+        badItem.data_ref = db.DataRef(objType=db.DataRef.FILE)
+        badItem.data_ref.srcAbsPath = itemWithFile.data_ref.srcAbsPath
+        badItem.data_ref.dstRelPath = os.path.join("dir1", "fileOfBadItem.txt")
+
+        items = [itemWithFile, badItem, db.Item(userLogin, "Item without file")]
+        progress = []
+        try:
+            uow = self.repo.createUnitOfWork()
+            cmd = cmds.SaveNewItemsCommand(items, chunkSize=3,
+                progressCallback=lambda processed, total: progress.append(processed))
+            savedItemIds, failures = uow.executeCommand(cmd)
+        finally:
+            uow.close()
+
+        self.assertEqual(len(savedItemIds), 2)
+        self.assertEqual([item for item, _ex in failures], [badItem])
+        self.assertTrue(os.path.exists(os.path.join(self.repo.base_path, "dir1", "fileOfGoodItem.txt")))
+        self.assertFalse(os.path.exists(os.path.join(self.repo.base_path, "dir1", "fileOfBadItem.txt")))
+        self.assertEqual(progress, sorted(set(progress)))
+        self.assertEqual(progress[-1], 3)
+
+        savedItem = self.getExistingItem(savedItemIds[0])
+        self.assertEqual(savedItem.title, itemWithFile.title)
+        self.assertEqual(savedItem.data_ref.url_raw,
+                         hlp.to_db_format(itemWithFile.data_ref.dstRelPath))
+
+
 class DeleteItemTest(AbstractTestCaseWithRepo):
     def test_deleteExistingItemWithExistingPhysicalFileByOwner(self):
         userThatDeletesItem = context.itemWithFile.ownerUserLogin
@@ -718,3 +841,370 @@ class FileCommandsTest(AbstractTestCaseWithRepo):
         
 
         
+
+
+class GetRelatedTagsTest(AbstractTestCaseWithRepo):
+    '''
+        tag_stats table is maintained incrementally, so after every change of items
+    GetRelatedTagsCommand must return the same numbers as a full aggregation does.
+    '''
+    def getAggregatedTagCounts(self):
+        try:
+            uow = self.repo.createUnitOfWork()
+            rows = uow.session.execute('''
+                select t.name, count(*)
+                from tags t
+                join items_tags it on it.tag_id = t.id
+                join items i on i.id = it.item_id and i.alive
+                group by t.name''').fetchall()
+        finally:
+            uow.close()
+        return dict((name, c) for (name, c) in rows)
+
+    def getRelatedTagCounts(self, limit=0):
+        try:
+            uow = self.repo.createUnitOfWork()
+            rows = uow.executeCommand(cmds.GetRelatedTagsCommand(limit=limit))
+        finally:
+            uow.close()
+        return dict((row.name, row.c) for row in rows)
+
+    def test_countsOfExistingRepo(self):
+        self.assertEqual(self.getRelatedTagCounts(), self.getAggregatedTagCounts())
+
+    def test_limitReturnsMostUsedTags(self):
+        allCounts = self.getAggregatedTagCounts()
+        topCounts = self.getRelatedTagCounts(limit=2)
+        self.assertEqual(len(topCounts), 2)
+        minTopCount = min(topCounts.values())
+        for name, c in allCounts.items():
+            if name not in topCounts:
+                self.assertTrue(c <= minTopCount)
+
+    def test_countsAfterUpdateItemTags(self):
+        item = self.getExistingItem(context.itemWithTagsAndFields.id)
+        self.assertTrue(item.removeTag("RHCP"))
+        item.addTag("TagNameToAdd", context.itemWithTagsAndFields.ownerUserLogin)
+        self.updateExistingItem(item, os.path.join(self.repo.base_path, item.data_ref.url),
+                                item.data_ref.url, item.user_login)
+
+        counts = self.getRelatedTagCounts()
+        self.assertEqual(counts, self.getAggregatedTagCounts())
+        self.assertEqual(counts["TagNameToAdd"], 1)
+
+    def test_countsAfterDeleteItem(self):
+        try:
+            uow = self.repo.createUnitOfWork()
+            uow.executeCommand(cmds.DeleteItemCommand(context.itemWithTagsAndFields.id,
+                                                      context.itemWithTagsAndFields.ownerUserLogin))
+        finally:
+            uow.close()
+        self.assertEqual(self.getRelatedTagCounts(), self.getAggregatedTagCounts())
+
+
+class ItemRowsTest(AbstractTestCaseWithRepoAndSingleUOW):
+
+    def test_getItemRows(self):
+        itemIds = [context.itemWithoutFile.id, context.itemWithTagsAndFields.id,
+                   context.nonExistingItem.id]
+        itemRows = self.uow.executeCommand(cmds.GetItemRowsCommand(itemIds))
+        self.assertEqual([itemRow.id for itemRow in itemRows], itemIds[0:2])
+
+        itemRow = itemRows[1]
+        self.assertEqual(itemRow.title, context.itemWithTagsAndFields.title)
+        self.assertEqual(itemRow.data_ref.url, context.itemWithTagsAndFields.relFilePath)
+        self.assertEqual(sorted(name for name, _userLogin in itemRow.tags),
+                         sorted(context.itemWithTagsAndFields.tags))
+        for name, value in context.itemWithTagsAndFields.fields.items():
+            self.assertEqual(itemRow.getFieldValue(name), str(value))
+
+        itemRow = itemRows[0]
+        self.assertFalse(itemRow.hasDataRef())
+        self.assertTrue(itemRow.hasTag("Tag"))
+
+    def test_thumbnailsAreFetchedSeparately(self):
+        itemRows = self.uow.executeCommand(cmds.GetItemRowsCommand([context.itemWithFile.id]))
+        self.assertEqual(itemRows[0].data_ref.thumbnails, [])
+
+        dataRefId = itemRows[0].data_ref.id
+        thumbnailSize = int(UserConfig().get("thumbnail_size", consts.THUMBNAIL_DEFAULT_SIZE))
+        for size in [thumbnailSize, thumbnailSize + 1]:
+            self.uow.session.execute(
+                "insert into thumbnails (data_ref_id, size) values ({}, {})".format(dataRefId, size))
+        self.uow.session.commit()
+
+        itemRows = self.uow.executeCommand(cmds.GetItemRowsCommand(
+            [context.itemWithFile.id, context.itemWithoutFile.id]))
+        thumbnails = itemRows[0].data_ref.thumbnails
+        self.assertEqual([(t.data_ref_id, t.size) for t in thumbnails], [(dataRefId, thumbnailSize)])
+        self.assertIsNone(thumbnails[0].data)
+
+    def test_getFileInfo(self):
+        finfo = self.uow.executeCommand(
+            cmds.GetFileInfoCommand(context.itemNo1WithSharedFile.relFilePath))
+        self.assertEqual(sorted(finfo.itemIds),
+                         [context.itemNo1WithSharedFile.id, context.itemNo2WithSharedFile.id])
+
+    def test_getItemIdsWithFilesFrom(self):
+        itemIds = self.uow.executeCommand(cmds.GetItemIdsWithFilesFrom("lyrics/RHCP"))
+        self.assertTrue(context.itemWithTagsAndFields.id in itemIds)
+
+    def test_countUntaggedItems(self):
+        itemRows = self.uow.executeCommand(cmds.GetUntaggedItems())
+        self.assertEqual(self.uow.executeCommand(cmds.CountUntaggedItems()), len(itemRows))
+
+
+class NameCacheTest(AbstractTestCaseWithRepo):
+
+    def getNamesFromDb(self):
+        try:
+            uow = self.repo.createUnitOfWork()
+            rows = uow.session.execute('''
+                select name from tags UNION select name from fields''').fetchall()
+        finally:
+            uow.close()
+        return sorted(row[0] for row in rows)
+
+    def test_namesOfAllTagsAndFields(self):
+        try:
+            uow = self.repo.createUnitOfWork()
+            names = uow.executeCommand(cmds.GetNamesOfAllTagsAndFields())
+        finally:
+            uow.close()
+        self.assertEqual(names, self.getNamesFromDb())
+
+    def test_newTagIsCachedAfterCommit(self):
+        item = db.Item("user", "Item with a new tag")
+        item.addTag("BrandNewTag", "user")
+        try:
+            uow = self.repo.createUnitOfWork()
+            itemId = uow.executeCommand(cmds.SaveNewItemCommand(item))
+            tagId = uow.session.execute(
+                "select id from tags where name = 'BrandNewTag'").scalar()
+        finally:
+            uow.close()
+        self.assertEqual(self.repo.tagNames.idOf(self.repo.ReadSession(), "BrandNewTag"), tagId)
+        self.assertTrue("BrandNewTag" in self.repo.tagNames.names())
+        self.assertTrue(self.getExistingItem(itemId).hasTag("BrandNewTag"))
+
+    def test_rolledBackTagIsNotCached(self):
+        try:
+            uow = self.repo.createUnitOfWork()
+            tagId = self.repo.tagNames.getOrCreateId(uow.session, "RolledBackTag")
+            self.assertIsNotNone(tagId)
+            uow.session.rollback()
+        finally:
+            uow.close()
+        self.assertFalse("RolledBackTag" in self.repo.tagNames.names())
+        self.assertIsNone(self.repo.tagNames.idOf(self.repo.ReadSession(), "RolledBackTag"))
+
+    def test_readSessionLookupIsCachedAtOnce(self):
+        self.assertTrue(len(self.repo.tagNames.names()) > 0)
+        try:
+            uow = self.repo.createUnitOfWork()
+            # Committed by "another process", so the cache doesn't know about it
+            uow.session.execute("insert into tags (name) values ('TagOfAnotherProcess')")
+            uow.session.commit()
+            self.assertFalse("TagOfAnotherProcess" in self.repo.tagNames.names())
+
+            readSession = uow.readSession
+            tagId = self.repo.tagNames.idOf(readSession, "TagOfAnotherProcess")
+            self.assertIsNotNone(tagId)
+            self.assertTrue("TagOfAnotherProcess" in self.repo.tagNames.names())
+            self.assertEqual(self.repo.tagNames.nameOf(readSession, tagId), "TagOfAnotherProcess")
+        finally:
+            uow.close()
+
+    def test_hangingTagsAreRemovedFromCache(self):
+        self.assertTrue(len(self.repo.tagNames.names()) > 0)
+        try:
+            uow = self.repo.createUnitOfWork()
+            uow.session.execute("insert into tags (name) values ('HangingTag')")
+            uow.session.commit()
+            self.assertIsNotNone(self.repo.tagNames.idOf(uow.session, "HangingTag"))
+            uow.session.commit()
+            self.assertTrue("HangingTag" in self.repo.tagNames.names())
+            self.assertTrue(uow.executeCommand(cmds.DeleteHangingTagsCommand()) > 0)
+        finally:
+            uow.close()
+        self.assertFalse("HangingTag" in self.repo.tagNames.names())
+        self.assertEqual(sorted(self.repo.tagNames.names() + self.repo.fieldNames.names()),
+                         sorted(self.getNamesFromDb()))
+
+
+class DirectoriesTest(AbstractTestCaseWithRepo):
+
+    def executeCommand(self, cmd):
+        try:
+            uow = self.repo.createUnitOfWork()
+            return uow.executeCommand(cmd)
+        finally:
+            uow.close()
+
+    def test_directoryItemCounts(self):
+        self.assertEqual(self.executeCommand(cmds.GetDirectoryItemCountsCommand("")),
+                         {"history": 3, "led_zeppelin": 1, "lyrics": 5, "this": 1})
+        self.assertEqual(self.executeCommand(cmds.GetDirectoryItemCountsCommand("lyrics")),
+                         {"RHCP": 3, "led_zeppelin": 1})
+
+    def test_getItemIdsWithFilesFrom(self):
+        itemIds = self.executeCommand(cmds.GetItemIdsWithFilesFrom(os.path.join("lyrics", "RHCP")))
+        self.assertEqual(sorted(itemIds), [5, 14, 15])
+
+    def test_newFileCreatesDirectories(self):
+        item = db.Item("user", "Item's title")
+        srcAbsPath = os.path.abspath(os.path.join(self.repo.base_path, "..", "tmp", "file.txt"))
+        dstRelPath = os.path.join("lyrics", "new_dir", "newFile.txt")
+        itemId = self.executeCommand(cmds.SaveNewItemCommand(item, srcAbsPath, dstRelPath))
+
+        self.assertEqual(self.executeCommand(cmds.GetDirectoryItemCountsCommand("lyrics")),
+                         {"RHCP": 3, "led_zeppelin": 1, "new_dir": 1})
+        self.assertEqual(self.executeCommand(cmds.GetItemIdsWithFilesFrom("lyrics/new_dir")),
+                         [itemId])
+
+    def test_renameDirectoryMovesSubtree(self):
+        dirAbsPath = os.path.join(self.repo.base_path, "lyrics", "RHCP")
+        self.executeCommand(cmds.RenameDirectoryCommand(dirAbsPath, "RedHotChiliPeppers"))
+
+        self.assertEqual(self.executeCommand(cmds.GetDirectoryItemCountsCommand("lyrics")),
+                         {"RedHotChiliPeppers": 3, "led_zeppelin": 1})
+        self.assertEqual(self.executeCommand(cmds.GetDirectoryItemCountsCommand(
+                         os.path.join("lyrics", "RedHotChiliPeppers"))), {"Stadium Arcadium": 1})
+        self.assertEqual(self.executeCommand(cmds.GetItemIdsWithFilesFrom(
+                         os.path.join("lyrics", "RHCP"))), [])
+        self.assertEqual(self.getExistingItem(15).data_ref.url,
+                         os.path.join("lyrics", "RedHotChiliPeppers", "Stadium Arcadium",
+                                      "rhcp_show_hey_oh_lyrics.txt"))
+
+
+class QueryResultCacheTest(AbstractTestCaseWithRepo):
+
+    def executeCommand(self, cmd):
+        try:
+            uow = self.repo.createUnitOfWork()
+            return uow.executeCommand(cmd)
+        finally:
+            uow.close()
+
+    def test_repeatedQueryIsCached(self):
+        queryTree = query_parser.parse("Lyrics")
+        items1 = self.executeCommand(cmds.QueryItemsByParseTree(queryTree))
+        hits = self.repo.queryResults.hits
+        items2 = self.executeCommand(cmds.QueryItemsByParseTree(queryTree))
+        self.assertEqual(self.repo.queryResults.hits, hits + 1)
+        self.assertEqual([item.id for item in items1], [item.id for item in items2])
+        self.assertFalse(items1[0] is items2[0])
+
+    def test_commitInvalidatesResults(self):
+        queryTree = query_parser.parse("Lyrics")
+        count = self.executeCommand(cmds.CountItemsByParseTree(queryTree))
+        generation = self.repo.generation
+
+        item = db.Item("user", "New lyrics")
+        item.addTag("Lyrics", "user")
+        self.executeCommand(cmds.SaveNewItemCommand(item))
+
+        self.assertTrue(self.repo.generation > generation)
+        self.assertEqual(self.executeCommand(cmds.CountItemsByParseTree(queryTree)), count + 1)
+        items = self.executeCommand(cmds.QueryItemsByParseTree(queryTree))
+        self.assertTrue("New lyrics" in [item.title for item in items])
+
+
+    def test_savedThumbnailKeepsResults(self):
+        queryTree = query_parser.parse("ALL")
+        items = self.executeCommand(cmds.QueryItemsByParseTree(queryTree))
+        item = [item for item in items if item.id == context.itemWithFile.id][0]
+        self.assertEqual(item.data_ref.thumbnails, [])
+
+        thumbnail = db.Thumbnail()
+        thumbnail.size = int(UserConfig().get("thumbnail_size", consts.THUMBNAIL_DEFAULT_SIZE))
+        thumbnail.data = b"JPEG data"
+        generation = self.repo.generation
+        self.executeCommand(cmds.SaveThumbnailCommand(item.data_ref.id, thumbnail))
+        self.assertEqual(self.repo.generation, generation)
+
+        hits = self.repo.queryResults.hits
+        items = self.executeCommand(cmds.QueryItemsByParseTree(queryTree))
+        self.assertEqual(self.repo.queryResults.hits, hits + 1)
+        item = [item for item in items if item.id == context.itemWithFile.id][0]
+        self.assertEqual([t.size for t in item.data_ref.thumbnails], [thumbnail.size])
+
+
+class _SlowQueryCommand(cmds.AbstractCommand):
+    # Counts up to a huge number, it takes minutes if it is not cancelled
+    def _execute(self, uow):
+        return uow.readSession.execute('''
+            with recursive cnt(x) as (select 1 union all select x + 1 from cnt where x < 1000000000000)
+            select count(*) from cnt''').scalar()
+
+
+class CancelCommandTest(AbstractTestCaseWithRepo):
+
+    def test_cancelRunningCommand(self):
+        token = cancellation.CancelToken()
+        timer = threading.Timer(0.2, token.cancel)
+        timer.start()
+        uow = self.repo.createUnitOfWork()
+        try:
+            start = time.time()
+            self.assertRaises(err.QueryCancelledError, uow.executeCommand, _SlowQueryCommand(), token)
+            self.assertTrue(time.time() - start < 10)
+
+            # Unit of work is still usable after cancellation
+            items = uow.executeCommand(cmds.GetItemRowsCommand([context.itemWithFile.id]))
+            self.assertEqual(len(items), 1)
+        finally:
+            timer.cancel()
+            uow.close()
+
+    def test_commandTimeout(self):
+        uow = self.repo.createUnitOfWork()
+        try:
+            start = time.time()
+            try:
+                uow.executeCommand(_SlowQueryCommand(), timeoutSec=0.2)
+                self.fail("QueryCancelledError was not raised")
+            except err.QueryCancelledError as ex:
+                self.assertTrue(ex.timedOut)
+            self.assertTrue(time.time() - start < 10)
+        finally:
+            uow.close()
+
+    def test_cancelBeforeTimeout(self):
+        token = cancellation.CancelToken()
+        timer = threading.Timer(0.2, token.cancel)
+        timer.start()
+        uow = self.repo.createUnitOfWork()
+        try:
+            try:
+                uow.executeCommand(_SlowQueryCommand(), token, timeoutSec=600)
+                self.fail("QueryCancelledError was not raised")
+            except err.QueryCancelledError as ex:
+                self.assertFalse(ex.timedOut)
+        finally:
+            timer.cancel()
+            uow.close()
+
+    def test_readOnlyCommandsHaveTimeout(self):
+        self.assertTrue(cmds.GetRelatedTagsCommand.readOnly)
+        self.assertTrue(cmds.QueryItemsByParseTree.readOnly)
+        self.assertFalse(cmds.SaveNewItemCommand.readOnly)
+
+        uow = self.repo.createUnitOfWork()
+        try:
+            cmd = cmds.GetRelatedTagsCommand(["Lyrics", "Beatles"])
+            self.assertRaises(err.QueryCancelledError, uow.executeCommand, cmd, None, 1e-6)
+            # Zero timeout means no limit
+            self.assertTrue(len(uow.executeCommand(cmd, None, 0)) > 0)
+        finally:
+            uow.close()
+
+    def test_cancelledTokenIsNotExecuted(self):
+        token = cancellation.CancelToken()
+        token.cancel()
+        uow = self.repo.createUnitOfWork()
+        try:
+            self.assertRaises(err.QueryCancelledError, uow.executeCommand,
+                              cmds.GetItemRowsCommand([context.itemWithFile.id]), token)
+        finally:
+            uow.close()
@@ -0,0 +1,55 @@
+import os
+import sys
+import shutil
+import unittest
+import reggata.tests.tests_context as context
+import reggata.startup_profiler as startup_profiler
+
+
+class StartupProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.modulesPath = os.path.join(os.path.dirname(context.TEST_REPO_BASE_PATH),
+                                        "startup_profiler_modules")
+        if os.path.exists(self.modulesPath):
+            shutil.rmtree(self.modulesPath)
+        os.mkdir(self.modulesPath)
+        with open(os.path.join(self.modulesPath, "sp_outer_module.py"), "w") as f:
+            f.write("import sp_inner_module\nVALUE = sp_inner_module.VALUE + 1\n")
+        with open(os.path.join(self.modulesPath, "sp_inner_module.py"), "w") as f:
+            f.write("VALUE = 41\n")
+        sys.path.insert(0, self.modulesPath)
+
+    def tearDown(self):
+        sys.path.remove(self.modulesPath)
+        sys.modules.pop("sp_outer_module", None)
+        sys.modules.pop("sp_inner_module", None)
+        shutil.rmtree(self.modulesPath)
+
+    def test_importsAndStagesAreTimed(self):
+        profiler = startup_profiler.create(True)
+        profiler.install()
+        try:
+            with profiler.stage("Import outer module"):
+                import sp_outer_module
+        finally:
+            profiler.uninstall()
+
+        self.assertEqual(sp_outer_module.VALUE, 42)
+        report = profiler.report()
+        self.assertTrue("Import outer module" in report)
+        self.assertTrue("sp_outer_module" in report)
+        self.assertTrue("sp_inner_module" in report)
+
+        selfTime, cumulative = profiler._imports["sp_outer_module"]
+        _innerSelfTime, innerCumulative = profiler._imports["sp_inner_module"]
+        self.assertTrue(cumulative >= selfTime + innerCumulative - 1e-6)
+
+    def test_disabledProfiler(self):
+        profiler = startup_profiler.create(False)
+        profiler.install()
+        with profiler.stage("Import outer module"):
+            import sp_outer_module
+        profiler.uninstall()
+        self.assertEqual(sp_outer_module.VALUE, 42)
+        self.assertEqual(profiler.report(), "")
@@ -0,0 +1,46 @@
+import unittest
+from reggata.data.storage_profile import StorageProfile
+from reggata.data.commands import GetExpungedItemCommand
+from reggata.tests.abstract_test_cases import AbstractTestCaseWithRepo
+from reggata.tests.tests_context import itemWithFile
+
+
+class StorageProfileTest(unittest.TestCase):
+
+    def test_defaultProfileIsValid(self):
+        profile = StorageProfile()
+        self.assertEqual(profile.journalMode, "WAL")
+        self.assertEqual(profile.synchronous, "NORMAL")
+
+    def test_unsupportedValuesAreRejected(self):
+        self.assertRaises(ValueError, StorageProfile, journalMode="NO_SUCH_MODE")
+        self.assertRaises(ValueError, StorageProfile, synchronous="NO_SUCH_MODE")
+        self.assertRaises(ValueError, StorageProfile, tempStore="NO_SUCH_STORE")
+        self.assertRaises(ValueError, StorageProfile, readPoolSize=0)
+
+
+class ReaderWriterSessionsTest(AbstractTestCaseWithRepo):
+
+    def test_writerUsesWalJournal(self):
+        uow = self.repo.createUnitOfWork()
+        try:
+            journalMode = uow.session.execute("PRAGMA journal_mode").scalar()
+            self.assertEqual(journalMode.upper(), "WAL")
+        finally:
+            uow.close()
+
+    def test_readSessionIsReadOnly(self):
+        uow = self.repo.createUnitOfWork()
+        try:
+            self.assertIsNot(uow.readSession, uow.session)
+            self.assertEqual(uow.readSession.execute("PRAGMA query_only").scalar(), 1)
+        finally:
+            uow.close()
+
+    def test_readCommandUsesReadSession(self):
+        uow = self.repo.createUnitOfWork()
+        try:
+            item = uow.executeCommand(GetExpungedItemCommand(itemWithFile.id))
+            self.assertEqual(item.title, itemWithFile.title)
+        finally:
+            uow.close()
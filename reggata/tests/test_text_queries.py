@@ -1,6 +1,9 @@
+import unittest
+import threading
 from reggata.tests.abstract_test_cases import AbstractTestCaseWithRepo
-from reggata.data.commands import QueryItemsByParseTree
-from reggata.parsers.query_parser import parser
+from reggata.data.commands import QueryItemsByParseTree, CountItemsByParseTree, \
+    ProfileQueryCommand
+from reggata.parsers import query_parser, query_tree_nodes
 
 
 # NOTE: This list contains tuples (query, expectedItemIds)
@@ -13,6 +16,13 @@ testsData = [
     ("Tabs AND Error AND RHCP", [9]),
     
     ("Lyrics AND NOT RHCP", [4, 10]),
+    ("NOT Lyrics", [1, 2, 6, 7, 8, 9, 11, 12, 13]),
+    ("Lyrics AND Lyrics", [3, 4, 5, 10, 14, 15]),
+    ("NoSuchTag", []),
+    ("Lyrics AND NoSuchTag", []),
+    ("Lyrics AND NOT NoSuchTag", [3, 4, 5, 10, 14, 15]),
+    ('''Lyrics user:"user"''', [3, 4, 5, 10, 14, 15]),
+    ('''Lyrics user:"nobody"''', []),
     
     ("Rating > 2", [5, 13, 14, 15]),
     ("(Txt AND Lyrics) AND (Rating > 0)", [14, 15]),
@@ -23,6 +33,20 @@ testsData = [
     ("all", [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]),
     ("aLL", []),
     ('''"ALL"''', []),
+
+    ("title:lyrics", [3, 4, 14, 15]),
+    ("Lyrics title:rhcp", [14, 15]),
+    ("Rating > 2 title:lyrics", [14, 15]),
+    ("Notes~%file%", [6, 9, 10]),
+    ("Notes~%to%", [6, 9, 10]), # Pattern is shorter than a trigram
+    ("Albom~%way", [14]),
+    ("path:lyrics/RHCP", [5, 14, 15]),
+    ("Lyrics path:lyrics/RHCP/Stadium", [15]),
+    ("path:LYRICS/rhcp", [5, 14, 15]), # Case of letters is ignored, as in LIKE
+    ('path:"lyrics/RHCP/\U0010ffff"', []), # The last possible character
+    ("path:lyrics_RHCP", []), # _ is not a wildcard
+    ('''"Don't stop"''', []), # Quotes are bound as parameter values
+    ('''Notes~"%'%"''', [6]),
     
     # TODO: Add more test cases here...
 ]
@@ -33,7 +57,7 @@ def create_test_func(query, expectedItemIds):
     def _test_func(self):
         try:
             uow = self.repo.createUnitOfWork()
-            queryTree = parser.parse(query)
+            queryTree = query_parser.parse(query)
             cmd = QueryItemsByParseTree(queryTree)
             items = uow.executeCommand(cmd)
             actualItemIds = [item.id for item in items]
@@ -46,6 +70,36 @@ def create_test_func(query, expectedItemIds):
     return _test_func
 
 
+def create_unresolved_test_func(query, expectedItemIds):
+    # SQL of a query without tag ids resolved up front should give the same result
+
+    def _test_func(self):
+        try:
+            uow = self.repo.createUnitOfWork()
+            sql, params = query_parser.parse(query).interpret()
+            actualItemIds = sorted(set(row[0] for row in uow.readSession.execute(
+                "select s0.id from (" + sql + ") as s0 where s0.alive", params)))
+            self.assertEqual(actualItemIds, sorted(expectedItemIds), "Query: {}".format(query))
+        finally:
+            uow.close()
+
+    return _test_func
+
+
+def create_count_test_func(query, expectedItemIds):
+
+    def _test_func(self):
+        try:
+            uow = self.repo.createUnitOfWork()
+            queryTree = query_parser.parse(query)
+            count = uow.executeCommand(CountItemsByParseTree(queryTree))
+            self.assertEqual(count, len(expectedItemIds), "Query: {}".format(query))
+        finally:
+            uow.close()
+
+    return _test_func
+
+
 class QueriesTests(AbstractTestCaseWithRepo):
     # NOTE: Test functions will be added to this class dynamically
     pass
@@ -54,8 +108,235 @@ class QueriesTests(AbstractTestCaseWithRepo):
 # This for cycle dynamically adds test functions to test case class QueriesTests
 for i, (query, expectedItemIds) in enumerate(testsData):
     setattr(QueriesTests, 'test_{}'.format(i), create_test_func(query, expectedItemIds))
+    setattr(QueriesTests, 'test_count_{}'.format(i), create_count_test_func(query, expectedItemIds))
+    setattr(QueriesTests, 'test_unresolved_{}'.format(i), create_unresolved_test_func(query, expectedItemIds))
+
+
+
+
+    
+
+class OrderedQueriesTests(AbstractTestCaseWithRepo):
+
+    def test_orderByRating(self):
+        uow = self.repo.createUnitOfWork()
+        try:
+            cmd = QueryItemsByParseTree(query_parser.parse("Rating > 2"),
+                                        order_by=[("field:Rating", "DESC"), ("id", "ASC")])
+            items = uow.executeCommand(cmd)
+            ratings = [int(item.getFieldValue("Rating")) for item in items]
+            self.assertEqual(len(ratings), 4)
+            self.assertEqual(ratings, sorted(ratings, reverse=True))
+        finally:
+            uow.close()
+
+    def test_orderByRatingWithLimit(self):
+        uow = self.repo.createUnitOfWork()
+        try:
+            allItems = uow.executeCommand(QueryItemsByParseTree(
+                query_parser.parse("Rating > 0"), order_by=[("field:Rating", "DESC"), ("id", "ASC")]))
+            firstPage = uow.executeCommand(QueryItemsByParseTree(
+                query_parser.parse("Rating > 0"), limit=2, page=1,
+                order_by=[("field:Rating", "DESC"), ("id", "ASC")]))
+            self.assertEqual([item.getFieldValue("Rating") for item in firstPage],
+                             [item.getFieldValue("Rating") for item in allItems[:2]])
+        finally:
+            uow.close()
+
+    def checkKeysetPages(self, query, orderBy, limit):
+        uow = self.repo.createUnitOfWork()
+        try:
+            allItemIds = [item.id for item in uow.executeCommand(QueryItemsByParseTree(
+                query_parser.parse(query), order_by=orderBy))]
+            pagedItemIds = []
+            after = None
+            while True:
+                cmd = QueryItemsByParseTree(query_parser.parse(query), limit=limit, order_by=orderBy,
+                                            after=after)
+                items = uow.executeCommand(cmd)
+                self.assertTrue(len(items) <= limit)
+                pagedItemIds.extend(item.id for item in items)
+                if len(items) < limit:
+                    break
+                after = cmd.nextPageAfter
+            self.assertTrue(len(allItemIds) > limit)
+            self.assertEqual(pagedItemIds, allItemIds)
+        finally:
+            uow.close()
 
+    def test_keysetPagesByTitle(self):
+        self.checkKeysetPages("ALL", [("title", "ASC")], 3)
 
+    def test_keysetPagesByRating(self):
+        self.checkKeysetPages("ALL", [("field:Rating", "DESC")], 4)
 
+    def test_keysetPagesByIdDesc(self):
+        self.checkKeysetPages("Lyrics", [("id", "DESC")], 2)
 
-    
\ No newline at end of file
+    def test_keysetPagesMixedDirections(self):
+        self.checkKeysetPages("ALL", [("field:Rating", "DESC"), ("title", "ASC")], 2)
+
+    def applyTagByOtherUser(self, tagName, userLogin="newUSer"):
+        # The same tag is applied to the same items by the second user, so there are
+        # two rows in items_tags for every such item
+        uow = self.repo.createUnitOfWork()
+        try:
+            uow.session.execute('''
+                insert into items_tags (item_id, tag_id, user_login)
+                select it.item_id, it.tag_id, :user_login from items_tags it
+                join tags t on t.id = it.tag_id
+                where t.name = :tag_name''', {"user_login": userLogin, "tag_name": tagName})
+            uow.session.commit()
+        finally:
+            uow.close()
+
+    def test_tagOfTwoUsers(self):
+        self.applyTagByOtherUser("RHCP")
+        uow = self.repo.createUnitOfWork()
+        try:
+            allItems = uow.executeCommand(QueryItemsByParseTree(query_parser.parse("RHCP")))
+            self.assertEqual(sorted(item.id for item in allItems), [1, 2, 3, 5, 9, 14, 15])
+            firstPage = uow.executeCommand(QueryItemsByParseTree(
+                query_parser.parse("RHCP"), limit=4, page=1, order_by=[("title", "ASC")]))
+            self.assertEqual(len(firstPage), 4)
+            self.assertEqual(len(set(item.id for item in firstPage)), 4)
+            self.assertEqual(uow.executeCommand(CountItemsByParseTree(
+                query_parser.parse("RHCP"))), 7)
+            items = uow.executeCommand(QueryItemsByParseTree(query_parser.parse("RHCP Lyrics")))
+            self.assertEqual(sorted(item.id for item in items), [3, 5, 14, 15])
+        finally:
+            uow.close()
+
+    def test_keysetPagesOfTagOfTwoUsers(self):
+        self.applyTagByOtherUser("RHCP")
+        self.checkKeysetPages("RHCP", [("title", "ASC")], 2)
+        self.checkKeysetPages("RHCP", [("field:Rating", "DESC")], 3)
+
+    def checkSortRows(self, query, orderBy):
+        uow = self.repo.createUnitOfWork()
+        try:
+            items = uow.executeCommand(QueryItemsByParseTree(query_parser.parse(query)))
+            orderedItemIds = [item.id for item in uow.executeCommand(QueryItemsByParseTree(
+                query_parser.parse(query), order_by=orderBy))]
+            for unordered in [items, list(reversed(items))]:
+                sortedItemIds = [item.id for item in QueryItemsByParseTree.sortRows(unordered, orderBy)]
+                self.assertEqual(sortedItemIds, orderedItemIds)
+        finally:
+            uow.close()
+
+    def test_sortRowsById(self):
+        self.checkSortRows("ALL", [("id", "DESC")])
+
+    def test_sortRowsByTitle(self):
+        self.checkSortRows("ALL", [("title", "ASC")])
+        self.checkSortRows("ALL", [("title", "DESC")])
+
+    def test_sortRowsByRating(self):
+        self.checkSortRows("ALL", [("field:Rating", "ASC")])
+        self.checkSortRows("ALL", [("field:Rating", "DESC")])
+
+    def test_sortRowsMixedDirections(self):
+        self.checkSortRows("ALL", [("field:Rating", "DESC"), ("title", "ASC")])
+
+    def checkBatches(self, createCommand, batchSize):
+        # Items Table fetches results, that are not split into pages, in batches
+        # like this (see ItemsTableModel.fetchMore())
+        uow = self.repo.createUnitOfWork()
+        try:
+            allItemIds = sorted(item.id for item in uow.executeCommand(createCommand(0, None)))
+            fetchedItemIds = []
+            after = None
+            while True:
+                cmd = createCommand(batchSize, after)
+                items = uow.executeCommand(cmd)
+                fetchedItemIds.extend(item.id for item in items)
+                if len(items) < batchSize:
+                    break
+                after = cmd.nextPageAfter
+            self.assertTrue(len(allItemIds) > batchSize)
+            self.assertEqual(fetchedItemIds, allItemIds)
+        finally:
+            uow.close()
+
+    def test_batchesWithoutOrder(self):
+        self.checkBatches(lambda limit, after: QueryItemsByParseTree(
+            query_parser.parse("ALL"), limit=limit, after=after), 3)
+
+
+class InterpretTests(unittest.TestCase):
+
+    def test_valuesAreBoundAsParams(self):
+        sql1, params1 = query_parser.parse("Lyrics title:rhcp").interpret()
+        sql2, params2 = query_parser.parse("Books title:tolstoy").interpret()
+        self.assertEqual(sql1, sql2)
+        self.assertTrue("Lyrics" in params1.values())
+        self.assertTrue("Books" in params2.values())
+        self.assertFalse("Lyrics" in sql1)
+
+        sql1, params1 = query_parser.parse("(Txt AND Lyrics) AND (Rating > 2)").interpret()
+        sql2, params2 = query_parser.parse("(Pdf AND Books) AND (Rating > 4)").interpret()
+        self.assertEqual(sql1, sql2)
+        self.assertNotEqual(params1, params2)
+
+        orderBy1 = [("field:Rating", "DESC")]
+        orderBy2 = [("field:Year", "DESC")]
+        self.assertEqual(QueryItemsByParseTree._itemsSql("select 1", orderBy1, ""),
+                         QueryItemsByParseTree._itemsSql("select 1", orderBy2, ""))
+        self.assertFalse("Rating" in QueryItemsByParseTree._itemsSql("select 1", orderBy1, ""))
+        self.assertEqual(QueryItemsByParseTree._orderParams(orderBy1), {"order_field_0": "Rating"})
+
+    def test_parsedQueriesAreCached(self):
+        hits = query_parser.parseCache.hits
+        tree1 = query_parser.parse("Lyrics AND NOT RHCP title:stadium")
+        tree2 = query_parser.parse("  Lyrics AND NOT RHCP title:stadium ")
+        self.assertTrue(tree1 is tree2)
+        self.assertEqual(query_parser.parseCache.hits, hits + 1)
+
+        hits = query_tree_nodes.sqlCache.hits
+        self.assertEqual(tree1.interpret(), tree2.interpret())
+        self.assertEqual(query_tree_nodes.sqlCache.hits, hits + 1)
+
+    def test_parseFromManyThreads(self):
+        queries = ["Lyrics AND NOT RHCP", "Rating > 2", "title:stadium", "Books Pdf"]
+        expected = [query_parser.parse(q, useCache=False).interpret() for q in queries]
+        results = []
+        errors = []
+
+        def parseQueries():
+            try:
+                for _i in range(50):
+                    results.append([query_parser.parse(q, useCache=False).interpret()
+                                    for q in queries])
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=parseQueries) for _i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        for result in results:
+            self.assertEqual(result, expected)
+
+
+class ProfileQueryTests(AbstractTestCaseWithRepo):
+
+    def test_profileQuery(self):
+        uow = self.repo.createUnitOfWork()
+        try:
+            profile = uow.executeCommand(ProfileQueryCommand("Lyrics AND NOT RHCP", limit=10))
+            self.assertEqual(profile.itemCount, 2)
+            self.assertTrue("TagsConjunction" in profile.parseTree)
+            self.assertTrue(":page_limit" in profile.sql)
+            self.assertTrue(len(profile.queryPlan) > 0)
+            self.assertTrue(profile.parseTime > 0)
+            self.assertTrue(profile.thumbnailTime > 0)
+            self.assertTrue("thumbnails:" in profile.summary())
+            self.assertTrue("Query plan:" in profile.format())
+
+            sqlCacheSize = len(query_tree_nodes.sqlCache)
+            uow.executeCommand(ProfileQueryCommand("Lyrics AND NOT Beatles"))
+            self.assertEqual(len(query_tree_nodes.sqlCache), sqlCacheSize)
+        finally:
+            uow.close()
@@ -0,0 +1,48 @@
+import os
+import shutil
+import unittest
+import reggata.tests.tests_context as context
+from reggata.data.thumbnail_store import ThumbnailStore
+
+
+class ThumbnailStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repoBasePath = os.path.join(os.path.dirname(context.TEST_REPO_BASE_PATH), "thumbs_repo.rgt")
+        if os.path.exists(self.repoBasePath):
+            shutil.rmtree(self.repoBasePath)
+        os.mkdir(self.repoBasePath)
+        self.store = ThumbnailStore(self.repoBasePath)
+
+    def tearDown(self):
+        shutil.rmtree(self.repoBasePath)
+
+    def test_writeAndRead(self):
+        dataRefHash = "0123456789abcdef0123456789abcdef01234567"
+        self.assertFalse(self.store.contains(dataRefHash, 100))
+        self.assertIsNone(self.store.read(dataRefHash, 100))
+
+        path = self.store.write(dataRefHash, 100, b"JPEG data")
+        self.assertTrue(path.startswith(self.store.rootPath))
+        self.assertEqual(os.path.basename(os.path.dirname(path)), "01")
+        self.assertTrue(self.store.contains(dataRefHash, 100))
+        self.assertFalse(self.store.contains(dataRefHash, 200))
+        self.assertEqual(self.store.read(dataRefHash, 100), b"JPEG data")
+
+        self.store.write(dataRefHash, 100, b"Another JPEG data")
+        self.assertEqual(self.store.read(dataRefHash, 100), b"Another JPEG data")
+
+        self.store.remove(dataRefHash, 100)
+        self.assertFalse(self.store.contains(dataRefHash, 100))
+
+    def test_partialHashIsHashedAgain(self):
+        partialHash = "0..1024: 0123456789abcdef0123456789abcdef01234567"
+        key = ThumbnailStore.key(partialHash)
+        self.assertEqual(len(key), 40)
+        self.assertNotEqual(key, ThumbnailStore.key("0123456789abcdef0123456789abcdef01234567"))
+
+        self.store.write(partialHash, 100, b"JPEG data")
+        self.assertEqual(self.store.read(partialHash, 100), b"JPEG data")
+
+    def test_dataRefWithoutHash(self):
+        self.assertRaises(ValueError, self.store.contains, None, 100)
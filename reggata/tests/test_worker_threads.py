@@ -2,9 +2,12 @@
 Created on 25.01.2012
 @author: vvolkov
 '''
-from reggata.logic.worker_threads import DeleteGroupOfItemsThread
+import os
+from reggata.logic.worker_threads import DeleteGroupOfItemsThread, CreateGroupOfItemsThread
 from reggata.tests.abstract_test_cases import AbstractTestCaseWithRepo
+from reggata.tests.tests_context import itemWithFile
 from reggata.data.commands import GetExpungedItemCommand
+from reggata.data.db_schema import Item, DataRef
 
 class DeleteGroupOfItemsThreadTest(AbstractTestCaseWithRepo):
 
@@ -22,3 +25,31 @@ class DeleteGroupOfItemsThreadTest(AbstractTestCaseWithRepo):
             self.assertFalse(uow.executeCommand(GetExpungedItemCommand(3)).alive)
         finally:
             uow.close()
+
+
+class CreateGroupOfItemsThreadTest(AbstractTestCaseWithRepo):
+
+    def test_itemWithStoredFileIsSkipped(self):
+        itemWithStoredFile = Item("user", "Item with already stored file")
+        itemWithStoredFile.data_ref = DataRef(objType=DataRef.FILE)
+        itemWithStoredFile.data_ref.srcAbsPath = os.path.join(
+            self.repo.base_path, itemWithFile.relFilePath)
+        itemWithStoredFile.data_ref.dstRelPath = itemWithFile.relFilePath
+
+        thread = CreateGroupOfItemsThread(None, self.repo,
+                                          [Item("user", "New item"), itemWithStoredFile])
+        thread.run()
+
+        self.assertFalse(thread.isExceptionRaised())
+        self.assertEqual(thread.createdCount, 1)
+        self.assertEqual(thread.skippedCount, 1)
+
+    def test_unexpectedErrorIsReported(self):
+        thread = CreateGroupOfItemsThread(None, self.repo,
+                                          [Item("user", "New item"),
+                                           Item("NonExistentUserLogin", "Item of non existent user")])
+        thread.run()
+
+        self.assertTrue(thread.isExceptionRaised())
+        self.assertEqual(thread.createdCount, 1)
+        self.assertEqual(thread.skippedCount, 0)